@@ -0,0 +1,82 @@
+"""
+Speech-to-Text upload size and audio length before and after the audio stage.
+
+Builds sample WAV clips the way browsers record them (48 kHz stereo, 44.1 kHz
+mono, 16 kHz mono) with voiced syllables, pauses, long leading/trailing silence
+and a low noise floor, then runs prepare_audio on each. Recognition time and
+billing scale with the audio duration sent, so both bytes and seconds are
+reported, along with how much of the true speech survived trimming. Run from the
+backend directory:
+
+    python -m benchmarks.audio_preprocess_benchmark --repeat 20
+"""
+import argparse
+import io
+import time
+import wave
+import numpy as np
+from services.audio_preprocess import prepare_audio
+
+CLIPS = (
+    # (label, sample rate, channels, leading silence s, [speech s, pause s, ...], trailing silence s)
+    ("short query 48k stereo", 48000, 2, 1.5, [1.2, 0.3, 1.0], 2.0),
+    ("question 44.1k mono", 44100, 1, 0.8, [2.0, 0.6, 1.5, 1.2, 2.5], 1.5),
+    ("long note 16k mono", 16000, 1, 2.0, [6.0, 1.5, 8.0, 2.0, 9.0, 1.0, 12.0], 3.0),
+)
+
+def voiced(seconds: float, rate: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Harmonics of a drifting pitch, amplitude-modulated into ~4 syllables per second
+    """
+    t = np.arange(int(seconds * rate)) / rate
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.7 * t + rng.uniform(0, 6))
+    phase = 2 * np.pi * np.cumsum(pitch) / rate
+    signal = sum(np.sin(k * phase) / k for k in range(1, 6))
+    syllables = np.clip(np.sin(2 * np.pi * 4 * t), 0, None) ** 0.5
+    return (0.3 * signal * syllables).astype(np.float32)
+
+def sample_clip(rate: int, channels: int, lead: float, parts, trail: float, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    pieces, truth = [np.zeros(int(lead * rate), np.float32)], 0.0
+    for index, seconds in enumerate(parts):
+        if index % 2 == 0:
+            pieces.append(voiced(seconds, rate, rng))
+            truth += seconds
+        else:
+            pieces.append(np.zeros(int(seconds * rate), np.float32))
+    pieces.append(np.zeros(int(trail * rate), np.float32))
+    samples = np.concatenate(pieces)
+    samples += rng.normal(0, 10 ** (-55 / 20), len(samples)).astype(np.float32)
+
+    pcm = (np.clip(samples, -1, 1) * 32767).astype('<i2')
+    output = io.BytesIO()
+    with wave.open(output, 'wb') as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(np.repeat(pcm, channels).tobytes())
+    return output.getvalue(), len(samples) / rate, truth
+
+def main(repeat: int):
+    totals = [0, 0, 0.0, 0.0]
+    for label, rate, channels, lead, parts, trail in CLIPS:
+        data, duration, speech = sample_clip(rate, channels, lead, parts, trail)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            prepared = prepare_audio(data)
+        elapsed = (time.perf_counter() - start) / repeat
+        sent = sum(len(segment) for segment in prepared["segments"])
+        print(f"{label:24s} {len(data) / 1024:7.0f} KiB {duration:5.1f}s -> {sent / 1024:6.0f} KiB "
+              f"{prepared['speech_duration']:5.1f}s in {len(prepared['segments'])} chunk(s) "
+              f"[{prepared['encoding']}], speech {speech:.1f}s, {elapsed * 1000:5.1f} ms/clip")
+        totals = [totals[0] + len(data), totals[1] + sent, totals[2] + duration, totals[3] + prepared['speech_duration']]
+
+    print(f"{'total':24s} {totals[0] / 1024:7.0f} KiB {totals[2]:5.1f}s -> {totals[1] / 1024:6.0f} KiB {totals[3]:5.1f}s "
+          f"({totals[1] / totals[0]:.0%} of bytes, {totals[3] / totals[2]:.0%} of audio)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    main(args.repeat)
@@ -0,0 +1,120 @@
+"""
+Fan-out latency of pushed task and price changes to many connected clients.
+
+Every subscriber is a listener task on its own ChangeFeed subscription, as an
+SSE or WebSocket connection would be. Changes go in through LocalChangeSource,
+the in-process stand-in for a replica set change stream, and latency is measured
+from publish() to each recipient's listener receiving the event. Recipients are
+checked against a brute-force match of every subscription. Run from the backend
+directory:
+
+    python -m benchmarks.change_feed_benchmark --subscribers 10000
+"""
+import argparse
+import asyncio
+import random
+import time
+import numpy as np
+from services.change_feed import ChangeFeed, LocalChangeSource
+
+COMMODITIES = ["tomato", "onion", "potato", "wheat", "rice", "cotton", "soyabean", "maize"]
+STATES = ["maharashtra", "punjab", "karnataka", "uttar pradesh", "madhya pradesh"]
+
+class Arrivals:
+    def __init__(self):
+        self.times = []
+        self.expected = 0
+        self.done = asyncio.Event()
+
+    def reset(self, expected: int):
+        self.times = []
+        self.expected = expected
+        self.done.clear()
+        if expected == 0:
+            self.done.set()
+
+    def record(self):
+        self.times.append(time.perf_counter())
+        if len(self.times) >= self.expected:
+            self.done.set()
+
+async def listener(feed: ChangeFeed, subscription, arrivals: Arrivals):
+    async for event in feed.listen(subscription):
+        if event.name != "keepalive":
+            arrivals.record()
+
+def recipients(subscriptions, kind: str, document) -> int:
+    if kind == "task":
+        return sum(1 for subscription in subscriptions if subscription.user_id == document["user_id"])
+    return sum(1 for subscription in subscriptions
+               if document["commodity"] in subscription.commodities and subscription.state in (None, document["state"]))
+
+async def one_at_a_time(source: LocalChangeSource, subscriptions, arrivals: Arrivals, kind: str, documents):
+    latencies = []
+    last = []
+    fanout = []
+    for document in documents:
+        arrivals.reset(recipients(subscriptions, kind, document))
+        start = time.perf_counter()
+        source.publish("update", document)
+        await asyncio.wait_for(arrivals.done.wait(), 30)
+        latencies += [(arrived - start) * 1000 for arrived in arrivals.times]
+        if arrivals.times:
+            last.append((arrivals.times[-1] - start) * 1000)
+        fanout.append(arrivals.expected)
+    return np.array(latencies), np.array(last), np.array(fanout)
+
+async def main(subscriber_count: int, changes: int, poll_seconds: float, seed: int):
+    rng = random.Random(seed)
+    feed = ChangeFeed(heartbeat=3600)
+    task_source = LocalChangeSource()
+    price_source = LocalChangeSource()
+    arrivals = Arrivals()
+
+    subscriptions = []
+    for index in range(subscriber_count):
+        # A quarter of the clients follow their crops in every state
+        state = None if index % 4 == 0 else rng.choice(STATES)
+        subscriptions.append(feed.subscribe(f"farmer-{index}", rng.sample(COMMODITIES, 2), state))
+    listeners = [asyncio.create_task(listener(feed, subscription, arrivals)) for subscription in subscriptions]
+    followers = [asyncio.create_task(feed.follow(task_source, "task")),
+                 asyncio.create_task(feed.follow(price_source, "price"))]
+    await asyncio.sleep(0)
+
+    tasks = [{"id": f"task-{index}", "user_id": f"farmer-{rng.randrange(subscriber_count)}", "title": "Irrigate",
+              "completed": True} for index in range(changes)]
+    prices = [{"commodity": rng.choice(COMMODITIES), "state": rng.choice(STATES), "market": "APMC",
+               "modal_price": float(rng.randrange(800, 4000))} for _ in range(changes)]
+
+    print(f"{subscriber_count} subscribers, {changes} changes per kind")
+    for label, kind, source, documents in (("task", "task", task_source, tasks), ("price", "price", price_source, prices)):
+        latencies, last, fanout = await one_at_a_time(source, subscriptions, arrivals, kind, documents)
+        print(f"{label:6s} {fanout.mean():7.0f} recipients/change  delivery p50 {np.percentile(latencies, 50):7.2f} ms  "
+              f"p99 {np.percentile(latencies, 99):7.2f} ms  last recipient p50 {np.percentile(last, 50):7.2f} ms  "
+              f"max {last.max():7.2f} ms")
+
+    # Every price change at once, as after an ingestion run
+    arrivals.reset(sum(recipients(subscriptions, "price", document) for document in prices))
+    start = time.perf_counter()
+    for document in prices:
+        price_source.publish("update", document)
+    await asyncio.wait_for(arrivals.done.wait(), 60)
+    elapsed = time.perf_counter() - start
+    print(f"burst  {len(prices)} price changes, {arrivals.expected} deliveries in {elapsed * 1000:.0f} ms "
+          f"({arrivals.expected / elapsed:,.0f} deliveries/s)")
+    print(f"polling every {poll_seconds:.0f} s, the same clients would send {subscriber_count / poll_seconds:,.0f} requests/s")
+    print(f"stats {feed.get_stats()}")
+
+    for task in listeners + followers:
+        task.cancel()
+    await asyncio.gather(*listeners, *followers, return_exceptions=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--subscribers', type=int, default=10000)
+    parser.add_argument('--changes', type=int, default=200)
+    parser.add_argument('--poll-seconds', type=float, default=30)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    asyncio.run(main(args.subscribers, args.changes, args.poll_seconds, args.seed))
@@ -0,0 +1,60 @@
+"""
+Local crop-disease classifier latency and throughput on CPU, with and without micro-batching.
+
+Submits concurrent classifications of preprocessed-size (1024px) leaf photos
+through CropDiseaseClassifier on the image worker pool. Run from the backend
+directory:
+
+    python -m benchmarks.crop_classifier_benchmark --images 256 --concurrency 32
+"""
+import argparse
+import asyncio
+import io
+import os
+import time
+import numpy as np
+from PIL import Image
+from benchmarks.image_preprocess_benchmark import synthetic_photo
+from services.crop_classifier import CropDiseaseClassifier
+from services.image_preprocess import ImagePreprocessor, preprocess_image
+
+async def run(images, workers: int, batch_size: int, wait_ms: float, concurrency: int):
+    pool = ImagePreprocessor(workers=workers)
+    await pool.startup()
+    classifier = CropDiseaseClassifier(pool=pool, max_batch_size=batch_size, max_wait_ms=wait_ms)
+    await classifier.startup()
+
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(image: bytes):
+        async with semaphore:
+            start = time.perf_counter()
+            await classifier.classify(image)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(image) for image in images))
+    elapsed = time.perf_counter() - start
+    stats = classifier.get_stats()
+    await pool.shutdown()
+    return elapsed, np.array(latencies) * 1000, stats
+
+def main(total: int, concurrency: int, workers: int):
+    photos = [preprocess_image(synthetic_photo(3, seed)) for seed in range(8)]
+    images = (photos * (total // len(photos) + 1))[:total]
+    print(f"{total} images of {Image.open(io.BytesIO(photos[0])).size}, concurrency {concurrency}, workers {workers}")
+
+    for label, batch_size, wait_ms in (("unbatched", 1, 0.0), ("batched", 16, 10.0)):
+        elapsed, latencies, stats = asyncio.run(run(images, workers, batch_size, wait_ms, concurrency))
+        print(f"{label:10s} {total / elapsed:7.1f} images/s  p50 {np.percentile(latencies, 50):6.1f} ms  "
+              f"p99 {np.percentile(latencies, 99):6.1f} ms  mean batch {stats['mean_batch_size']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--images', type=int, default=256)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    main(args.images, args.concurrency, args.workers)
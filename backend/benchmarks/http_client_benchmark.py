@@ -0,0 +1,66 @@
+"""
+Concurrent chat throughput against a local stub Gemini upstream.
+
+Compares the pooled async client with the old blocking ``requests`` call
+made from inside the event loop. Every request asks a different question and
+the chat cache is off, so neither the cache nor request coalescing can answer
+it without an upstream call. Run from the backend directory:
+
+    python -m benchmarks.http_client_benchmark --requests 200 --delay 0.05
+"""
+import argparse
+import asyncio
+import os
+import time
+import requests
+from benchmarks.stub_upstream import StubUpstream
+
+GEMINI_REPLY = {
+    "candidates": [{"content": {"parts": [{"text": "Water the crop in the evening."}]}}]
+}
+
+async def run_pooled(url: str, total: int) -> float:
+    os.environ['GEMINI_API_KEY'] = 'bench'
+    os.environ['GEMINI_API_URL'] = url
+    os.environ['CHAT_CACHE_ENABLED'] = 'false'
+    from services.gemini_service import GeminiService
+    from services.http_client import http_pool
+
+    service = GeminiService()
+    await http_pool.startup()
+    start = time.perf_counter()
+    await asyncio.gather(*(service.get_chat_response(f"tomato leaves yellow, field {index}", "en") for index in range(total)))
+    elapsed = time.perf_counter() - start
+    await http_pool.shutdown()
+    return elapsed
+
+async def run_blocking(url: str, total: int) -> float:
+    async def call():
+        requests.post(f"{url}?key=bench", json={"contents": []}, timeout=30)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(call() for _ in range(total)))
+    return time.perf_counter() - start
+
+async def main(total: int, delay: float, blocking_total: int):
+    upstream = StubUpstream(GEMINI_REPLY, delay=delay)
+    upstream.start_in_thread()
+    try:
+        pooled = await run_pooled(upstream.url, total)
+        pooled_calls = upstream.request_count
+        blocking = await run_blocking(upstream.url, blocking_total)
+    finally:
+        upstream.stop_thread()
+
+    print(f"upstream delay: {delay * 1000:.0f} ms")
+    print(f"pooled async:   {total} requests in {pooled:.2f}s -> {total / pooled:.1f} req/s ({pooled_calls} upstream calls)")
+    print(f"blocking sync:  {blocking_total} requests in {blocking:.2f}s -> {blocking_total / blocking:.1f} req/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--blocking-requests', type=int, default=40)
+    parser.add_argument('--delay', type=float, default=0.05)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.delay, args.blocking_requests))
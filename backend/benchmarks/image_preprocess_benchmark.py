@@ -0,0 +1,68 @@
+"""
+Crop-photo preprocessing throughput (images/s and images/s per core) and size reduction.
+
+Uses synthetic phone-sized JPEGs: a green leaf on a soil-coloured background,
+stored rotated with an EXIF orientation tag. Run from the backend directory:
+
+    python -m benchmarks.image_preprocess_benchmark --images 32 --megapixels 12
+"""
+import argparse
+import asyncio
+import io
+import os
+import time
+import numpy as np
+from PIL import Image, ImageDraw
+from services.image_preprocess import ImagePreprocessor, preprocess_image
+
+def synthetic_photo(megapixels: float, seed: int) -> bytes:
+    rng = np.random.default_rng(seed)
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    soil = rng.normal((120, 90, 60), 18, size=(height // 8, width // 8, 3)).clip(0, 255).astype(np.uint8)
+    image = Image.fromarray(soil).resize((width, height), Image.Resampling.BILINEAR)
+    draw = ImageDraw.Draw(image)
+    cx, cy = width * rng.uniform(0.35, 0.65), height * rng.uniform(0.35, 0.65)
+    draw.ellipse((cx - width * 0.2, cy - height * 0.15, cx + width * 0.2, cy + height * 0.15), fill=(60, 150, 50))
+    for _ in range(20):
+        x, y = cx + rng.uniform(-0.15, 0.15) * width, cy + rng.uniform(-0.1, 0.1) * height
+        draw.ellipse((x - 20, y - 20, x + 20, y + 20), fill=(110, 80, 30))
+
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: rotate 90° CW to display
+    output = io.BytesIO()
+    image.rotate(90, expand=True).save(output, format="JPEG", quality=92, exif=exif)
+    return output.getvalue()
+
+async def run_pool(images, workers: int) -> float:
+    preprocessor = ImagePreprocessor(workers=workers)
+    await preprocessor.startup()
+    start = time.perf_counter()
+    await asyncio.gather(*(preprocessor.process(image) for image in images))
+    elapsed = time.perf_counter() - start
+    await preprocessor.shutdown()
+    return elapsed
+
+def main(total: int, megapixels: float, max_workers: int):
+    images = [synthetic_photo(megapixels, seed) for seed in range(min(total, 8))]
+    images = (images * (total // len(images) + 1))[:total]
+
+    sample = preprocess_image(images[0])
+    processed = Image.open(io.BytesIO(sample))
+    print(f"input:  {megapixels:.0f} MP JPEG, {len(images[0]) / 1024:.0f} KiB")
+    print(f"output: {processed.size[0]}x{processed.size[1]} JPEG, {len(sample) / 1024:.0f} KiB "
+          f"({len(images[0]) / len(sample):.1f}x smaller)")
+
+    for workers in sorted({1, max_workers}):
+        elapsed = asyncio.run(run_pool(images, workers))
+        rate = total / elapsed
+        print(f"workers={workers}: {rate:.1f} images/s, {rate / workers:.1f} images/s per core")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--images', type=int, default=32)
+    parser.add_argument('--megapixels', type=float, default=12)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    main(args.images, args.megapixels, args.workers)
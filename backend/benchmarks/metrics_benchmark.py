@@ -0,0 +1,68 @@
+"""
+Hot-path cost of the metrics: one labelled update, and HTTPMetricsMiddleware per request.
+
+The middleware is measured on a one-route FastAPI app driven in-process through
+httpx's ASGI transport, with and without it, so the difference is what every
+request pays. Run from the backend directory:
+
+    python -m benchmarks.metrics_benchmark --requests 2000 --rounds 5
+"""
+import argparse
+import asyncio
+import time
+import httpx
+from fastapi import FastAPI
+from services.metrics import Counter, HTTPMetricsMiddleware, Histogram, Registry
+
+def ns_per_call(run, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        run()
+    return (time.perf_counter() - start) / repeat * 1e9
+
+def build_app(instrumented: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/api/users/{user_id}/tasks")
+    async def tasks(user_id: str):
+        return {"user_id": user_id, "tasks": []}
+
+    if instrumented:
+        app.add_middleware(HTTPMetricsMiddleware)
+    return app
+
+async def us_per_request(app: FastAPI, total: int) -> float:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for index in range(200):
+            await client.get(f"/api/users/{index}/tasks")
+        start = time.process_time()
+        for index in range(total):
+            await client.get(f"/api/users/{index}/tasks")
+        return (time.process_time() - start) / total * 1e6
+
+async def main(total: int, repeat: int, rounds: int):
+    registry = Registry()
+    counter = Counter('bench_total', 'Benchmark counter', ['service', 'kind'], registry=registry)
+    histogram = Histogram('bench_seconds', 'Benchmark histogram', ['upstream', 'outcome'], registry=registry)
+    print(f"empty call                   {ns_per_call(lambda: None, repeat):6.0f} ns")
+    print(f"counter.labels().inc()       {ns_per_call(lambda: counter.labels('vision', 'analysis').inc(), repeat):6.0f} ns")
+    print(f"histogram.labels().observe() {ns_per_call(lambda: histogram.labels('gemini', 'ok').observe(0.42), repeat):6.0f} ns")
+
+    # Alternated and best of `rounds`, since a single pass is noisy at this scale
+    plain_app, instrumented_app = build_app(False), build_app(True)
+    plain, instrumented = float('inf'), float('inf')
+    for _ in range(rounds):
+        plain = min(plain, await us_per_request(plain_app, total))
+        instrumented = min(instrumented, await us_per_request(instrumented_app, total))
+    print(f"request without middleware   {plain:6.1f} us CPU")
+    print(f"request with middleware      {instrumented:6.1f} us CPU (+{instrumented - plain:.1f} us, "
+          f"{(instrumented - plain) / plain * 100:.1f}%)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=200000)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.repeat, args.rounds))
@@ -0,0 +1,44 @@
+"""
+Vectorized trend analytics over many market x crop price series.
+
+    python -m benchmarks.price_analytics_benchmark --series 10000 --days 730
+"""
+import argparse
+import time
+import numpy as np
+from services import price_analytics
+
+def synthetic_prices(series: int, days: int, missing: float, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    seasonal = 0.1 * np.sin(2 * np.pi * np.arange(days) / 365)
+    returns = rng.normal(0.0002, 0.02, (series, days))
+    prices = 20 * np.exp(np.cumsum(returns, axis=1) + seasonal)
+    prices[rng.random(prices.shape) < missing] = np.nan
+    return prices
+
+def main(series: int, days: int, missing: float, repeat: int):
+    prices = synthetic_prices(series, days, missing)
+    day_numbers = np.arange(days)
+
+    price_analytics.analyze(prices[:10], day_numbers)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        summary = price_analytics.analyze(prices, day_numbers)
+        timings.append(time.perf_counter() - start)
+
+    best = min(timings)
+    directions = np.bincount(summary['direction'] + 1, minlength=3)
+    print(f"{series} series x {days} days ({missing:.0%} missing)")
+    print(f"analyze: best {best * 1000:.1f} ms, {series / best:,.0f} series/s")
+    print(f"down/stable/up: {directions.tolist()}, mean confidence {summary['confidence'].mean():.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--series', type=int, default=10000)
+    parser.add_argument('--days', type=int, default=730)
+    parser.add_argument('--missing', type=float, default=0.1)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    main(args.series, args.days, args.missing, args.repeat)
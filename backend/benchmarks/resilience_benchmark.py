@@ -0,0 +1,111 @@
+"""
+Latency until a caller has an answer (or falls back to its mock) through an upstream brownout.
+
+A local stub upstream answers in ~50 ms with a slow tail (--tail of requests take
+--tail-delay seconds), then stops answering within any timeout (brownout), then
+recovers. Each phase is run with a fixed per-call timeout, as the services used
+to call upstreams, and through http_pool's guarded request path (adaptive
+timeouts, circuit breaker, retries, hedging). Run from the backend directory:
+
+    python -m benchmarks.resilience_benchmark --timeout 30
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+import httpx
+import numpy as np
+from benchmarks.stub_upstream import StubUpstream
+
+class Phases:
+    def __init__(self, tail: float, tail_delay: float):
+        self.tail = tail
+        self.tail_delay = tail_delay
+        self.brownout = False
+
+    def delay(self) -> float:
+        if self.brownout:
+            return 3600
+        if random.random() < self.tail:
+            return self.tail_delay
+        return random.uniform(0.04, 0.06)
+
+async def run_phase(call, total: int, rate: float):
+    """
+    `total` calls arriving at `rate` per second, whether or not earlier ones have finished
+    """
+    latencies = []
+    fallbacks = 0
+
+    async def one():
+        nonlocal fallbacks
+        start = time.perf_counter()
+        ok = await call()
+        latencies.append(time.perf_counter() - start)
+        fallbacks += not ok
+
+    start = time.perf_counter()
+    calls = []
+    for _ in range(total):
+        calls.append(asyncio.create_task(one()))
+        await asyncio.sleep(1 / rate)
+    await asyncio.gather(*calls)
+    return np.array(latencies), fallbacks, time.perf_counter() - start
+
+def report(mode: str, phase: str, latencies, fallbacks: int, elapsed: float):
+    print(f"{mode:8s} {phase:10s} p50 {np.percentile(latencies, 50) * 1000:8.1f} ms  p99 {np.percentile(latencies, 99) * 1000:8.1f} ms  "
+          f"max {latencies.max() * 1000:8.1f} ms  fallbacks {fallbacks:3d}/{len(latencies)}  wall {elapsed:6.1f} s")
+
+async def main(total: int, brownout_total: int, rate: float, connections: int, timeout: float, tail: float, tail_delay: float, reset: float):
+    os.environ['UPSTREAM_BREAKER_RESET_SECONDS'] = str(reset)
+    os.environ['MANDI_MAX_CONNECTIONS'] = str(connections)
+    from services.http_client import http_pool
+
+    phases = Phases(tail, tail_delay)
+    upstream = StubUpstream({"records": []}, delay=phases.delay)
+    upstream.start_in_thread()
+    plain = httpx.AsyncClient(limits=httpx.Limits(max_connections=connections))
+
+    async def fixed():
+        try:
+            return (await plain.get(upstream.url, timeout=timeout)).status_code == 200
+        except Exception:
+            return False
+
+    async def guarded():
+        try:
+            return (await http_pool.get('mandi', upstream.url, timeout=timeout)).status_code == 200
+        except Exception:
+            return False
+
+    try:
+        for mode, call in (("fixed", fixed), ("guarded", guarded)):
+            phases.brownout = False
+            report(mode, "healthy", *await run_phase(call, total, rate))
+            phases.brownout = True
+            report(mode, "brownout", *await run_phase(call, brownout_total, rate))
+            phases.brownout = False
+            # Long enough for the breaker to let a probe through
+            await asyncio.sleep(reset)
+            report(mode, "recovered", *await run_phase(call, total, rate))
+        print(f"guard {http_pool.get_stats()['mandi']}")
+    finally:
+        await plain.aclose()
+        await http_pool.shutdown()
+        upstream.stop_thread()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--brownout-requests', type=int, default=40)
+    parser.add_argument('--rate', type=float, default=100)
+    parser.add_argument('--connections', type=int, default=50)
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--tail', type=float, default=0.03)
+    parser.add_argument('--tail-delay', type=float, default=1.0)
+    parser.add_argument('--reset', type=float, default=3)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.brownout_requests, args.rate, args.connections, args.timeout, args.tail,
+                     args.tail_delay, args.reset))
@@ -0,0 +1,90 @@
+"""
+CPU per response for a list of tasks read from Mongo: models + response_model vs encoding the documents directly.
+
+The "models" path is what a `response_model=List[Task]` endpoint returning
+`[Task(**doc) for doc in docs]` does: build the models, let FastAPI validate and
+serialise them again, then render with JSONResponse. The "documents" path hands
+the projected documents to fast_json.dumps. Both bodies are checked to decode to
+the same JSON. Run from the backend directory:
+
+    python -m benchmarks.serialization_benchmark --tasks 1000 --repeat 50
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from typing import List
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from models.task import Task
+from services import fast_json
+from services.task_service import TaskService
+
+def task_documents(count: int):
+    """
+    Documents shaped like stored tasks: every multilingual field filled in, datetimes as Mongo returns them
+    """
+    templates = TaskService(db=None)._get_task_templates('tomato', '', 'hi')
+    now = datetime(2024, 6, 1, 7, 30, 15, 123000)
+    docs = []
+    for index in range(count):
+        template = templates[index % len(templates)]
+        docs.append({
+            "id": str(uuid.uuid4()),
+            "user_id": "farmer-1",
+            "title": template["title"],
+            "title_hindi": template["title_hindi"],
+            "title_local": template["title_hindi"],
+            "description": template["description"],
+            "description_hindi": template["description_hindi"],
+            "description_local": template["description_hindi"],
+            "category": template["category"],
+            "priority": template["priority"],
+            "crop_type": "tomato",
+            "due_date": (date(2024, 6, 1) + timedelta(days=index // len(templates))).isoformat(),
+            "due_time": template["due_time"],
+            "completed": index % 4 == 0,
+            "completed_at": now if index % 4 == 0 else None,
+            "created_at": now,
+            "updated_at": now,
+        })
+    return docs
+
+async def models_path(field, docs) -> bytes:
+    content = await serialize_response(field=field, response_content=[Task(**doc) for doc in docs], is_coroutine=True)
+    return JSONResponse(content).body
+
+async def documents_path(docs) -> bytes:
+    return fast_json.JSONBytesResponse(docs).body
+
+async def cpu_ms(run, repeat: int) -> float:
+    start = time.process_time()
+    for _ in range(repeat):
+        await run()
+    return (time.process_time() - start) / repeat * 1000
+
+async def main(count: int, repeat: int):
+    docs = task_documents(count)
+    field = create_response_field(name="response", type_=List[Task])
+
+    slow = await models_path(field, docs)
+    fast = await documents_path(docs)
+    assert json.loads(slow) == json.loads(fast), "encodings differ"
+
+    slow_ms = await cpu_ms(lambda: models_path(field, docs), repeat)
+    fast_ms = await cpu_ms(lambda: documents_path(docs), repeat)
+    encoder = "orjson" if fast_json.orjson is not None else "json"
+    print(f"{count} tasks, {len(fast) / 1024:.0f} KiB response")
+    print(f"models + response_model  {slow_ms:7.2f} ms CPU/request")
+    print(f"documents via {encoder:6s}     {fast_ms:7.2f} ms CPU/request ({slow_ms / fast_ms:.1f}x less)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tasks', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.tasks, args.repeat))
@@ -0,0 +1,119 @@
+"""
+Voice query latency with whole-recording transcription vs streaming recognition.
+
+Plays a recording into the recognizers in real time (one chunk every --chunk-ms,
+like MediaRecorder) against a local stub Speech-to-Text upstream that answers
+after --delay seconds plus --per-audio-second for each second of audio sent, as
+recognition time grows with the audio. Reports when the first interim transcript arrives, how
+long after the end of the recording the final transcript is ready, and how much
+audio was sent upstream.
+
+The chunked recognizer is run twice: on a 16 kHz WAV recording of short phrases
+with pauses, which the audio preprocessor can decode and split, and on opaque
+bytes at the same bitrate (like webm without ffmpeg), which it has to send as
+they are. Run from the backend directory:
+
+    python -m benchmarks.streaming_stt_benchmark --seconds 8 --delay 0.3 --per-audio-second 0.1
+"""
+import argparse
+import asyncio
+import io
+import os
+import time
+import wave
+import numpy as np
+from benchmarks.stub_upstream import StubUpstream
+
+RESULT = {"results": [{"alternatives": [{"transcript": "मेरी फसल में बीमारी है", "confidence": 0.91}]}]}
+RATE = 16000
+BYTES_PER_SECOND = RATE * 2
+# Request bodies carry the audio as base64
+BODY_BYTES_PER_SECOND = BYTES_PER_SECOND * 4 / 3
+
+def phrases_wav(seconds: float, phrase: float = 1.2, pause: float = 0.6) -> bytes:
+    """
+    Tone bursts of `phrase` seconds separated by `pause` seconds of low noise, as a 16-bit mono WAV
+    """
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * RATE)) / RATE
+    speaking = (t % (phrase + pause)) < phrase
+    samples = np.where(speaking, 0.3 * np.sin(2 * np.pi * 220 * t), 0.0) + rng.normal(0, 0.002, len(t))
+    output = io.BytesIO()
+    with wave.open(output, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(RATE)
+        wav.writeframes((np.clip(samples, -1, 1) * 32767).astype('<i2').tobytes())
+    return output.getvalue()
+
+async def record(audio: bytes, seconds: float, chunk_ms: int, marks: dict):
+    chunks = int(seconds * 1000 / chunk_ms)
+    size = -(-len(audio) // chunks)
+    for index in range(chunks):
+        await asyncio.sleep(chunk_ms / 1000)
+        yield audio[index * size:(index + 1) * size]
+    marks["ended"] = time.perf_counter()
+
+async def batch(voice_service, audio: bytes, seconds: float, chunk_ms: int):
+    from services.payloads import Base64Payload
+
+    marks = {}
+    start = time.perf_counter()
+    recording = b"".join([chunk async for chunk in record(audio, seconds, chunk_ms, marks)])
+    await voice_service.transcribe_payload(Base64Payload.from_bytes(recording), "hi-IN")
+    return None, time.perf_counter() - start, time.perf_counter() - marks["ended"]
+
+async def streaming(recognizer, audio: bytes, seconds: float, chunk_ms: int, encoding: str, sample_rate: int):
+    marks = {}
+    start = time.perf_counter()
+    first_interim = None
+    async for update in recognizer.stream(record(audio, seconds, chunk_ms, marks), "hi-IN", encoding, sample_rate):
+        if not update.is_final and first_interim is None:
+            first_interim = time.perf_counter() - start
+    return first_interim, time.perf_counter() - start, time.perf_counter() - marks["ended"]
+
+async def main(seconds: float, chunk_ms: int, delay: float, per_audio_second: float, interval: float):
+    upstream = StubUpstream(RESULT, delay=delay, delay_per_byte=per_audio_second / BODY_BYTES_PER_SECOND)
+    await upstream.start()
+    os.environ['VERTEX_API_KEY'] = 'bench'
+    os.environ['SPEECH_API_URL'] = upstream.url
+    from services.audio_preprocess import AudioPreprocessor
+    from services.http_client import http_pool
+    from services.streaming_stt import ChunkedRecognizer, LocalRecognizer
+    from services.voice_service import VoiceService
+
+    await http_pool.startup()
+    voice_service = VoiceService()
+    wav = phrases_wav(seconds)
+    opaque = os.urandom(len(wav))
+    print(f"{seconds}s recording in {chunk_ms} ms chunks, recognize takes {delay}s + {per_audio_second}s per audio second")
+    try:
+        for label, run in (
+            ("whole recording", batch(voice_service, opaque, seconds, chunk_ms)),
+            ("chunked, WAV", streaming(ChunkedRecognizer(voice_service, interval=interval, preprocessor=AudioPreprocessor()),
+                                       wav, seconds, chunk_ms, "LINEAR16", RATE)),
+            ("chunked, opaque", streaming(ChunkedRecognizer(voice_service, interval=interval), opaque, seconds, chunk_ms,
+                                          "WEBM_OPUS", 48000)),
+            ("local stand-in", streaming(LocalRecognizer(bytes_per_word=BYTES_PER_SECOND // 2), opaque, seconds, chunk_ms,
+                                         "WEBM_OPUS", 48000)),
+        ):
+            calls_before, bytes_before = upstream.request_count, upstream.bytes_received
+            first_interim, total, after_end = await run
+            interim = f"{first_interim:5.2f}s" if first_interim is not None else "    -"
+            print(f"{label:16s} first interim {interim}  final {total:5.2f}s  "
+                  f"after end of speech {after_end * 1000:6.0f} ms  {upstream.request_count - calls_before:2d} upstream calls  "
+                  f"{(upstream.bytes_received - bytes_before) / 1024:7.0f} KiB sent")
+    finally:
+        await http_pool.shutdown()
+        await upstream.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, default=8.0)
+    parser.add_argument('--chunk-ms', type=int, default=250)
+    parser.add_argument('--delay', type=float, default=0.3)
+    parser.add_argument('--per-audio-second', type=float, default=0.1)
+    parser.add_argument('--interval', type=float, default=1.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.seconds, args.chunk_ms, args.delay, args.per_audio_second, args.interval))
@@ -0,0 +1,143 @@
+import asyncio
+import json
+import threading
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+class StubUpstream:
+    """
+    Minimal keep-alive HTTP/1.1 server that answers every request with a fixed JSON body after a delay
+
+    `delay` is seconds, or a callable returning each request's delay, plus
+    `delay_per_byte` seconds for each byte of the request body.
+
+    When `stream_events` is given, requests for `alt=sse` are answered with those
+    events as a chunked server-sent-event stream, `event_delay` seconds apart. With
+    `abort_after`, the connection is dropped after that many events instead of ending
+    the stream, as an upstream failing mid-answer would.
+    """
+    def __init__(self, body: Dict, delay: Union[float, Callable[[], float]] = 0.05, host: str = '127.0.0.1', port: int = 0,
+                 handler: Optional[Callable[[str, bytes], Tuple[int, bytes]]] = None,
+                 stream_events: Optional[List[Dict]] = None, event_delay: float = 0.05, delay_per_byte: float = 0.0,
+                 abort_after: Optional[int] = None):
+        self.body = json.dumps(body).encode('utf-8')
+        self.stream_events = stream_events
+        self.event_delay = event_delay
+        self.abort_after = abort_after
+        self.delay = delay
+        self.delay_per_byte = delay_per_byte
+        self.host = host
+        self.port = port
+        self.handler = handler
+        self.request_count = 0
+        self.bytes_received = 0
+        self._server = None
+        self._handlers = set()
+        self._loop = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        """
+        Stop listening and end open keep-alive connections before the loop goes away
+        """
+        if self._server:
+            self._server.close()
+            for task in self._handlers:
+                task.cancel()
+            await asyncio.gather(*self._handlers, return_exceptions=True)
+            await self._server.wait_closed()
+
+    def start_in_thread(self):
+        """
+        Serve from a dedicated event loop so blocking clients cannot stall the stub
+        """
+        ready = threading.Event()
+
+        def serve():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.start())
+            ready.set()
+            self._loop.run_forever()
+            self._loop.close()
+
+        self._thread = threading.Thread(target=serve, daemon=True)
+        self._thread.start()
+        ready.wait()
+
+    def stop_thread(self):
+        if self._loop:
+            asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                content_length = 0
+                while True:
+                    header = await reader.readline()
+                    if header in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = header.decode('latin-1').partition(':')
+                    if name.strip().lower() == 'content-length':
+                        content_length = int(value.strip())
+
+                body = await reader.readexactly(content_length) if content_length else b''
+                self.request_count += 1
+                self.bytes_received += len(body)
+                await asyncio.sleep((self.delay() if callable(self.delay) else self.delay) + len(body) * self.delay_per_byte)
+
+                if self.stream_events is not None and 'alt=sse' in request_line.decode('latin-1'):
+                    if not await self._write_stream(writer):
+                        break
+                    continue
+
+                status, payload = 200, self.body
+                if self.handler:
+                    status, payload = self.handler(request_line.decode('latin-1'), body)
+
+                writer.write(
+                    f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\nConnection: keep-alive\r\n\r\n".encode('latin-1') + payload
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        except asyncio.CancelledError:
+            # stop() cancels open connections; end quietly so start_server's callback has nothing to report
+            pass
+        finally:
+            self._handlers.discard(task)
+            writer.close()
+
+    async def _write_stream(self, writer: asyncio.StreamWriter) -> bool:
+        """
+        Send the events as one chunked response; False when the stream was aborted
+        """
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+            b"Transfer-Encoding: chunked\r\nConnection: keep-alive\r\n\r\n"
+        )
+        for index, event in enumerate(self.stream_events):
+            if index == self.abort_after:
+                return False
+            chunk = f"data: {json.dumps(event, ensure_ascii=False)}\r\n\r\n".encode('utf-8')
+            writer.write(f"{len(chunk):x}\r\n".encode('latin-1') + chunk + b"\r\n")
+            await writer.drain()
+            await asyncio.sleep(self.event_delay)
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        return True
@@ -0,0 +1,107 @@
+"""
+Peak Python heap per crop-image upload, old base64-in-JSON path vs the streamed payload path.
+
+The upstream is an in-process transport that consumes the request body chunk by
+chunk and checks it decodes back to the original image, so only the client-side
+copies are measured. Run from the backend directory:
+
+    python -m benchmarks.upload_memory_benchmark --size-mb 8
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import os
+import tempfile
+import tracemalloc
+import httpx
+
+VISION_REPLY = {"responses": [{"labelAnnotations": [{"description": "Leaf"}]}]}
+
+class ConsumingTransport(httpx.AsyncBaseTransport):
+    """
+    Reads the request body incrementally and records the SHA-1 of the decoded image
+    """
+    MARKER = b'"content":'
+
+    def __init__(self):
+        self.digests = []
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        digest, pending, inside = hashlib.sha1(), b"", False
+        async for chunk in request.stream:
+            pending += bytes(chunk)
+            if not inside:
+                start = pending.find(self.MARKER)
+                if start < 0:
+                    continue
+                pending, inside = pending[pending.index(b'"', start + len(self.MARKER)) + 1:], True
+            end = pending.find(b'"')
+            text = pending if end < 0 else pending[:end]
+            usable = len(text) if end >= 0 else len(text) - len(text) % 4
+            digest.update(base64.b64decode(text[:usable]))
+            pending = text[usable:]
+            if end >= 0:
+                break
+        self.digests.append(digest.hexdigest())
+        return httpx.Response(200, json=VISION_REPLY)
+
+def measure(fn) -> int:
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    asyncio.run(fn())
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak - baseline
+
+def main(size_mb: float):
+    os.environ['GOOGLE_VISION_API_KEY'] = 'bench'
+    from services.http_client import http_pool
+    from services.payloads import Base64Payload
+    from services.vision_service import VisionService
+
+    image = os.urandom(int(size_mb * 1024 * 1024))
+    expected = hashlib.sha1(image).hexdigest()
+    data_url = "data:image/jpeg;base64," + base64.b64encode(image).decode('ascii')
+    transport = ConsumingTransport()
+    service = VisionService()
+
+    def use_transport():
+        http_pool._clients['vision'] = httpx.AsyncClient(transport=transport)
+
+    async def legacy():
+        use_transport()
+        clean_base64 = data_url.replace('data:image/jpeg;base64,', '').replace('data:image/png;base64,', '')
+        request_data = {"requests": [{"image": {"content": clean_base64}, "features": []}]}
+        await http_pool.client('vision').post("http://vision.local/v1/images:annotate", json=request_data)
+
+    async def streamed_data_url():
+        use_transport()
+        await service.analyze_crop_image(data_url, "en")
+
+    with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as spool:
+        spool.write(image)
+        del image
+
+        async def streamed_upload():
+            use_transport()
+            await service.analyze_crop_payload(Base64Payload.from_file(spool), "en")
+
+        results = [
+            ("legacy data URL (replace + json=)", measure(legacy)),
+            ("data URL, streamed body", measure(streamed_data_url)),
+            ("binary upload, spooled file", measure(streamed_upload)),
+        ]
+
+    assert transport.digests == [expected] * 3, "upstream did not receive the original image"
+    print(f"image size: {size_mb:.1f} MiB (base64 {len(data_url) / 2 ** 20:.1f} MiB)")
+    for name, peak in results:
+        print(f"{name:36s} peak {peak / 2 ** 20:7.1f} MiB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size-mb', type=float, default=8)
+    args = parser.parse_args()
+    main(args.size_mb)
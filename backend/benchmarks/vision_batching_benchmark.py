@@ -0,0 +1,65 @@
+"""
+Concurrent crop analyses against a local stub Vision upstream, one image per
+annotate call vs micro-batched calls.
+
+The stub answers each annotate request after a fixed delay with one response per
+image, and fails any image whose content is "bad" so error isolation is visible.
+Run from the backend directory:
+
+    python -m benchmarks.vision_batching_benchmark --requests 256 --delay 0.2
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import time
+from benchmarks.stub_upstream import StubUpstream
+
+LEAF = {"labelAnnotations": [{"description": "Leaf"}]}
+ERROR = {"error": {"code": 3, "message": "Bad image data."}}
+
+def annotate(request_line: str, body: bytes):
+    requests = json.loads(body)["requests"]
+    responses = [ERROR if base64.b64decode(request["image"]["content"]).startswith(b"bad") else LEAF
+                 for request in requests]
+    return 200, json.dumps({"responses": responses}).encode('utf-8')
+
+async def run(url: str, total: int, batch_size: int, failures: int):
+    os.environ['GOOGLE_VISION_API_KEY'] = 'bench'
+    os.environ['GOOGLE_VISION_API_URL'] = url
+    os.environ['VISION_BATCH_SIZE'] = str(batch_size)
+    from services.http_client import http_pool
+    from services.payloads import Base64Payload
+    from services.vision_service import VisionService
+
+    service = VisionService()
+    await http_pool.startup()
+    payloads = [Base64Payload.from_bytes(f"bad-{i}".encode() if i < failures else f"image-{i}".encode()) for i in range(total)]
+    start = time.perf_counter()
+    await asyncio.gather(*(service.analyze_crop_payload(payload, "en") for payload in payloads))
+    elapsed = time.perf_counter() - start
+    await http_pool.shutdown()
+    return elapsed, service.annotate_batcher.stats()
+
+async def main(total: int, delay: float, failures: int):
+    upstream = StubUpstream({}, delay=delay, handler=annotate)
+    await upstream.start()
+    try:
+        for label, batch_size in (("one per call", 1), ("batched", 16)):
+            calls_before = upstream.request_count
+            elapsed, stats = await run(upstream.url, total, batch_size, failures)
+            print(f"{label:13s} {total} analyses in {elapsed:.2f}s -> {total / elapsed:6.1f}/s, "
+                  f"{upstream.request_count - calls_before} upstream calls, mean batch {stats['mean_batch_size']}, "
+                  f"{stats['failed_items']} isolated failures")
+    finally:
+        await upstream.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=256)
+    parser.add_argument('--delay', type=float, default=0.2)
+    parser.add_argument('--failures', type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.delay, args.failures))
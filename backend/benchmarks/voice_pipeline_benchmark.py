@@ -0,0 +1,93 @@
+"""
+Time to first audio for a voice query: three sequential round trips vs the overlapped pipeline.
+
+Local stub upstreams stand in for Speech-to-Text (--stt-delay), Gemini (a
+streamed answer of several sentences, one chunk every --token-delay seconds, or
+the whole answer after all of them for generateContent) and Text-to-Speech
+(--tts-delay per request). Run from the backend directory:
+
+    python -m benchmarks.voice_pipeline_benchmark --runs 5
+"""
+import argparse
+import asyncio
+import os
+import time
+import numpy as np
+from benchmarks.stub_upstream import StubUpstream
+
+ANSWER = [
+    "टमाटर की पत्तियों पर भूरे धब्बे अगेती झुलसा रोग के लक्षण हैं। ",
+    "संक्रमित पत्तियों को तोड़कर खेत से दूर नष्ट करें। ",
+    "मैंकोज़ेब 2 ग्राम प्रति लीटर पानी में मिलाकर ",
+    "सात दिन के अंतर पर छिड़काव करें। ",
+    "पौधों के बीच हवा का संचार बनाए रखें ",
+    "और ऊपर से सिंचाई न करें। ",
+    "अधिक जानकारी के लिए नज़दीकी कृषि विज्ञान केंद्र से संपर्क करें।",
+]
+
+def candidate(text: str):
+    return {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+
+async def main(runs: int, stt_delay: float, token_delay: float, tts_delay: float):
+    stt = StubUpstream({"results": [{"alternatives": [{"transcript": "मेरे टमाटर की पत्तियों पर भूरे धब्बे हैं", "confidence": 0.9}]}]}, delay=stt_delay)
+    # generateContent answers once the whole answer is generated; the stream sends it chunk by chunk
+    gemini = StubUpstream(candidate("".join(ANSWER)), delay=token_delay * len(ANSWER))
+    gemini_stream = StubUpstream({}, delay=token_delay, stream_events=[candidate(chunk) for chunk in ANSWER],
+                                 event_delay=token_delay)
+    tts = StubUpstream({"audioContent": "SUQzBAAAAAAA"}, delay=tts_delay)
+    upstreams = (stt, gemini, gemini_stream, tts)
+    for upstream in upstreams:
+        await upstream.start()
+
+    os.environ.update({
+        'VERTEX_API_KEY': 'bench', 'GEMINI_API_KEY': 'bench', 'CHAT_CACHE_ENABLED': 'false',
+        'SPEECH_API_URL': stt.url, 'TTS_API_URL': tts.url,
+        'GEMINI_API_URL': f"{gemini.url}/models/gemini-pro:generateContent",
+        'GEMINI_STREAM_API_URL': f"{gemini_stream.url}/models/gemini-pro:streamGenerateContent",
+    })
+    from services.gemini_service import GeminiService
+    from services.http_client import http_pool
+    from services.payloads import Base64Payload
+    from services.voice_pipeline import VoicePipeline
+    from services.voice_service import VoiceService
+
+    await http_pool.startup()
+    voice_service, gemini_service = VoiceService(), GeminiService()
+    pipeline = VoicePipeline(voice_service, gemini_service)
+    sequential, overlapped, totals = [], [], []
+    try:
+        for run in range(runs):
+            audio = Base64Payload.from_bytes(os.urandom(16000) + bytes([run]))
+
+            start = time.perf_counter()
+            transcript = await voice_service.transcribe_payload(audio, "hi-IN")
+            answer = await gemini_service.get_chat_response(transcript.transcript, "hi")
+            await voice_service.synthesize_speech(answer.message, "hi-IN")
+            sequential.append(time.perf_counter() - start)
+
+            audio = Base64Payload.from_bytes(os.urandom(16000) + bytes([run]))
+            async for event, payload in pipeline.run(audio, "hi-IN"):
+                if event == "done":
+                    overlapped.append(payload.timings["time_to_first_audio"] / 1000)
+                    totals.append(payload.timings["total"] / 1000)
+    finally:
+        await http_pool.shutdown()
+        for upstream in upstreams:
+            await upstream.stop()
+
+    print(f"stt {stt_delay}s, {len(ANSWER)} answer chunks every {token_delay}s, tts {tts_delay}s per request")
+    print(f"sequential  first audio after {np.median(sequential):5.2f}s")
+    print(f"pipeline    first audio after {np.median(overlapped):5.2f}s, last audio after {np.median(totals):5.2f}s")
+    for stage, values in pipeline.get_stats().items():
+        if isinstance(values, dict):
+            print(f"  {stage:20s} p50 {values['p50_ms']:7.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--stt-delay', type=float, default=0.4)
+    parser.add_argument('--token-delay', type=float, default=0.25)
+    parser.add_argument('--tts-delay', type=float, default=0.3)
+    args = parser.parse_args()
+    asyncio.run(main(args.runs, args.stt_delay, args.token_delay, args.tts_delay))
@@ -39,6 +39,12 @@ class VoiceResponse(BaseModel):
     confidence: Optional[float] = None
     language: str = "hi-IN"
 
+class StreamingTranscript(BaseModel):
+    transcript: str
+    is_final: bool = False
+    confidence: Optional[float] = None
+    language: str = "hi-IN"
+
 class TTSRequest(BaseModel):
     text: str
     language: str = "hi-IN"
@@ -46,4 +52,15 @@ class TTSRequest(BaseModel):
 
 class TTSResponse(BaseModel):
     audio_base64: str
-    language: str = "hi-IN"
\ No newline at end of file
+    language: str = "hi-IN"
+
+class VoiceAnswerAudio(BaseModel):
+    index: int
+    text: str
+    audio_base64: str
+    language: str = "hi-IN"
+
+class VoicePipelineResult(BaseModel):
+    transcript: VoiceResponse
+    response: ChatResponse
+    timings: Dict[str, float]  # stage latencies in milliseconds
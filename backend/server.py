@@ -1,14 +1,43 @@
-from fastapi import FastAPI, APIRouter
+from fastapi import FastAPI, APIRouter, File, Form, HTTPException, Query, Request, UploadFile, WebSocket, WebSocketDisconnect
+from fastapi.responses import Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import json
+import asyncio
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List
+from typing import List, Optional
 import uuid
-from datetime import datetime
+from datetime import date, datetime
+from models.chat import ChatRequest, VoiceResponse
+from models.crop_analysis import CropAnalysisResult
+from models.task import Task
+from services.audio_preprocess import AudioPreprocessor
+from services.change_feed import ChangeFeed, MongoChangeSource
+from services.crop_classifier import CropDiseaseClassifier
+from services.db_indexes import ensure_indexes
+from services.fast_json import JSONBytesResponse, model_response
+from services.gemini_service import GeminiService
+from services.http_client import http_pool
+from services.image_preprocess import ImagePreprocessor
+from services.mandi_ingest import MandiIngestor
+from services.mandi_service import MandiService
+from services.mandi_store import MandiPriceStore
+from services.market_index import MarketIndex
+from services.metrics import CONTENT_TYPE, REGISTRY, HTTPMetricsMiddleware, MongoCommandMetrics, stats_families
+from services.perceptual_cache import PerceptualImageCache
+from services.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, keyset_filter, ndjson_page, projection
+from services.payloads import Base64Payload, PayloadTooLarge, spool_request_body
+from services.streaming_stt import create_recognizer
+from services.task_calendar import TaskCalendarPrecomputer
+from services.task_service import TASK_PAGE_SORT, TaskService
+from services.tts_cache import TTSAudioCache
+from services.voice_pipeline import VoicePipeline
+from services.vision_service import VisionService
+from services.voice_service import VoiceService
 
 
 ROOT_DIR = Path(__file__).parent
@@ -16,9 +45,34 @@ load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[MongoCommandMetrics()])
 db = client[os.environ['DB_NAME']]
 
+# Services
+mandi_store = MandiPriceStore()
+market_index = MarketIndex()
+mandi_service = MandiService(db, store=mandi_store, market_index=market_index)
+mandi_ingestor = MandiIngestor(mandi_store)
+gemini_service = GeminiService()
+image_preprocessor = ImagePreprocessor()
+image_cache = PerceptualImageCache() if os.getenv('IMAGE_CACHE_ENABLED', 'true').lower() == 'true' else None
+# Off by default: the built-in colour weights never reach CROP_LOCAL_MIN_CONFIDENCE, so only enable it with a trained CROP_MODEL_PATH
+crop_classifier = CropDiseaseClassifier(pool=image_preprocessor) if os.getenv('CROP_LOCAL_MODEL_ENABLED', 'false').lower() == 'true' else None
+vision_service = VisionService(preprocessor=image_preprocessor, image_cache=image_cache, classifier=crop_classifier)
+tts_cache = TTSAudioCache() if os.getenv('TTS_CACHE_ENABLED', 'true').lower() == 'true' else None
+audio_preprocessor = AudioPreprocessor(pool=image_preprocessor) if os.getenv('AUDIO_PREPROCESS_ENABLED', 'true').lower() == 'true' else None
+voice_service = VoiceService(tts_cache=tts_cache, audio_preprocessor=audio_preprocessor)
+speech_recognizer = create_recognizer(voice_service)
+voice_pipeline = VoicePipeline(voice_service, gemini_service)
+task_service = TaskService(db)
+task_calendar_precomputer = TaskCalendarPrecomputer(db, task_service)
+change_feed = ChangeFeed()
+background_tasks = []
+
+# Binary uploads are spooled to a temp file past UPLOAD_SPOOL_BYTES instead of held in memory
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', str(20 * 1024 * 1024)))
+UPLOAD_SPOOL_BYTES = int(os.getenv('UPLOAD_SPOOL_BYTES', str(1024 * 1024)))
+
 # Create the main app without a prefix
 app = FastAPI()
 
@@ -47,10 +101,256 @@ async def create_status_check(input: StatusCheckCreate):
     _ = await db.status_checks.insert_one(status_obj.dict())
     return status_obj
 
-@api_router.get("/status", response_model=List[StatusCheck])
+@api_router.get("/status", response_class=JSONBytesResponse, responses={200: {"model": List[StatusCheck]}})
 async def get_status_checks():
-    status_checks = await db.status_checks.find().to_list(1000)
-    return [StatusCheck(**status_check) for status_check in status_checks]
+    # Documents were validated on the way in, so they are encoded as stored
+    status_checks = await db.status_checks.find(
+        {}, projection(None, StatusCheck.model_fields, [])
+    ).sort("timestamp", 1).to_list(1000)
+    return JSONBytesResponse(status_checks)
+
+# Keyset order of status check pages; id breaks timestamp ties
+STATUS_PAGE_SORT = ["timestamp", "id"]
+
+def ndjson_response(documents, sort_fields: List[str], limit: int) -> StreamingResponse:
+    return StreamingResponse(ndjson_page(documents, sort_fields, limit), media_type="application/x-ndjson")
+
+@api_router.get("/status/page")
+async def get_status_checks_page(cursor: Optional[str] = None, fields: Optional[str] = None,
+                                 limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)):
+    try:
+        query = keyset_filter(STATUS_PAGE_SORT, decode_cursor(cursor, len(STATUS_PAGE_SORT))) if cursor else {}
+        spec = projection(fields, StatusCheck.model_fields, STATUS_PAGE_SORT)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    documents = db.status_checks.find(query, spec).sort([(field, 1) for field in STATUS_PAGE_SORT]).limit(limit)
+    return ndjson_response(documents, STATUS_PAGE_SORT, limit)
+
+@api_router.get("/users/{user_id}/tasks", response_class=JSONBytesResponse, responses={200: {"model": List[Task]}})
+async def get_tasks(user_id: str, due_date: Optional[date] = None):
+    return JSONBytesResponse(await task_service.get_task_documents(user_id, due_date))
+
+@api_router.get("/users/{user_id}/tasks/page")
+async def get_tasks_page(user_id: str, start_date: Optional[date] = None, end_date: Optional[date] = None,
+                         cursor: Optional[str] = None, fields: Optional[str] = None,
+                         limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)):
+    try:
+        documents = task_service.find_task_page(user_id, start_date, end_date, fields, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return ndjson_response(documents, TASK_PAGE_SORT, limit)
+
+async def subscribe_changes(user_id: str, crops: Optional[str], state: Optional[str]):
+    subscription = change_feed.subscribe(user_id, crops.split(',') if crops else (), state)
+    # Deletes without pre-images only name the document's _id; the feed routes them from these
+    try:
+        change_feed.track_tasks(user_id, await db.tasks.find({"user_id": user_id}, {"_id": 1, "id": 1}).to_list(None))
+    except Exception as e:
+        print(f"Error loading task ids for change feed: {str(e)}")
+    return subscription
+
+# Pushed instead of polled: the user's task changes, and price changes for `crops` (in `state`, if given)
+@api_router.get("/users/{user_id}/events")
+async def stream_user_events(user_id: str, crops: Optional[str] = None, state: Optional[str] = None):
+    async def events():
+        subscription = await subscribe_changes(user_id, crops, state)
+        try:
+            async for event in change_feed.listen(subscription):
+                yield event.sse
+        finally:
+            change_feed.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_router.websocket("/users/{user_id}/events/ws")
+async def user_events_socket(websocket: WebSocket, user_id: str, crops: Optional[str] = None, state: Optional[str] = None):
+    await websocket.accept()
+    subscription = await subscribe_changes(user_id, crops, state)
+
+    async def push():
+        async for event in change_feed.listen(subscription):
+            await websocket.send_text(event.message)
+
+    pusher = asyncio.create_task(push())
+    try:
+        # Clients send nothing; this returns once they disconnect
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    finally:
+        pusher.cancel()
+        change_feed.unsubscribe(subscription)
+        await asyncio.gather(pusher, return_exceptions=True)
+
+@api_router.get("/events/stats")
+async def get_event_stats():
+    return change_feed.get_stats()
+
+@api_router.post("/chat/stream")
+async def stream_chat(request: ChatRequest):
+    async def events():
+        async for event, payload in gemini_service.stream_chat_response(request.message, request.language, request.context):
+            data = payload.model_dump_json() if event == "done" else json.dumps({"text": payload}, ensure_ascii=False)
+            yield f"event: {event}\ndata: {data}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def spool_upload(request: Request):
+    try:
+        return await spool_request_body(request.stream(), MAX_UPLOAD_BYTES, UPLOAD_SPOOL_BYTES)
+    except PayloadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+def upload_payload(upload: UploadFile) -> Base64Payload:
+    if upload.size is not None and upload.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds {MAX_UPLOAD_BYTES} bytes")
+    return Base64Payload.from_file(upload.file, upload.size)
+
+@api_router.post("/crop/analyze/upload", response_class=JSONBytesResponse, responses={200: {"model": CropAnalysisResult}})
+async def analyze_crop_upload(image: UploadFile = File(...), language: str = Form("hi")):
+    return model_response(await vision_service.analyze_crop_payload(upload_payload(image), language))
+
+@api_router.post("/crop/analyze/raw", response_class=JSONBytesResponse, responses={200: {"model": CropAnalysisResult}})
+async def analyze_crop_raw(request: Request, language: str = "hi"):
+    spool, size = await spool_upload(request)
+    with spool:
+        return model_response(await vision_service.analyze_crop_payload(Base64Payload.from_file(spool, size), language))
+
+@api_router.post("/voice/transcribe/upload", response_class=JSONBytesResponse, responses={200: {"model": VoiceResponse}})
+async def transcribe_upload(audio: UploadFile = File(...), language: str = Form("hi-IN")):
+    return model_response(await voice_service.transcribe_payload(upload_payload(audio), language))
+
+@api_router.post("/voice/transcribe/raw", response_class=JSONBytesResponse, responses={200: {"model": VoiceResponse}})
+async def transcribe_raw(request: Request, language: str = "hi-IN"):
+    spool, size = await spool_upload(request)
+    with spool:
+        return model_response(await voice_service.transcribe_payload(Base64Payload.from_file(spool, size), language))
+
+# Binary frames carry audio chunks as they are recorded (MediaRecorder's WEBM_OPUS at
+# 48 kHz unless encoding/sample_rate say otherwise) and a text frame ends the
+# recording; interim and final transcripts are sent back as JSON text frames
+@api_router.websocket("/voice/stream")
+async def stream_transcription(websocket: WebSocket, language: str = "hi-IN", encoding: str = "WEBM_OPUS",
+                               sample_rate: int = 48000):
+    await websocket.accept()
+
+    async def audio_chunks():
+        received = 0
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            if message.get("bytes"):
+                received += len(message["bytes"])
+                if received > MAX_UPLOAD_BYTES:
+                    raise PayloadTooLarge(f"Recording exceeds {MAX_UPLOAD_BYTES} bytes")
+                yield message["bytes"]
+            elif message.get("text") is not None:
+                return
+
+    try:
+        async for update in speech_recognizer.stream(audio_chunks(), language, encoding.upper(), sample_rate):
+            await websocket.send_text(update.model_dump_json())
+        await websocket.close()
+    except PayloadTooLarge as e:
+        await websocket.close(code=1009, reason=str(e))
+    except WebSocketDisconnect:
+        pass
+
+# Raw recording in, server-sent events out: the transcript, answer deltas, one
+# audio chunk per spoken sentence and finally the full result with stage timings
+@api_router.post("/voice/pipeline")
+async def voice_pipeline_raw(request: Request, language: str = "hi-IN"):
+    spool, size = await spool_upload(request)
+
+    async def events():
+        with spool:
+            async for event, payload in voice_pipeline.run(Base64Payload.from_file(spool, size), language):
+                data = json.dumps({"text": payload}, ensure_ascii=False) if event == "delta" else payload.model_dump_json()
+                yield f"event: {event}\ndata: {data}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_router.get("/voice/pipeline/stats")
+async def get_voice_pipeline_stats():
+    return voice_pipeline.get_stats()
+
+@api_router.get("/voice/preprocess/stats")
+async def get_voice_preprocess_stats():
+    return voice_service.get_preprocess_stats()
+
+@api_router.get("/cache/stats")
+async def get_cache_stats():
+    return {
+        "mandi_prices": mandi_service.get_cache_stats(),
+        "chat_responses": gemini_service.get_cache_stats(),
+        "crop_images": vision_service.get_image_cache_stats(),
+        "tts_audio": voice_service.get_tts_cache_stats()
+    }
+
+@api_router.get("/coalescing/stats")
+async def get_coalescing_stats():
+    return [
+        gemini_service.get_coalescing_stats(),
+        mandi_service.get_coalescing_stats(),
+        vision_service.get_coalescing_stats(),
+        voice_service.get_coalescing_stats()
+    ]
+
+@api_router.get("/batching/stats")
+async def get_batching_stats():
+    return vision_service.get_batching_stats()
+
+@api_router.get("/upstreams/stats")
+async def get_upstream_stats():
+    return http_pool.get_stats()
+
+# Counters the services already keep, read at scrape time so the hot path pays nothing extra
+def collect_service_metrics():
+    yield from stats_families("cache", "cache", {
+        "mandi_prices": mandi_service.get_cache_stats(),
+        "chat_responses": gemini_service.get_cache_stats(),
+        "crop_images": vision_service.get_image_cache_stats(),
+        "tts_audio": voice_service.get_tts_cache_stats()
+    }, gauges=["hit_ratio", "entries", "inflight", "files", "bytes", "distinct_results"])
+    coalescing = [
+        gemini_service.get_coalescing_stats(),
+        mandi_service.get_coalescing_stats(),
+        vision_service.get_coalescing_stats(),
+        voice_service.get_coalescing_stats()
+    ]
+    yield from stats_families("coalescing", "name", {stats["name"]: stats for stats in coalescing},
+                              gauges=["saved_ratio", "inflight"])
+    yield from stats_families("batcher", "name", {stats["name"]: stats for stats in vision_service.get_batching_stats()},
+                              gauges=["pending", "mean_batch_size", "mean_queue_wait_ms"])
+    upstreams = http_pool.get_stats()
+    yield from stats_families("upstream", "upstream", upstreams,
+                              gauges=["consecutive_failures", "samples", "p50_ms", "p95_ms", "p99_ms", "timeout_seconds"])
+    yield ("upstream_breaker_open", "gauge", "1 while an upstream's circuit breaker is open or half open",
+           [({"upstream": name}, int(stats["state"] != "closed")) for name, stats in upstreams.items()])
+    yield from stats_families("change_feed", "feed", {"events": change_feed.get_stats()},
+                              gauges=["subscribers", "users", "commodities"])
+    stages = {stage: values for stage, values in voice_pipeline.get_stats().items() if isinstance(values, dict)}
+    yield ("voice_pipeline_stage_ms", "gauge", "Voice pipeline stage latency over the recent runs",
+           [({"stage": stage, "quantile": quantile}, values[f"p{quantile}_ms"])
+            for stage, values in stages.items() for quantile in ("50", "95")])
+
+REGISTRY.add_collector(collect_service_metrics)
+
+@app.get("/metrics")
+async def metrics():
+    return Response(REGISTRY.expose(), media_type=CONTENT_TYPE)
 
 # Include the router in the main app
 app.include_router(api_router)
@@ -63,6 +363,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so the latency includes every other middleware
+app.add_middleware(HTTPMetricsMiddleware)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -70,6 +373,85 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def startup_db_indexes():
+    # In the background so an unreachable database does not hold up startup
+    background_tasks.append(asyncio.create_task(ensure_indexes(db)))
+
+@app.on_event("startup")
+async def startup_http_clients():
+    await http_pool.startup()
+
+@app.on_event("startup")
+async def startup_image_preprocessor():
+    await image_preprocessor.startup()
+    if crop_classifier is not None:
+        await crop_classifier.startup()
+
+async def flush_image_cache():
+    if image_cache is not None and image_cache.dirty:
+        await asyncio.to_thread(image_cache.save, image_cache.snapshot())
+
+async def flush_image_cache_forever():
+    interval = float(os.getenv('IMAGE_CACHE_FLUSH_SECONDS', '60'))
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await flush_image_cache()
+        except Exception as e:
+            logger.error(f"Image cache flush failed: {str(e)}")
+
+@app.on_event("startup")
+async def startup_image_cache():
+    if image_cache is not None:
+        await asyncio.to_thread(image_cache.load)
+        background_tasks.append(asyncio.create_task(flush_image_cache_forever()))
+
+@app.on_event("startup")
+async def startup_tts_cache():
+    if tts_cache is not None:
+        await asyncio.to_thread(tts_cache.load)
+
+@app.on_event("startup")
+async def startup_mandi_store():
+    await asyncio.to_thread(mandi_store.load)
+    await asyncio.to_thread(market_index.load)
+    # Only one worker per deployment should ingest; disable elsewhere with MANDI_INGEST_ENABLED=false
+    if os.getenv('MANDI_INGEST_ENABLED', 'true').lower() == 'true' and mandi_ingestor.api_key:
+        background_tasks.append(asyncio.create_task(mandi_ingestor.run_forever()))
+
+@app.on_event("startup")
+async def startup_task_calendar_precompute():
+    # Off by default: workers would race on the single checkpoint, so enable it (TASK_PRECOMPUTE_ENABLED=true) on one worker per deployment
+    if os.getenv('TASK_PRECOMPUTE_ENABLED', 'false').lower() == 'true':
+        background_tasks.append(asyncio.create_task(task_calendar_precomputer.run_forever()))
+
+@app.on_event("startup")
+async def startup_change_feed():
+    background_tasks.append(asyncio.create_task(change_feed.heartbeats()))
+    # Unlike ingestion, every worker follows the streams, since each holds its own client connections
+    if os.getenv('CHANGE_FEED_ENABLED', 'true').lower() == 'true':
+        price_collection = db[os.getenv('MANDI_PRICE_COLLECTION', 'mandi_prices')]
+        background_tasks.append(asyncio.create_task(change_feed.follow(MongoChangeSource(db.tasks), "task")))
+        background_tasks.append(asyncio.create_task(change_feed.follow(MongoChangeSource(price_collection), "price")))
+
+@app.on_event("shutdown")
+async def shutdown_background_tasks():
+    for task in background_tasks:
+        task.cancel()
+
+@app.on_event("shutdown")
+async def shutdown_image_cache():
+    await flush_image_cache()
+
+@app.on_event("shutdown")
+async def shutdown_image_preprocessor():
+    await image_preprocessor.shutdown()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
+
+@app.on_event("shutdown")
+async def shutdown_http_clients():
+    await http_pool.shutdown()
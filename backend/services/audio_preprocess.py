@@ -0,0 +1,573 @@
+import asyncio
+import io
+import os
+import shutil
+import struct
+import subprocess
+import wave
+import numpy as np
+from typing import Any, Dict, List, Optional, Tuple
+
+TARGET_RATE = 16000
+FRAME_MS = 20
+FFMPEG = shutil.which('ffmpeg')
+# Running histogram of frame energies for streamed recordings: 0.5 dB bins from -100 dBFS
+ENERGY_BIN_DB = 0.5
+ENERGY_MIN_DB = -100.0
+ENERGY_BINS = 200
+
+def decode_wav(data: bytes) -> Optional[Tuple[np.ndarray, int]]:
+    """
+    Mono float32 samples in [-1, 1] and the sample rate of a PCM WAV file, or None
+    """
+    try:
+        with wave.open(io.BytesIO(data)) as wav:
+            channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+            frames = wav.readframes(wav.getnframes())
+    except (wave.Error, EOFError):
+        return None
+    # A recording still being streamed can end partway through a frame
+    frames = frames[:len(frames) // (width * channels) * width * channels]
+    samples = pcm_to_float(frames, width, channels)
+    return (samples, rate) if samples is not None else None
+
+def pcm_to_float(frames: bytes, width: int, channels: int) -> Optional[np.ndarray]:
+    """
+    Mono float32 samples in [-1, 1] from little-endian PCM of whole frames, or None for an unsupported width
+    """
+    if width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        samples = np.frombuffer(frames, dtype='<i2').astype(np.float32) / 32768
+    elif width == 3:
+        raw = np.frombuffer(frames[:len(frames) // 3 * 3], dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        values = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        samples = np.where(values >= 1 << 23, values - (1 << 24), values).astype(np.float32) / (1 << 23)
+    elif width == 4:
+        samples = np.frombuffer(frames, dtype='<i4').astype(np.float32) / 2147483648
+    else:
+        return None
+
+    samples = samples[:len(samples) // channels * channels]
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return samples
+
+def decode_ffmpeg(data: bytes, rate: int = TARGET_RATE) -> Optional[Tuple[np.ndarray, int]]:
+    """
+    Decode any container ffmpeg understands (webm, ogg, mp4...) straight to mono at `rate`
+    """
+    if FFMPEG is None:
+        return None
+    result = subprocess.run(
+        [FFMPEG, '-nostdin', '-loglevel', 'error', '-i', 'pipe:0', '-ac', '1', '-ar', str(rate), '-f', 's16le', 'pipe:1'],
+        input=data, capture_output=True, timeout=60
+    )
+    if result.returncode != 0 or not result.stdout:
+        return None
+    return np.frombuffer(result.stdout, dtype='<i2').astype(np.float32) / 32768, rate
+
+def decode_audio(data: bytes) -> Optional[Tuple[np.ndarray, int]]:
+    """
+    WAV with the standard library, everything else through ffmpeg when it is installed
+    """
+    if data[:4] == b'RIFF' and data[8:12] == b'WAVE':
+        decoded = decode_wav(data)
+        if decoded is not None:
+            return decoded
+    return decode_ffmpeg(data)
+
+def resample(samples: np.ndarray, rate: int, target_rate: int = TARGET_RATE) -> np.ndarray:
+    """
+    Linear-interpolation resampling, with a moving-average low-pass first when downsampling
+    """
+    if rate == target_rate or len(samples) == 0:
+        return samples
+    width = int(round(rate / target_rate))
+    if width > 1:
+        cumulative = np.concatenate(([0.0], np.cumsum(samples, dtype=np.float64)))
+        smoothed = (cumulative[width:] - cumulative[:-width]) / width
+        samples = np.concatenate((smoothed, np.full(width - 1, smoothed[-1] if len(smoothed) else 0.0))).astype(np.float32)
+    count = int(len(samples) * target_rate / rate)
+    positions = np.arange(count, dtype=np.float64) * (rate / target_rate)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+def frame_energy_db(samples: np.ndarray, frame: int) -> np.ndarray:
+    """
+    Mean power of each whole frame in dBFS
+    """
+    frames = samples[:len(samples) // frame * frame].reshape(-1, frame)
+    return 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+
+def voice_activity(energy_db: np.ndarray, margin_db: float = 10.0, floor_db: float = -50.0) -> np.ndarray:
+    """
+    Frames whose energy is `margin_db` above the clip's noise floor (its 10th percentile)
+
+    The threshold never exceeds 20 dB below the loudest frame, so a clip that is all
+    speech keeps its quieter syllables, and never drops below `floor_db`.
+    """
+    if len(energy_db) == 0:
+        return np.zeros(0, dtype=bool)
+    noise_floor = np.percentile(energy_db, 10)
+    threshold = max(min(noise_floor + margin_db, energy_db.max() - 20), floor_db)
+    return energy_db > threshold
+
+def speech_segments(active: np.ndarray, min_silence: int, min_speech: int, pad: int) -> List[Tuple[int, int]]:
+    """
+    [start, end) frame ranges of speech: pauses shorter than `min_silence` frames are
+    bridged, bursts shorter than `min_speech` dropped, and each range padded by `pad`
+    """
+    edges = np.diff(np.concatenate(([0], active.astype(np.int8), [0])))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    if len(starts) == 0:
+        return []
+
+    keep = (starts[1:] - ends[:-1]) >= min_silence
+    starts = np.concatenate((starts[:1], starts[1:][keep]))
+    ends = np.concatenate((ends[:-1][keep], ends[-1:]))
+
+    long_enough = (ends - starts) >= min_speech
+    starts = np.maximum(starts[long_enough] - pad, 0)
+    ends = np.minimum(ends[long_enough] + pad, len(active))
+    # Padding must not make neighbouring ranges overlap
+    starts[1:] = np.maximum(starts[1:], ends[:-1])
+    return list(zip(starts.tolist(), ends.tolist()))
+
+def pack_segments(segments: List[Tuple[int, int]], max_frames: int) -> List[List[Tuple[int, int]]]:
+    """
+    Group consecutive speech ranges into chunks of at most `max_frames`, cutting single long ranges
+    """
+    chunks: List[List[Tuple[int, int]]] = []
+    current: List[Tuple[int, int]] = []
+    length = 0
+    for start, end in segments:
+        while end - start > max_frames:
+            if current:
+                chunks.append(current)
+                current, length = [], 0
+            chunks.append([(start, start + max_frames)])
+            start += max_frames
+        if current and length + end - start > max_frames:
+            chunks.append(current)
+            current, length = [], 0
+        current.append((start, end))
+        length += end - start
+    if current:
+        chunks.append(current)
+    return chunks
+
+def encode_pcm(samples: np.ndarray) -> bytes:
+    return (np.clip(samples, -1, 1) * 32767).astype('<i2').tobytes()
+
+def encode_opus(pcm: bytes, rate: int = TARGET_RATE) -> Optional[bytes]:
+    if FFMPEG is None:
+        return None
+    result = subprocess.run(
+        [FFMPEG, '-nostdin', '-loglevel', 'error', '-f', 's16le', '-ar', str(rate), '-ac', '1', '-i', 'pipe:0',
+         '-c:a', 'libopus', '-b:a', '24k', '-f', 'ogg', 'pipe:1'],
+        input=pcm, capture_output=True, timeout=60
+    )
+    return result.stdout if result.returncode == 0 and result.stdout else None
+
+def prepare_audio(data: bytes, max_segment_seconds: float = 20.0, margin_db: float = 10.0,
+                  min_silence_ms: int = 400, pad_ms: int = 200, encoding: str = "LINEAR16") -> Optional[Dict[str, Any]]:
+    """
+    Decode, resample to 16 kHz mono, drop silence and split into recognisable chunks
+
+    Runs in a worker process, so it only takes and returns plain data. Returns None
+    when the recording cannot be decoded here (e.g. webm without ffmpeg); the caller
+    then sends it as it is.
+    """
+    decoded = decode_audio(data)
+    if decoded is None:
+        return None
+    samples, rate = decoded
+    samples = resample(samples, rate)
+
+    frame = TARGET_RATE * FRAME_MS // 1000
+    active = voice_activity(frame_energy_db(samples, frame), margin_db)
+    segments = speech_segments(active, min_silence_ms // FRAME_MS, 60 // FRAME_MS, pad_ms // FRAME_MS)
+
+    groups = pack_segments(segments, int(max_segment_seconds * 1000) // FRAME_MS)
+    chunks, encoding = encode_chunks(samples, groups, encoding)
+    return {
+        "encoding": encoding,
+        "sample_rate": TARGET_RATE,
+        "segments": chunks,
+        "duration": len(samples) / TARGET_RATE,
+        "speech_duration": sum(end - start for start, end in segments) * FRAME_MS / 1000,
+    }
+
+def encode_chunks(samples: np.ndarray, groups: List[List[Tuple[int, int]]], encoding: str) -> Tuple[List[bytes], str]:
+    """
+    One encoded chunk per group of frame ranges, and the encoding they ended up in
+    """
+    frame = TARGET_RATE * FRAME_MS // 1000
+    chunks = [encode_pcm(np.concatenate([samples[start * frame:end * frame] for start, end in group])) for group in groups]
+    if encoding == "OGG_OPUS":
+        encoded = [encode_opus(pcm) for pcm in chunks]
+        # All chunks share one recognition config, so fall back to PCM if any failed
+        if all(encoded):
+            return encoded, encoding
+        return chunks, "LINEAR16"
+    return chunks, encoding
+
+def settle_frames(samples: np.ndarray, active: np.ndarray, first: int, final: bool, max_segment_seconds: float = 20.0,
+                  min_silence_ms: int = 400, pad_ms: int = 200, encoding: str = "LINEAR16") -> Dict[str, Any]:
+    """
+    Speech in the unsettled part of a recording that is still growing, split into what can no longer change and the rest
+
+    `samples` (16 kHz) and `active` (voice activity per frame) start at frame `first`
+    of the recording. Speech followed by at least `min_silence_ms` of silence is
+    settled: later audio cannot extend it. So is each full `max_segment_seconds`
+    chunk of one long utterance, and silence that later speech could not reach even
+    with its padding. Returns the settled chunks, the unsettled tail as one chunk
+    (None if there is no speech in it), and "end", the offset in seconds up to which
+    audio is settled. With `final` everything is settled.
+    """
+    min_silence = min_silence_ms // FRAME_MS
+    pad = pad_ms // FRAME_MS
+    total = len(active)
+    segments = speech_segments(active, min_silence, 60 // FRAME_MS, pad)
+
+    # Speech is settled once at least min_silence frames follow its (padded) end
+    settled_count = len(segments)
+    if not final:
+        settled_count = sum(1 for _, end in segments if end < total and total - (end - pad) >= min_silence)
+    max_frames = int(max_segment_seconds * 1000) // FRAME_MS
+    settled = pack_segments(segments[:settled_count], max_frames)
+    tail = pack_segments(segments[settled_count:], max_frames)
+    if len(tail) > 1:
+        settled += tail[:-1]
+        tail = tail[-1:]
+
+    if final:
+        end = total
+    else:
+        end = settled[-1][-1][1] if settled else 0
+        if not tail:
+            # A burst too short to count yet starts within min_speech frames of the end, padding included
+            end = max(end, total - min_silence - pad)
+    chunks, encoding = encode_chunks(samples, settled + tail, encoding)
+    return {
+        "encoding": encoding,
+        "sample_rate": TARGET_RATE,
+        "segments": chunks[:len(settled)],
+        "tail": chunks[len(settled)] if tail else None,
+        "end": (first + end) * FRAME_MS / 1000,
+    }
+
+class StreamResampler:
+    """
+    resample() for audio that arrives in pieces, continuous across their boundaries
+    """
+    def __init__(self, rate: int, target_rate: int = TARGET_RATE):
+        self.rate = rate
+        self.step = rate / target_rate
+        self.width = max(int(round(rate / target_rate)), 1)
+        self._pending = np.zeros(0, dtype=np.float32)
+        # Input index of _pending[0], next output index, and input samples seen
+        self._offset = 0
+        self._next = 0
+        self._received = 0
+
+    def push(self, samples: np.ndarray, final: bool = False) -> np.ndarray:
+        if self.rate == TARGET_RATE:
+            return samples
+        self._received += len(samples)
+        pending = np.concatenate((self._pending, samples))
+        if final and len(pending):
+            pending = np.concatenate((pending, np.full(self.width - 1, pending[-1], dtype=np.float32)))
+        cumulative = np.concatenate(([0.0], np.cumsum(pending, dtype=np.float64)))
+        smoothed = (cumulative[self.width:] - cumulative[:-self.width]) / self.width
+
+        # Interpolate only between samples already smoothed; at the end, up to resample()'s length
+        last = self._offset + len(smoothed) - 2
+        count = int(last / self.step) + 1 - self._next if last >= 0 else 0
+        if final:
+            count = int(self._received / self.step) - self._next
+        if count <= 0:
+            self._pending = pending[:len(pending) - (self.width - 1 if final else 0)]
+            return np.zeros(0, dtype=np.float32)
+        positions = (np.arange(self._next, self._next + count, dtype=np.float64) * self.step) - self._offset
+        output = np.interp(positions, np.arange(len(smoothed)), smoothed).astype(np.float32)
+        self._next += count
+
+        drop = min(int(self._next * self.step) - self._offset, len(pending))
+        self._pending = pending[drop:]
+        self._offset += drop
+        return output
+
+class StreamDecoder:
+    """
+    Decodes a recording while it is received, keeping only the audio not settled yet
+
+    WAV (and headerless LINEAR16) is converted here, anything else is piped through
+    one ffmpeg process for the whole stream, so every byte is decoded once. Frame
+    energies go into a running histogram, which gives voice_activity's noise-floor
+    threshold for the whole recording so far without rescanning it.
+    """
+    def __init__(self, encoding: str = "WEBM_OPUS", sample_rate: int = 48000, margin_db: float = 10.0,
+                 floor_db: float = -50.0):
+        self.encoding = encoding.upper()
+        self.sample_rate = sample_rate
+        self.margin_db = margin_db
+        self.floor_db = floor_db
+        self.failed = False
+        # Recording frame index of the first sample kept
+        self.first = 0
+        self._samples = np.zeros(0, dtype=np.float32)
+        self._energy = np.zeros(0, dtype=np.float32)
+        self._histogram = np.zeros(ENERGY_BINS, dtype=np.int64)
+        self._loudest = -np.inf
+        self._header = bytearray()
+        self._format: Optional[Tuple[int, int]] = None
+        self._remainder = b""
+        self._resampler: Optional[StreamResampler] = None
+        self._process = None
+        self._reader: Optional[asyncio.Task] = None
+
+    async def feed(self, chunk: bytes) -> bool:
+        """
+        Decode the next piece of the recording; False once it is known not to be decodable here
+        """
+        if self.failed:
+            return False
+        if self._process is not None:
+            try:
+                self._process.stdin.write(chunk)
+                await self._process.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                self.failed = True
+            return not self.failed
+        if self._format is not None:
+            self._add_pcm(chunk)
+            return True
+        self._header.extend(chunk)
+        await self._start()
+        return not self.failed
+
+    async def finish(self) -> bool:
+        """
+        Decode whatever is still buffered at the end of the recording; False if it could not be decoded
+        """
+        if self._process is not None:
+            if not self.failed:
+                self._process.stdin.close()
+            await self._reader
+        elif self._format is not None:
+            self._append(self._resampler.push(np.zeros(0, dtype=np.float32), final=True))
+        elif self._header:
+            # Too short to tell what it is, or a WAV header that never reached its data
+            self.failed = True
+        return not self.failed
+
+    def close(self):
+        if self._reader is not None:
+            self._reader.cancel()
+        if self._process is not None and self._process.returncode is None:
+            self._process.kill()
+
+    def window(self) -> Dict[str, Any]:
+        """
+        The unsettled audio (whole frames) and its voice activity, as settle_frames takes them
+        """
+        frame = TARGET_RATE * FRAME_MS // 1000
+        return {
+            "samples": self._samples[:len(self._energy) * frame],
+            "active": self._energy > self._threshold(),
+            "first": self.first,
+        }
+
+    def discard(self, end: float):
+        """
+        Drop the audio before `end` seconds, once it has been settled
+        """
+        frame = TARGET_RATE * FRAME_MS // 1000
+        drop = min(int(round(end * 1000 / FRAME_MS)) - self.first, len(self._energy))
+        if drop > 0:
+            self._samples = self._samples[drop * frame:]
+            self._energy = self._energy[drop:]
+            self.first += drop
+
+    def _threshold(self) -> float:
+        count = self._histogram.sum()
+        if not count:
+            return self.floor_db
+        noise_floor = ENERGY_MIN_DB + ENERGY_BIN_DB * int(np.searchsorted(np.cumsum(self._histogram), 0.1 * count))
+        return max(min(noise_floor + self.margin_db, self._loudest - 20), self.floor_db)
+
+    async def _start(self):
+        header = bytes(self._header)
+        if header[:4] == b'RIFF'[:len(header[:4])] and len(header) < 12:
+            return
+        if header[:4] == b'RIFF' and header[8:12] == b'WAVE':
+            self._start_wav(header)
+        elif self.encoding == "LINEAR16":
+            self._start_pcm(2, 1, self.sample_rate, header)
+        elif FFMPEG is not None:
+            await self._start_ffmpeg(header)
+        else:
+            self.failed = True
+
+    def _start_wav(self, header: bytes):
+        position, fmt = 12, None
+        while position + 8 <= len(header):
+            chunk_id, size = header[position:position + 4], struct.unpack('<I', header[position + 4:position + 8])[0]
+            if chunk_id == b'fmt ':
+                if position + 24 > len(header):
+                    break
+                fmt = struct.unpack('<HHIIHH', header[position + 8:position + 24])
+            elif chunk_id == b'data':
+                # PCM or WAVE_FORMAT_EXTENSIBLE, as wave reads them
+                if fmt is None or fmt[0] not in (1, 0xFFFE) or fmt[5] not in (8, 16, 24, 32):
+                    self.failed = True
+                    return
+                self._start_pcm(fmt[5] // 8, fmt[1], fmt[2], header[position + 8:])
+                return
+            position += 8 + size + (size & 1)
+        if len(header) > 65536:
+            self.failed = True
+
+    def _start_pcm(self, width: int, channels: int, rate: int, data: bytes):
+        self._format = (width, channels)
+        self._resampler = StreamResampler(rate)
+        self._header = bytearray()
+        self._add_pcm(data)
+
+    def _add_pcm(self, data: bytes):
+        width, channels = self._format
+        data = self._remainder + data
+        usable = len(data) // (width * channels) * width * channels
+        self._remainder = data[usable:]
+        if usable:
+            self._append(self._resampler.push(pcm_to_float(data[:usable], width, channels)))
+
+    async def _start_ffmpeg(self, header: bytes):
+        try:
+            self._process = await asyncio.create_subprocess_exec(
+                FFMPEG, '-nostdin', '-loglevel', 'error', '-probesize', '32768', '-analyzeduration', '0',
+                '-i', 'pipe:0', '-ac', '1', '-ar', str(TARGET_RATE), '-f', 's16le', 'pipe:1',
+                stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+            )
+        except OSError as e:
+            print(f"Error starting ffmpeg: {str(e)}")
+            self.failed = True
+            return
+        self._reader = asyncio.ensure_future(self._read_ffmpeg())
+        self._header = bytearray()
+        await self.feed(header)
+
+    async def _read_ffmpeg(self):
+        remainder = b""
+        decoded = False
+        while True:
+            data = await self._process.stdout.read(65536)
+            if not data:
+                break
+            data = remainder + data
+            usable = len(data) // 2 * 2
+            remainder = data[usable:]
+            self._append(np.frombuffer(data[:usable], dtype='<i2').astype(np.float32) / 32768)
+            decoded = True
+        if await self._process.wait() != 0 and not decoded:
+            self.failed = True
+
+    def _append(self, samples: np.ndarray):
+        if not len(samples):
+            return
+        frame = TARGET_RATE * FRAME_MS // 1000
+        self._samples = np.concatenate((self._samples, samples))
+        start = len(self._energy) * frame
+        count = (len(self._samples) - start) // frame
+        if count:
+            energy = frame_energy_db(self._samples[start:start + count * frame], frame).astype(np.float32)
+            bins = np.clip(((energy - ENERGY_MIN_DB) / ENERGY_BIN_DB).astype(np.int64), 0, ENERGY_BINS - 1)
+            self._histogram += np.bincount(bins, minlength=ENERGY_BINS)
+            self._loudest = max(self._loudest, float(energy.max()))
+            self._energy = np.concatenate((self._energy, energy))
+
+class AudioPreprocessor:
+    """
+    Runs prepare_audio on the shared worker pool (or a thread) before recordings go to Speech-to-Text
+
+    Uploads are re-encoded as OGG_OPUS when ffmpeg is available, otherwise as LINEAR16.
+    ffmpeg is a deployment requirement for browser recordings: without it only WAV can
+    be decoded, and webm/ogg clips go to Speech-to-Text untrimmed (counted as undecodable).
+    """
+    def __init__(self, pool=None, max_segment_seconds: Optional[float] = None):
+        self.pool = pool
+        self.max_segment_seconds = max_segment_seconds or float(os.getenv('AUDIO_MAX_SEGMENT_SECONDS', '20'))
+        self.margin_db = float(os.getenv('AUDIO_VAD_MARGIN_DB', '10'))
+        self.min_silence_ms = int(os.getenv('AUDIO_VAD_MIN_SILENCE_MS', '400'))
+        self.pad_ms = int(os.getenv('AUDIO_VAD_PAD_MS', '200'))
+        self.encoding = os.getenv('AUDIO_UPLOAD_ENCODING', 'OGG_OPUS' if FFMPEG else 'LINEAR16').upper()
+        self._counters = {"clips": 0, "undecodable": 0, "undecodable_streams": 0, "input_bytes": 0,
+                          "output_bytes": 0, "input_seconds": 0.0, "speech_seconds": 0.0}
+        if FFMPEG is None:
+            print("Warning: ffmpeg not found, only WAV recordings will be preprocessed")
+
+    async def prepare(self, data: bytes) -> Optional[Dict[str, Any]]:
+        """
+        Chunks to recognise, or None to send the original recording
+        """
+        prepared = await self._run(
+            prepare_audio, data, self.max_segment_seconds, self.margin_db, self.min_silence_ms, self.pad_ms, self.encoding
+        )
+
+        self._counters["clips"] += 1
+        if prepared is None:
+            self._counters["undecodable"] += 1
+            self._report_undecodable(len(data))
+            return None
+        self._counters["input_bytes"] += len(data)
+        self._counters["output_bytes"] += sum(len(segment) for segment in prepared["segments"])
+        self._counters["input_seconds"] += prepared["duration"]
+        self._counters["speech_seconds"] += prepared["speech_duration"]
+        return prepared
+
+    def open_stream(self, encoding: str = "WEBM_OPUS", sample_rate: int = 48000) -> StreamDecoder:
+        """
+        Decoder for a recording that is still being received
+        """
+        return StreamDecoder(encoding, sample_rate, self.margin_db)
+
+    async def settle(self, decoder: StreamDecoder, final: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        settle_frames over the decoder's unsettled audio, dropping what it settled; None on an error
+        """
+        window = decoder.window()
+        settled = await self._run(
+            settle_frames, window["samples"], window["active"], window["first"], final, self.max_segment_seconds,
+            self.min_silence_ms, self.pad_ms, self.encoding
+        )
+        if settled is not None:
+            decoder.discard(settled["end"])
+        return settled
+
+    def undecodable_stream(self, received: int):
+        """
+        Count and log a streamed recording that has to be sent as it is
+        """
+        self._counters["undecodable_streams"] += 1
+        self._report_undecodable(received)
+
+    async def _run(self, function, *args) -> Optional[Dict[str, Any]]:
+        try:
+            if self.pool is not None:
+                return await self.pool.run(function, *args)
+            return await asyncio.to_thread(function, *args)
+        except Exception as e:
+            print(f"Error preprocessing audio: {str(e)}")
+            return None
+
+    def _report_undecodable(self, size: int):
+        reason = "" if FFMPEG else " (ffmpeg not installed)"
+        print(f"Warning: could not decode {size} byte recording{reason}, sending it to Speech-to-Text as is")
+
+    def get_stats(self) -> Dict[str, Any]:
+        counters = dict(self._counters)
+        counters["input_seconds"] = round(counters["input_seconds"], 2)
+        counters["speech_seconds"] = round(counters["speech_seconds"], 2)
+        counters["ffmpeg"] = FFMPEG is not None
+        return counters
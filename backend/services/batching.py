@@ -0,0 +1,102 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Generic, List, Optional, Tuple, TypeVar, Union
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+class MicroBatcher(Generic[T, R]):
+    """
+    Groups concurrent submissions into batches for one call to `process_batch`
+
+    With `eager` set, submissions go out immediately while fewer than
+    `max_concurrency` batches are running (and queued ones as soon as a slot frees),
+    so an idle batcher adds no latency and batch sizes grow with load. Otherwise
+    submissions queue and are dispatched when `max_batch_size` are waiting or after
+    `max_wait` seconds, whichever comes first.
+
+    `process_batch` returns one entry per item, in order; an exception instance in
+    place of a result fails only that item, while an exception raised by
+    `process_batch` fails the whole batch.
+    """
+    def __init__(self, name: str, process_batch: Callable[[List[T]], Awaitable[List[Union[R, BaseException]]]],
+                 max_batch_size: int = 16, max_wait: float = 0.01, max_concurrency: int = 1,
+                 eager: bool = True):
+        self.name = name
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_concurrency = max_concurrency
+        self.eager = eager
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._pending: List[Tuple[T, asyncio.Future, float]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._running: set = set()
+        self._counters = {"items": 0, "batches": 0, "full_batches": 0, "failed_items": 0, "max_batch_size": 0}
+        self._queue_wait_total = 0.0
+
+    async def submit(self, item: T) -> R:
+        """
+        Queue an item and wait for its own result
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, future, time.perf_counter()))
+        if len(self._pending) >= self.max_batch_size or (self.eager and len(self._running) < self.max_concurrency):
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        return await future
+
+    def stats(self) -> Dict[str, Any]:
+        counters: Dict[str, Any] = dict(self._counters)
+        counters["name"] = self.name
+        counters["pending"] = len(self._pending)
+        counters["mean_batch_size"] = round(counters["items"] / counters["batches"], 2) if counters["batches"] else 0.0
+        counters["mean_queue_wait_ms"] = round(self._queue_wait_total / counters["items"] * 1000, 3) if counters["items"] else 0.0
+        return counters
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            batch, self._pending = self._pending[:self.max_batch_size], self._pending[self.max_batch_size:]
+            task = asyncio.ensure_future(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._batch_done)
+            # A partial remainder waits for more items instead of going out as a tiny batch
+            if len(self._pending) < self.max_batch_size:
+                break
+        if self._pending and self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+
+    def _batch_done(self, task: asyncio.Task):
+        self._running.discard(task)
+        if self.eager and self._pending and len(self._running) < self.max_concurrency:
+            self._flush()
+
+    async def _run(self, batch: List[Tuple[T, asyncio.Future, float]]):
+        async with self._semaphore:
+            started = time.perf_counter()
+            self._counters["items"] += len(batch)
+            self._counters["batches"] += 1
+            self._counters["max_batch_size"] = max(self._counters["max_batch_size"], len(batch))
+            if len(batch) == self.max_batch_size:
+                self._counters["full_batches"] += 1
+            self._queue_wait_total += sum(started - queued for _, _, queued in batch)
+
+            try:
+                results = await self.process_batch([item for item, _, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"{self.name}: batch of {len(batch)} returned {len(results)} results")
+            except Exception as e:
+                results = [e] * len(batch)
+
+            for (_, future, _), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, BaseException):
+                    self._counters["failed_items"] += 1
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
@@ -0,0 +1,170 @@
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from services.coalescing import SingleFlight
+
+class LRUCache:
+    """
+    In-process LRU map storing (value, stored_at) pairs
+    """
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Tuple[Any, float]]:
+        entry = self._data.get(key)
+        if entry is not None:
+            self._data.move_to_end(key)
+        return entry
+
+    def set(self, key: Hashable, value: Any, stored_at: Optional[float] = None):
+        self._data[key] = (value, stored_at if stored_at is not None else time.time())
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+class MongoCacheTier:
+    """
+    Shared cache tier backed by a Mongo collection, so all workers see the same entries
+    """
+    def __init__(self, collection, max_age: float):
+        self.collection = collection
+        self.max_age = max_age
+        self._index_ready = False
+
+    async def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        doc = await self.collection.find_one({"_id": key})
+        if not doc:
+            return None
+        return doc["value"], doc["stored_at"]
+
+    async def set(self, key: str, value: Any, stored_at: float):
+        if not self._index_ready:
+            # Mongo's TTL monitor drops entries once they are too old to serve even as stale
+            await self.collection.create_index("expires_at", expireAfterSeconds=0)
+            self._index_ready = True
+
+        await self.collection.replace_one(
+            {"_id": key},
+            {
+                "_id": key,
+                "value": value,
+                "stored_at": stored_at,
+                "expires_at": datetime.utcnow() + timedelta(seconds=self.max_age)
+            },
+            upsert=True
+        )
+
+class TieredCache:
+    """
+    LRU + TTL cache with an optional shared tier, stale-while-revalidate and single-flight fetches
+    """
+    def __init__(self, name: str, ttl: float, stale_ttl: float = 0, max_entries: int = 1024,
+                 shared_tier: Optional[MongoCacheTier] = None,
+                 encode: Callable[[Any], Any] = lambda value: value,
+                 decode: Callable[[Any], Any] = lambda value: value):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.local = LRUCache(max_entries)
+        self.shared_tier = shared_tier
+        self.encode = encode
+        self.decode = decode
+        self.flight = SingleFlight(name)
+        self._counters = {
+            "hits": 0,
+            "stale_hits": 0,
+            "shared_hits": 0,
+            "coalesced": 0,
+            "misses": 0,
+            "refreshes": 0,
+            "refresh_errors": 0
+        }
+
+    async def get_or_fetch(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Return the cached value for key, fetching it at most once concurrently on a miss
+        """
+        entry = self.local.get(key)
+        source = "hits"
+        if entry is None and self.shared_tier is not None:
+            entry = await self._get_shared(key)
+            source = "shared_hits"
+
+        if entry is not None:
+            value, stored_at = entry
+            age = time.time() - stored_at
+            if age < self.ttl:
+                self._counters[source] += 1
+                return value
+            if age < self.ttl + self.stale_ttl:
+                # Serve stale and revalidate in the background
+                self._counters["stale_hits"] += 1
+                if not self.flight.is_inflight(key):
+                    self._counters["refreshes"] += 1
+                    self.flight.start(key, lambda: self._fetch_and_store(key, fetch))
+                return value
+            self.local.pop(key)
+
+        if self.flight.is_inflight(key):
+            self._counters["coalesced"] += 1
+        else:
+            self._counters["misses"] += 1
+            self._counters["refreshes"] += 1
+        return await self.flight.do(key, lambda: self._fetch_and_store(key, fetch))
+
+    def invalidate(self, key: str):
+        self.local.pop(key)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Hit/miss counters and hit ratio for this cache
+        """
+        counters = dict(self._counters)
+        served = counters["hits"] + counters["stale_hits"] + counters["shared_hits"] + counters["coalesced"]
+        total = served + counters["misses"]
+        counters["name"] = self.name
+        counters["entries"] = len(self.local)
+        counters["inflight"] = self.flight.inflight
+        counters["hit_ratio"] = round(served / total, 4) if total else 0.0
+        return counters
+
+    async def _get_shared(self, key: str) -> Optional[Tuple[Any, float]]:
+        try:
+            entry = await self.shared_tier.get(key)
+        except Exception as e:
+            print(f"Error reading shared cache {self.name}: {str(e)}")
+            return None
+
+        if entry is None:
+            return None
+
+        value, stored_at = self.decode(entry[0]), entry[1]
+        self.local.set(key, value, stored_at)
+        return value, stored_at
+
+    async def _fetch_and_store(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await fetch()
+        except Exception:
+            self._counters["refresh_errors"] += 1
+            raise
+
+        stored_at = time.time()
+        self.local.set(key, value, stored_at)
+        if self.shared_tier is not None:
+            try:
+                await self.shared_tier.set(key, self.encode(value), stored_at)
+            except Exception as e:
+                print(f"Error writing shared cache {self.name}: {str(e)}")
+        return value
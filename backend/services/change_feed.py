@@ -0,0 +1,291 @@
+import asyncio
+import os
+from typing import Any, AsyncIterator, Dict, Iterable, Optional, Set, Tuple
+from pymongo.errors import OperationFailure, PyMongoError
+from services.fast_json import dumps
+
+# Returned by a standalone mongod: change streams read the oplog, which only replica set members keep
+CHANGE_STREAM_UNSUPPORTED = 40573
+
+WATCHED_OPERATIONS = ["insert", "update", "replace", "delete"]
+
+# Stored on task documents but not part of the Task API model
+TASK_STORAGE_FIELDS = ("_id", "generation_key")
+
+class Event:
+    """
+    One change as clients receive it, encoded once and shared by every subscriber it goes to
+    """
+    def __init__(self, name: str, data: bytes):
+        self.name = name
+        self.data = data
+        self.sse = b"event: " + name.encode('ascii') + b"\ndata: " + data + b"\n\n"
+        self.message = '{"event":"' + name + '","data":' + data.decode('utf-8') + '}'
+
+# Sent in place of a backlog the client fell too far behind on; it should reload what it shows
+RESYNC = Event("resync", b"{}")
+# Sent on idle connections so proxies keep them open and dropped clients are noticed
+KEEPALIVE = Event("keepalive", b"{}")
+
+class Subscription:
+    """
+    One connected client: the user whose tasks it follows, the commodities (and state) whose prices it follows
+    """
+    def __init__(self, user_id: str, commodities: Iterable[str] = (), state: Optional[str] = None, queue_size: int = 256):
+        self.user_id = user_id
+        self.commodities = {commodity.strip().lower() for commodity in commodities if commodity.strip()}
+        self.state = state.strip().lower() if state and state.strip() else None
+        self.queue: asyncio.Queue = asyncio.Queue(queue_size)
+        self.dropped = 0
+
+    def offer(self, event: Event) -> bool:
+        """
+        Queue an event without waiting; a full queue is replaced by a single resync event
+        """
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            self.dropped += self.queue.qsize()
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+            return False
+
+class ChangeFeed:
+    """
+    Fans task and mandi price changes out to connected clients
+
+    Subscriptions are indexed in memory by user id and by commodity, so a change
+    only touches the clients it concerns: a task goes to its owner's connections,
+    a price row to the clients following that commodity (in that state, when they
+    gave one). Each change is encoded once, whatever the number of recipients.
+
+    Without pre-images a task delete only carries the document's _id, so the owner
+    and task id of every task a subscribed user has are kept in memory: seeded by
+    track_tasks() when the user subscribes, then updated from the change events.
+    """
+    def __init__(self, queue_size: Optional[int] = None, heartbeat: Optional[float] = None):
+        self.queue_size = queue_size or int(os.getenv('CHANGE_FEED_QUEUE_SIZE', '256'))
+        self.heartbeat = heartbeat or float(os.getenv('CHANGE_FEED_HEARTBEAT_SECONDS', '20'))
+        self._by_user: Dict[str, Set[Subscription]] = {}
+        self._by_commodity: Dict[str, Set[Subscription]] = {}
+        # _id -> (user_id, task id) for subscribed users' tasks, and each user's _ids
+        self._task_owners: Dict[Any, Tuple[str, Optional[str]]] = {}
+        self._tasks_by_user: Dict[str, Set[Any]] = {}
+        self.changes = 0
+        self.deliveries = 0
+        self.resyncs = 0
+
+    @property
+    def subscribers(self) -> int:
+        return sum(len(subscriptions) for subscriptions in self._by_user.values())
+
+    def subscribe(self, user_id: str, commodities: Iterable[str] = (), state: Optional[str] = None) -> Subscription:
+        subscription = Subscription(user_id, commodities, state, self.queue_size)
+        self._by_user.setdefault(user_id, set()).add(subscription)
+        for commodity in subscription.commodities:
+            self._by_commodity.setdefault(commodity, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        for index, keys in ((self._by_user, [subscription.user_id]), (self._by_commodity, subscription.commodities)):
+            for key in keys:
+                subscriptions = index.get(key)
+                if subscriptions is not None:
+                    subscriptions.discard(subscription)
+                    if not subscriptions:
+                        del index[key]
+        if subscription.user_id not in self._by_user:
+            for key in self._tasks_by_user.pop(subscription.user_id, ()):
+                self._task_owners.pop(key, None)
+
+    def track_tasks(self, user_id: str, documents: Iterable[Dict[str, Any]]):
+        """
+        Remember the _id and id of a subscribed user's stored tasks, so their deletes can be routed
+        """
+        if user_id not in self._by_user:
+            return
+        for document in documents:
+            self._remember_task(document.get("_id"), user_id, document.get("id"))
+
+    async def listen(self, subscription: Subscription) -> AsyncIterator[Event]:
+        """
+        The subscription's events as they arrive, keepalives included
+        """
+        while True:
+            yield await subscription.queue.get()
+
+    async def heartbeats(self):
+        """
+        Every CHANGE_FEED_HEARTBEAT_SECONDS, queue a keepalive for each subscription with nothing queued
+
+        One timer for all connections: a timeout on every queue get costs a task per
+        delivered event, which made fan-out to thousands of clients ten times slower.
+        """
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            for subscriptions in list(self._by_user.values()):
+                for subscription in subscriptions:
+                    if subscription.queue.empty():
+                        subscription.offer(KEEPALIVE)
+
+    def dispatch(self, kind: str, change: Dict[str, Any]) -> int:
+        """
+        Queue one change stream event for the subscriptions it concerns; returns how many it went to
+        """
+        if kind == "task":
+            event, targets = self._task_event(change)
+        else:
+            event, targets = self._price_event(change)
+        self.changes += 1
+        if event is None or not targets:
+            return 0
+
+        for subscription in targets:
+            if not subscription.offer(event):
+                self.resyncs += 1
+        self.deliveries += len(targets)
+        return len(targets)
+
+    async def follow(self, source, kind: str):
+        """
+        Dispatch every change of a source (MongoChangeSource or LocalChangeSource) as `kind` events
+        """
+        async for change in source.changes():
+            try:
+                self.dispatch(kind, change)
+            except Exception as e:
+                print(f"Error dispatching {kind} change: {str(e)}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "subscribers": self.subscribers,
+            "users": len(self._by_user),
+            "commodities": len(self._by_commodity),
+            "changes": self.changes,
+            "deliveries": self.deliveries,
+            "resyncs": self.resyncs,
+            "tracked_tasks": len(self._task_owners)
+        }
+
+    def _remember_task(self, key: Any, user_id: str, task_id: Optional[str]):
+        if key is None:
+            return
+        self._task_owners[key] = (user_id, task_id)
+        self._tasks_by_user.setdefault(user_id, set()).add(key)
+
+    def _forget_task(self, key: Any) -> Optional[Tuple[str, Optional[str]]]:
+        owner = self._task_owners.pop(key, None)
+        if owner is not None:
+            self._tasks_by_user.get(owner[0], set()).discard(key)
+        return owner
+
+    def _task_event(self, change: Dict[str, Any]):
+        operation = change.get("operationType")
+        key = (change.get("documentKey") or {}).get("_id")
+        if operation == "delete":
+            # Deletes only carry the document when pre-images are enabled on the collection
+            document = change.get("fullDocumentBeforeChange")
+            owner = self._forget_task(key)
+            if document and "user_id" in document:
+                owner = (document["user_id"], document.get("id"))
+            if owner is None:
+                return None, None
+            targets = self._by_user.get(owner[0])
+            if not targets:
+                return None, None
+            return Event("task", dumps({"operation": operation, "id": owner[1]})), list(targets)
+
+        document = change.get("fullDocument")
+        if not document or "user_id" not in document:
+            return None, None
+        targets = self._by_user.get(document["user_id"])
+        if not targets:
+            return None, None
+
+        self._remember_task(key, document["user_id"], document.get("id"))
+        payload = {"operation": operation, "task": {k: v for k, v in document.items() if k not in TASK_STORAGE_FIELDS}}
+        return Event("task", dumps(payload)), list(targets)
+
+    def _price_event(self, change: Dict[str, Any]):
+        document = change.get("fullDocument")
+        if change.get("operationType") == "delete" or not document:
+            return None, None
+        subscriptions = self._by_commodity.get(str(document.get("commodity", "")).lower())
+        if not subscriptions:
+            return None, None
+        state = str(document.get("state", "")).lower()
+        targets = [subscription for subscription in subscriptions if subscription.state in (None, state)]
+        if not targets:
+            return None, None
+
+        payload = {"operation": change["operationType"], "price": {k: v for k, v in document.items() if k != "_id"}}
+        return Event("price", dumps(payload)), targets
+
+class MongoChangeSource:
+    """
+    Change events of one collection, resumed from the last seen token after a dropped connection
+
+    Change streams need a replica set. For development, a single-node one is
+    enough (mongod --replSet rs0, then rs.initiate() once). Against a standalone
+    server the source reports that once and ends, and clients fall back to loading.
+    """
+    def __init__(self, collection, pre_images: Optional[bool] = None, retry_seconds: Optional[float] = None):
+        self.collection = collection
+        # Needs MongoDB 6.0 and changeStreamPreAndPostImages enabled on the collection
+        self.pre_images = pre_images if pre_images is not None else os.getenv('CHANGE_FEED_PRE_IMAGES', 'false').lower() == 'true'
+        self.retry_seconds = retry_seconds or float(os.getenv('CHANGE_FEED_RETRY_SECONDS', '5'))
+        self.resume_token = None
+
+    async def changes(self) -> AsyncIterator[Dict[str, Any]]:
+        pipeline = [{"$match": {"operationType": {"$in": WATCHED_OPERATIONS}}}]
+        while True:
+            try:
+                async with self.collection.watch(
+                    pipeline,
+                    full_document='updateLookup',
+                    full_document_before_change='whenAvailable' if self.pre_images else None,
+                    # start_after, unlike resume_after, also resumes past an invalidate (dropped collection)
+                    start_after=self.resume_token
+                ) as stream:
+                    async for change in stream:
+                        self.resume_token = stream.resume_token
+                        yield change
+            except OperationFailure as e:
+                if e.code == CHANGE_STREAM_UNSUPPORTED:
+                    print(f"Change streams unavailable for {self.collection.name}: MongoDB is not a replica set")
+                    return
+                print(f"Change stream on {self.collection.name} failed: {str(e)}")
+            except PyMongoError as e:
+                print(f"Change stream on {self.collection.name} interrupted: {str(e)}")
+            await asyncio.sleep(self.retry_seconds)
+
+class LocalChangeSource:
+    """
+    In-process stand-in for a collection's change stream, for benchmarks and for running without a replica set
+
+    publish() takes a document as written and emits the change event MongoDB would.
+    Like MongoChangeSource, deletes carry the document only when `pre_images` is set.
+    """
+    def __init__(self, pre_images: bool = False):
+        self.pre_images = pre_images
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._sequence = 0
+
+    def publish(self, operation: str, document: Dict[str, Any]):
+        self._sequence += 1
+        change = {
+            "_id": {"_data": f"{self._sequence:016x}"},
+            "operationType": operation,
+            "documentKey": {"_id": document.get("_id")}
+        }
+        if operation != "delete":
+            change["fullDocument"] = document
+        elif self.pre_images:
+            change["fullDocumentBeforeChange"] = document
+        self._queue.put_nowait(change)
+
+    async def changes(self) -> AsyncIterator[Dict[str, Any]]:
+        while True:
+            yield await self._queue.get()
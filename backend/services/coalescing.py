@@ -0,0 +1,94 @@
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List
+
+def coalesce_key(*parts: Any) -> str:
+    """
+    Stable key for a request from its identifying parts (large payloads are hashed, not stored)
+    """
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+class SingleFlight:
+    """
+    Shares one in-flight upstream call between all concurrent callers with the same key
+    """
+    def __init__(self, name: str, max_tracked_keys: int = 1000):
+        self.name = name
+        self.max_tracked_keys = max_tracked_keys
+        self.calls = 0
+        self.executions = 0
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._waiters: Dict[Hashable, int] = {}
+        # key -> [calls, executions, max fan-in], for the most recently finished keys
+        self._per_key: "OrderedDict[Hashable, List[int]]" = OrderedDict()
+
+    @property
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+    def is_inflight(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Await fn() for key, joining the call already in flight if there is one
+        """
+        # Shield so one cancelled caller does not cancel the call the others are sharing
+        return await asyncio.shield(self.start(key, fn))
+
+    def start(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        """
+        Start fn() for key unless it is already running, and return the shared future
+        """
+        self.calls += 1
+        future = self._inflight.get(key)
+        if future is not None:
+            self._waiters[key] += 1
+            return future
+
+        self.executions += 1
+        future = asyncio.ensure_future(fn())
+        self._inflight[key] = future
+        self._waiters[key] = 1
+        future.add_done_callback(lambda done: self._finish(key, done))
+        return future
+
+    def stats(self, top: int = 10) -> Dict[str, Any]:
+        """
+        Calls saved by coalescing overall and for the keys with the largest fan-in
+        """
+        coalesced = self.calls - self.executions
+        busiest = sorted(self._per_key.items(), key=lambda item: item[1][0] - item[1][1], reverse=True)[:top]
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": coalesced,
+            "saved_ratio": round(coalesced / self.calls, 4) if self.calls else 0.0,
+            "inflight": self.inflight,
+            "top_keys": [
+                {"key": str(key)[:80], "calls": calls, "executions": executions, "max_fan_in": max_fan_in}
+                for key, (calls, executions, max_fan_in) in busiest
+            ]
+        }
+
+    def _finish(self, key: Hashable, future: asyncio.Future):
+        self._inflight.pop(key, None)
+        fan_in = self._waiters.pop(key, 1)
+
+        record = self._per_key.pop(key, None) or [0, 0, 0]
+        record[0] += fan_in
+        record[1] += 1
+        record[2] = max(record[2], fan_in)
+        self._per_key[key] = record
+        while len(self._per_key) > self.max_tracked_keys:
+            self._per_key.popitem(last=False)
+
+        # Mark the exception retrieved; callers that awaited the future have already seen it
+        if not future.cancelled():
+            future.exception()
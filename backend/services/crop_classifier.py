@@ -0,0 +1,334 @@
+import asyncio
+import io
+import json
+import os
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+from models.crop_analysis import CropAnalysisResult, DiseaseAnalysis, Treatment
+from services.batching import MicroBatcher
+from services.image_preprocess import ImagePreprocessor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it there is no local classification
+    Image = None
+    ImageOps = None
+
+try:
+    import onnxruntime
+except ImportError:  # ONNX models are only used when onnxruntime is installed
+    onnxruntime = None
+
+FEATURE_SIDE = 96
+ONNX_INPUT_SIDE = 224
+
+# Colour-symptom features: share of plant pixels that are
+# [green, yellow, orange-rust, brown, white-powdery, dark-necrotic]
+FEATURES = ["green", "yellow", "rust", "brown", "white", "dark"]
+
+# Frames where less than this share of pixels is green or yellow leaf tissue (a dark
+# photo, soil, a wall) are not classified locally
+MIN_LEAF_SHARE = 0.05
+
+# Default NumPy model: a softmax over colour-symptom features. A trained model can
+# replace it via CROP_MODEL_PATH (.npz with W, b, labels and optionally scale and
+# max_confidence, or .onnx with a <model>.labels.json list alongside).
+DEFAULT_LABELS = ["healthy", "early_blight", "late_blight", "leaf_rust", "powdery_mildew", "leaf_yellowing"]
+# Lesion colours weigh far more than green: a leaf with a tenth of its area spotted is not healthy
+DEFAULT_WEIGHTS = np.array([
+    [8.0, -40.0, -40.0, -40.0, -40.0, -40.0],
+    [0.0, 8.0, 0.0, 40.0, 0.0, 12.0],
+    [0.0, 0.0, 0.0, 15.0, 8.0, 40.0],
+    [0.0, 0.0, 45.0, 8.0, 0.0, 0.0],
+    [0.0, 0.0, 0.0, 0.0, 40.0, 0.0],
+    [0.0, 20.0, 0.0, 0.0, 0.0, 0.0]
+], dtype=np.float32)
+DEFAULT_BIAS = np.zeros(len(DEFAULT_LABELS), dtype=np.float32)
+DEFAULT_SCALE = 1.0
+# The hand-set weights are not calibrated, so their scores stay below the default
+# CROP_LOCAL_MIN_CONFIDENCE and are never served as a diagnosis. They exist for
+# development; server.py only enables the classifier via CROP_LOCAL_MODEL_ENABLED
+DEFAULT_MAX_CONFIDENCE = 0.6
+
+DISEASE_CATALOG = {
+    "healthy": {
+        "name": "Healthy",
+        "name_hindi": "स्वस्थ",
+        "symptoms": "No visible disease symptoms",
+        "symptoms_hindi": "कोई रोग लक्षण दिखाई नहीं दे रहे",
+        "causes": "Crop is growing normally",
+        "causes_hindi": "फसल सामान्य रूप से बढ़ रही है",
+        "prevention": "Continue regular monitoring, balanced fertiliser and irrigation",
+        "prevention_hindi": "नियमित निगरानी, संतुलित खाद और सिंचाई जारी रखें",
+        "treatments": [
+            ("Keep Monitoring", "निगरानी जारी रखें", "Check leaves every week for new spots", "हर सप्ताह पत्तियों पर नए धब्बों की जांच करें", "👀", "low")
+        ]
+    },
+    "early_blight": {
+        "name": "Early Blight",
+        "name_hindi": "प्रारंभिक झुलसा",
+        "symptoms": "Brown spots with rings on older leaves, yellowing around spots",
+        "symptoms_hindi": "पुरानी पत्तियों पर छल्लेदार भूरे धब्बे, धब्बों के आसपास पीलापन",
+        "causes": "Alternaria fungus, favoured by warm humid weather",
+        "causes_hindi": "अल्टरनेरिया फफूंद, गर्म और नम मौसम में बढ़ता है",
+        "prevention": "Crop rotation, remove plant debris, avoid overhead watering",
+        "prevention_hindi": "फसल चक्र अपनाएं, पौधों के अवशेष हटाएं, ऊपर से पानी न दें",
+        "treatments": [
+            ("Fungicide Application", "फफूंदनाशक का प्रयोग", "Spray mancozeb or chlorothalonil every 7-10 days", "हर 7-10 दिन में मैंकोज़ेब या क्लोरोथालोनिल का छिड़काव करें", "🧪", "high"),
+            ("Remove Infected Parts", "संक्रमित हिस्से हटाएं", "Prune and destroy infected lower leaves", "संक्रमित निचली पत्तियों को काटकर नष्ट करें", "✂️", "high")
+        ]
+    },
+    "late_blight": {
+        "name": "Late Blight",
+        "name_hindi": "पछेती झुलसा",
+        "symptoms": "Dark water-soaked patches that spread quickly, white growth under leaves",
+        "symptoms_hindi": "गहरे पानी जैसे धब्बे जो तेजी से फैलते हैं, पत्तियों के नीचे सफेद फफूंद",
+        "causes": "Phytophthora infestans, spreads in cool wet weather",
+        "causes_hindi": "फाइटोफ्थोरा इन्फेस्टान्स, ठंडे और गीले मौसम में फैलता है",
+        "prevention": "Use resistant varieties, ensure drainage, avoid dense planting",
+        "prevention_hindi": "प्रतिरोधी किस्में लगाएं, जल निकासी रखें, घनी बुवाई से बचें",
+        "treatments": [
+            ("Systemic Fungicide", "प्रणालीगत फफूंदनाशक", "Spray metalaxyl + mancozeb immediately and repeat after 7 days", "तुरंत मेटालैक्सिल + मैंकोज़ेब का छिड़काव करें और 7 दिन बाद दोहराएं", "🧪", "high"),
+            ("Destroy Infected Plants", "संक्रमित पौधे नष्ट करें", "Uproot and burn badly infected plants", "बुरी तरह संक्रमित पौधों को उखाड़कर जला दें", "🔥", "high")
+        ]
+    },
+    "leaf_rust": {
+        "name": "Leaf Rust",
+        "name_hindi": "पत्ती का रतुआ",
+        "symptoms": "Orange-brown powdery pustules on leaves",
+        "symptoms_hindi": "पत्तियों पर नारंगी-भूरे चूर्णी फफोले",
+        "causes": "Rust fungus spread by wind, favoured by moderate temperature and dew",
+        "causes_hindi": "हवा से फैलने वाली रतुआ फफूंद, मध्यम तापमान और ओस में बढ़ती है",
+        "prevention": "Grow resistant varieties and sow on time",
+        "prevention_hindi": "प्रतिरोधी किस्में उगाएं और समय पर बुवाई करें",
+        "treatments": [
+            ("Fungicide Spray", "फफूंदनाशक छिड़काव", "Spray propiconazole at first sign of pustules", "फफोले दिखते ही प्रोपिकोनाज़ोल का छिड़काव करें", "🧪", "high")
+        ]
+    },
+    "powdery_mildew": {
+        "name": "Powdery Mildew",
+        "name_hindi": "चूर्णिल आसिता",
+        "symptoms": "White powdery coating on leaves and stems",
+        "symptoms_hindi": "पत्तियों और तनों पर सफेद चूर्ण जैसी परत",
+        "causes": "Fungus favoured by dry days and humid nights",
+        "causes_hindi": "सूखे दिन और नम रातों में बढ़ने वाली फफूंद",
+        "prevention": "Good spacing and sunlight, avoid excess nitrogen",
+        "prevention_hindi": "उचित दूरी और धूप रखें, अधिक नाइट्रोजन से बचें",
+        "treatments": [
+            ("Sulphur Spray", "गंधक का छिड़काव", "Spray wettable sulphur every 10 days", "हर 10 दिन में घुलनशील गंधक का छिड़काव करें", "🧪", "high"),
+            ("Improve Ventilation", "हवा की आवाजाही बढ़ाएं", "Ensure proper spacing between plants for air circulation", "हवा के संचार के लिए पौधों के बीच उचित दूरी बनाए रखें", "🌬️", "medium")
+        ]
+    },
+    "leaf_yellowing": {
+        "name": "Leaf Yellowing (Chlorosis)",
+        "name_hindi": "पत्तियों का पीलापन",
+        "symptoms": "Leaves turning yellow, sometimes curling",
+        "symptoms_hindi": "पत्तियां पीली पड़ना, कभी-कभी मुड़ना",
+        "causes": "Nutrient deficiency, waterlogging or viral infection spread by whitefly",
+        "causes_hindi": "पोषक तत्वों की कमी, जलभराव या सफेद मक्खी से फैला वायरस",
+        "prevention": "Balanced fertiliser, proper drainage, control whitefly",
+        "prevention_hindi": "संतुलित खाद, उचित जल निकासी, सफेद मक्खी पर नियंत्रण",
+        "treatments": [
+            ("Nutrient Spray", "पोषक तत्व छिड़काव", "Apply micronutrient mix with zinc and iron", "जिंक और आयरन युक्त सूक्ष्म पोषक मिश्रण डालें", "🌱", "medium"),
+            ("Whitefly Control", "सफेद मक्खी नियंत्रण", "Use yellow sticky traps and neem oil spray", "पीले चिपचिपे जाल और नीम तेल का छिड़काव करें", "🪰", "medium")
+        ]
+    }
+}
+
+def _color_counts(image: "Image.Image") -> Tuple[np.ndarray, int]:
+    """
+    Pixel count of each colour-symptom class (see FEATURES), and the number of pixels looked at
+    """
+    small = image.copy()
+    small.thumbnail((FEATURE_SIDE, FEATURE_SIDE))
+    hsv = np.asarray(small.convert('HSV'), dtype=np.int16)
+    hue, saturation, value = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+
+    # PIL hue is 0-255 for 0-360°
+    dark = value < 50
+    white = (saturation < 35) & (value > 180)
+    coloured = (saturation >= 60) & ~dark
+    green = coloured & (hue >= 50) & (hue < 120)
+    yellow = coloured & (hue >= 30) & (hue < 50) & (value >= 130)
+    rust = coloured & (hue >= 8) & (hue < 30) & (value >= 130)
+    brown = coloured & (hue < 50) & (value < 130) | (coloured & (hue >= 240))
+
+    classes = np.stack([green, yellow, rust, brown, white, dark]).reshape(len(FEATURES), -1)
+    return classes.sum(axis=1).astype(np.float32), classes.shape[1]
+
+def color_features(image: "Image.Image") -> np.ndarray:
+    """
+    Share of plant pixels in each colour-symptom class (see FEATURES)
+    """
+    counts, _ = _color_counts(image)
+    return counts / max(counts.sum(), 1.0)
+
+def leaf_share(image: "Image.Image") -> float:
+    """
+    Share of the whole frame that is green or yellow leaf tissue
+    """
+    counts, pixels = _color_counts(image)
+    return float(counts[0] + counts[1]) / max(pixels, 1)
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return shifted / shifted.sum(axis=1, keepdims=True)
+
+class NumpyModel:
+    """
+    Softmax classifier over colour-symptom features
+    """
+    input_side = FEATURE_SIDE
+
+    def __init__(self, path: Optional[Path] = None):
+        if path is not None:
+            with np.load(path) as saved:
+                self.weights, self.bias = saved['W'].astype(np.float32), saved['b'].astype(np.float32)
+                self.labels = [str(label) for label in saved['labels']]
+                self.scale = float(saved['scale']) if 'scale' in saved else 1.0
+                self.max_confidence = float(saved['max_confidence']) if 'max_confidence' in saved else 1.0
+        else:
+            self.weights, self.bias, self.labels, self.scale = DEFAULT_WEIGHTS, DEFAULT_BIAS, DEFAULT_LABELS, DEFAULT_SCALE
+            self.max_confidence = DEFAULT_MAX_CONFIDENCE
+
+    def predict(self, images: List["Image.Image"]) -> np.ndarray:
+        features = np.stack([color_features(image) for image in images])
+        return _softmax(self.scale * (features @ self.weights.T + self.bias))
+
+class OnnxModel:
+    """
+    Image classifier exported to ONNX, taking N x 3 x 224 x 224 ImageNet-normalised input
+    """
+    MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)[:, None, None]
+    STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)[:, None, None]
+    input_side = ONNX_INPUT_SIDE
+
+    def __init__(self, path: Path):
+        options = onnxruntime.SessionOptions()
+        # One thread per session: parallelism comes from the worker processes
+        options.intra_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(str(path), options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.max_confidence = 1.0
+        with open(path.with_suffix('.labels.json'), encoding='utf-8') as f:
+            self.labels = json.load(f)
+
+    def predict(self, images: List["Image.Image"]) -> np.ndarray:
+        batch = np.stack([
+            (np.asarray(image.resize((ONNX_INPUT_SIDE, ONNX_INPUT_SIDE), Image.Resampling.BILINEAR), dtype=np.float32)
+             .transpose(2, 0, 1) / 255.0 - self.MEAN) / self.STD
+            for image in images
+        ]).astype(np.float32)
+        logits = self.session.run(None, {self.input_name: batch})[0]
+        return _softmax(logits)
+
+# Loaded once per worker process
+_models: Dict[str, Union[NumpyModel, OnnxModel]] = {}
+
+def load_model(model_path: str = "") -> Union[NumpyModel, OnnxModel]:
+    model = _models.get(model_path)
+    if model is None:
+        path = Path(model_path) if model_path else None
+        if path is not None and path.suffix == '.onnx' and onnxruntime is not None:
+            model = OnnxModel(path)
+        else:
+            model = NumpyModel(path if path is not None and path.suffix == '.npz' else None)
+        _models[model_path] = model
+    return model
+
+def classify_images(images: List[bytes], model_path: str = "") -> List[Union[Tuple[str, float], Exception]]:
+    """
+    (label, confidence) for each encoded image, or the error for that image
+
+    Runs in a worker process; undecodable images, and frames showing too little
+    leaf to classify, do not fail the rest of the batch.
+    """
+    model = load_model(model_path)
+    decoded, results = [], []
+    for data in images:
+        try:
+            image = Image.open(io.BytesIO(data))
+            # Decode straight to roughly the model's input size (JPEG DCT scaling)
+            image.draft('RGB', (model.input_side, model.input_side))
+            image = ImageOps.exif_transpose(image).convert('RGB')
+            share = leaf_share(image)
+            if share < MIN_LEAF_SHARE:
+                raise ValueError(f"only {share:.0%} of the frame is leaf tissue")
+            decoded.append(image)
+            results.append(None)
+        except Exception as e:
+            results.append(e)
+
+    if decoded:
+        probabilities = model.predict(decoded)
+        best = probabilities.argmax(axis=1)
+        predictions = iter(
+            (model.labels[label], min(float(probabilities[i, label]), model.max_confidence))
+            for i, label in enumerate(best.tolist())
+        )
+        results = [next(predictions) if result is None else result for result in results]
+    return results
+
+def warm_model(model_path: str = "") -> str:
+    return type(load_model(model_path)).__name__
+
+class CropDiseaseClassifier:
+    """
+    Local CPU crop-disease classifier, micro-batched onto the image worker pool
+    """
+    def __init__(self, pool: Optional[ImagePreprocessor] = None, model_path: Optional[str] = None,
+                 max_batch_size: Optional[int] = None, max_wait_ms: Optional[float] = None):
+        self.pool = pool or ImagePreprocessor(workers=0)
+        self.model_path = model_path if model_path is not None else os.getenv('CROP_MODEL_PATH', '')
+        self.min_confidence = float(os.getenv('CROP_LOCAL_MIN_CONFIDENCE', '0.75'))
+        self.batcher = MicroBatcher(
+            'crop_classifier',
+            self._classify_batch,
+            max_batch_size=max_batch_size or int(os.getenv('CROP_BATCH_SIZE', '16')),
+            max_wait=(max_wait_ms if max_wait_ms is not None else float(os.getenv('CROP_BATCH_WAIT_MS', '10'))) / 1000,
+            # Two batches per worker so one is queued while the other runs
+            max_concurrency=2 * max(self.pool.workers, 1)
+        )
+
+    @property
+    def available(self) -> bool:
+        return Image is not None
+
+    async def startup(self):
+        """
+        Load the model in every worker so the first request does not pay for it
+        """
+        if not self.available:
+            return
+        await asyncio.gather(*(self.pool.run(warm_model, self.model_path) for _ in range(max(self.pool.workers, 1))))
+
+    async def classify(self, data: bytes) -> CropAnalysisResult:
+        """
+        Local analysis of one encoded image
+        """
+        label, confidence = await self.batcher.submit(data)
+        return self._build_result(label, confidence)
+
+    def is_confident(self, analysis: CropAnalysisResult) -> bool:
+        return analysis.confidence >= self.min_confidence
+
+    def get_stats(self) -> Dict:
+        return self.batcher.stats()
+
+    async def _classify_batch(self, images: List[bytes]) -> List[Union[Tuple[str, float], Exception]]:
+        return await self.pool.run(classify_images, images, self.model_path)
+
+    def _build_result(self, label: str, confidence: float) -> CropAnalysisResult:
+        entry = DISEASE_CATALOG.get(label, DISEASE_CATALOG["healthy"])
+        confidence = round(float(confidence), 4)
+        disease = DiseaseAnalysis(
+            confidence=confidence,
+            **{field: value for field, value in entry.items() if field != "treatments"}
+        )
+        treatments = [
+            Treatment(title=title, title_hindi=title_hindi, description=description,
+                      description_hindi=description_hindi, icon=icon, priority=priority)
+            for title, title_hindi, description, description_hindi, icon, priority in entry["treatments"]
+        ]
+        return CropAnalysisResult(disease=disease, treatments=treatments, confidence=confidence)
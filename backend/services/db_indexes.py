@@ -0,0 +1,152 @@
+import asyncio
+import os
+import sys
+from typing import Any, Dict, List
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import PyMongoError
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "tasks": [
+        # update_task / delete_task
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # Upsert key of generated tasks, so concurrent generation cannot duplicate them
+        IndexModel([("generation_key", ASCENDING)], name="generation_key_unique", unique=True,
+                   partialFilterExpression={"generation_key": {"$type": "string"}}),
+        # get_tasks, with or without a due date, get_task_calendar and keyset pages in (due_date, id) order
+        IndexModel([("user_id", ASCENDING), ("due_date", ASCENDING), ("id", ASCENDING)], name="user_due_id"),
+        # get_pending_tasks; only incomplete tasks are indexed, so it stays small as tasks get done
+        IndexModel([("user_id", ASCENDING), ("due_date", ASCENDING), ("due_time", ASCENDING)],
+                   name="user_due_open", partialFilterExpression={"completed": False}),
+    ],
+    "status_checks": [
+        # Listing order and keyset pages in (timestamp, id) order
+        IndexModel([("timestamp", ASCENDING), ("id", ASCENDING)], name="timestamp_id"),
+    ],
+    "users": [
+        # Also the order in which the task calendar precompute walks users
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("phone", ASCENDING)], name="phone_unique", unique=True,
+                   partialFilterExpression={"phone": {"$type": "string"}}),
+        IndexModel([("primary_crops", ASCENDING)], name="primary_crops"),
+    ],
+    "chat_messages": [
+        IndexModel([("session_id", ASCENDING), ("timestamp", ASCENDING)], name="session_timestamp"),
+        IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING)], name="user_recent"),
+    ],
+}
+
+# (collection, description, filter, projection, sort, limit, index the plan must use, must be covered)
+HOT_QUERIES = [
+    ("tasks", "tasks for a user on a date", {"user_id": "plan-check", "due_date": "2024-01-01"}, None, None, 0,
+     "user_due_id", False),
+    ("tasks", "tasks for a user", {"user_id": "plan-check"}, None, None, 0, "user_due_id", False),
+    ("tasks", "task calendar for a date range",
+     {"user_id": "plan-check", "due_date": {"$gte": "2024-01-01", "$lte": "2024-01-28"}}, None,
+     [("due_date", ASCENDING), ("due_time", ASCENDING)], 0, "user_due_id", False),
+    ("tasks", "task by id", {"id": "plan-check"}, None, None, 0, "id_unique", False),
+    ("tasks", "open tasks due by a date",
+     {"user_id": "plan-check", "completed": False, "due_date": {"$lte": "2024-01-01"}}, None,
+     [("due_date", ASCENDING), ("due_time", ASCENDING)], 0, "user_due_open", False),
+    ("tasks", "page of a user's tasks in a date range",
+     {"user_id": "plan-check", "due_date": {"$gte": "2024-01-01", "$lte": "2024-01-07"}}, None,
+     [("due_date", ASCENDING), ("id", ASCENDING)], 100, "user_due_id", False),
+    # /tasks/page?fields=id reads only the sort keys, which user_due_id holds
+    ("tasks", "page of a user's task ids in a date range",
+     {"user_id": "plan-check", "due_date": {"$gte": "2024-01-01", "$lte": "2024-01-07"}},
+     {"_id": 0, "due_date": 1, "id": 1}, [("due_date", ASCENDING), ("id", ASCENDING)], 100, "user_due_id", True),
+    ("status_checks", "status checks in order", {}, None, [("timestamp", ASCENDING)], 1000, "timestamp_id", False),
+    ("status_checks", "page of status checks", {}, None, [("timestamp", ASCENDING), ("id", ASCENDING)], 100,
+     "timestamp_id", False),
+    ("status_checks", "page of status check ids", {}, {"_id": 0, "timestamp": 1, "id": 1},
+     [("timestamp", ASCENDING), ("id", ASCENDING)], 100, "timestamp_id", True),
+]
+
+async def ensure_indexes(db) -> Dict[str, List[str]]:
+    """
+    Create any missing declared indexes; existing ones are left alone, so this is cheap on every startup
+    """
+    created = {}
+    for collection, indexes in INDEXES.items():
+        try:
+            created[collection] = await db[collection].create_indexes(indexes)
+        except PyMongoError as e:
+            # e.g. duplicate values blocking a unique index; the app still works without it
+            print(f"Error creating indexes on {collection}: {str(e)}")
+            created[collection] = []
+    return created
+
+def _plan_stages(plan: Dict[str, Any]) -> List[Dict[str, Any]]:
+    stages = [plan]
+    for child in [plan.get("inputStage")] + list(plan.get("inputStages", [])):
+        if child:
+            stages += _plan_stages(child)
+    return stages
+
+async def verify_query_plans(db) -> List[Dict[str, Any]]:
+    """
+    explain() each hot query and report whether its winning plan uses the expected index
+
+    "covered" means no FETCH, i.e. answered from the index alone. A query is "ok"
+    when there is no COLLSCAN, the expected index is scanned, and it is covered if
+    HOT_QUERIES says it must be.
+    """
+    report = []
+    for collection, description, query, fields, sort, limit, expected, must_cover in HOT_QUERIES:
+        cursor = db[collection].find(query, fields)
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
+        explanation = await cursor.explain()
+
+        winning = explanation["queryPlanner"]["winningPlan"]
+        # Slot-based engine plans nest the classic plan tree under queryPlan
+        stages = _plan_stages(winning.get("queryPlan", winning))
+        names = [stage["stage"] for stage in stages]
+        indexes = [stage["indexName"] for stage in stages if "indexName" in stage]
+        covered = "FETCH" not in names and "COLLSCAN" not in names
+        report.append({
+            "collection": collection,
+            "query": description,
+            "stages": names,
+            "indexes": indexes,
+            "expected_index": expected,
+            "must_cover": must_cover,
+            "ok": "COLLSCAN" not in names and expected in indexes and (covered or not must_cover),
+            "covered": covered,
+        })
+    return report
+
+
+async def _main(verify: bool):
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent.parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        for collection, names in (await ensure_indexes(db)).items():
+            print(f"{collection}: {', '.join(names) or 'no indexes created'}")
+        if not verify:
+            return True
+        report = await verify_query_plans(db)
+    finally:
+        client.close()
+
+    for entry in report:
+        if entry["ok"]:
+            status = "ok"
+        elif entry["expected_index"] in entry["indexes"] and "COLLSCAN" not in entry["stages"]:
+            status = "NOT COVERED"
+        else:
+            status = "NOT INDEXED"
+        covered = ", covered" if entry["covered"] else ""
+        print(f"{status:11s} {entry['collection']}: {entry['query']} -> {' <- '.join(entry['stages'])} "
+              f"[{', '.join(entry['indexes']) or 'no index'}]{covered}")
+    return all(entry["ok"] for entry in report)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(_main('--verify' in sys.argv)) else 1)
@@ -0,0 +1,43 @@
+import json
+from datetime import date, datetime
+from typing import Any
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the standard library encoder is used without it
+    orjson = None
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode='json')
+    # ObjectId and other BSON scalars
+    return str(value)
+
+def dumps(value: Any) -> bytes:
+    """
+    JSON bytes for documents as Mongo returns them, without building models first
+
+    Datetimes come out in the same ISO format as pydantic's.
+    """
+    if orjson is not None:
+        return orjson.dumps(value, default=_default)
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=_default).encode('utf-8')
+
+class JSONBytesResponse(JSONResponse):
+    """
+    JSON response encoded by dumps; FastAPI sends returned Response objects without revalidating them
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return content if isinstance(content, bytes) else dumps(content)
+
+def model_response(model: BaseModel) -> JSONBytesResponse:
+    """
+    Response for a model that is already valid, serialised once by pydantic-core
+    """
+    return JSONBytesResponse(model.model_dump_json().encode('utf-8'))
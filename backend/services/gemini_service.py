@@ -1,13 +1,31 @@
 import json
 import os
-import requests
-from typing import Dict, Any, Optional
+import re
+import uuid
+from datetime import datetime
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple
 from models.chat import ChatResponse
+from services.http_client import http_pool
+from services.coalescing import SingleFlight, coalesce_key
+from services.metrics import MOCK_FALLBACKS
+from services.semantic_cache import SemanticResponseCache, context_partition, normalize_message
+
+# Bulleted or numbered lines in an answer become ChatResponse.actionable_steps
+ACTIONABLE_STEP_PATTERN = re.compile(r'^\s*(?:[-*•]|\d+[.)])\s+(.+?)\s*$', re.MULTILINE)
+
+ADVICE_CATEGORIES = {
+    "market": "market_advice",
+    "schemes": "scheme_info",
+    "farming": "farming_advice"
+}
 
 class GeminiService:
     def __init__(self):
         self.api_key = os.getenv('GEMINI_API_KEY')
-        self.gemini_url = 'https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent'
+        self.gemini_url = os.getenv('GEMINI_API_URL', 'https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent')
+        self.gemini_stream_url = os.getenv('GEMINI_STREAM_API_URL', self.gemini_url.replace(':generateContent', ':streamGenerateContent'))
+        self.response_cache = SemanticResponseCache() if os.getenv('CHAT_CACHE_ENABLED', 'true').lower() == 'true' else None
+        self.flight = SingleFlight('gemini')
         
     async def get_chat_response(self, message: str, language: str = "hi", context: Optional[Dict] = None) -> ChatResponse:
         """
@@ -16,53 +34,135 @@ class GeminiService:
         try:
             if not self.api_key:
                 print("Warning: Gemini API key not found, using mock response")
-                return self._get_mock_response(message, language)
+                return self._fallback_response(message, language)
             
-            # Prepare system prompt
-            system_prompt = self._get_system_prompt(language, context)
-            
-            request_data = {
-                "contents": [{
-                    "parts": [{
-                        "text": f"{system_prompt}\n\nUser Question: {message}"
-                    }]
-                }],
-                "generationConfig": {
-                    "temperature": 0.7,
-                    "topP": 0.8,
-                    "topK": 40,
-                    "maxOutputTokens": 500
-                }
-            }
+            if self.response_cache is not None:
+                cached = self.response_cache.lookup(message, language, context)
+                if cached is not None:
+                    return self._copy_response(cached)
             
-            # Make API call
-            response = requests.post(
-                f"{self.gemini_url}?key={self.api_key}",
-                headers={'Content-Type': 'application/json'},
-                json=request_data,
-                timeout=30
+            # Identical questions arriving together share one upstream call
+            chat_response = await self.flight.do(
+                coalesce_key(context_partition(language, context), normalize_message(message)),
+                lambda: self._fetch_chat_response(message, language, context)
             )
-            
-            if response.status_code == 200:
-                result = response.json()
-                if 'candidates' in result and len(result['candidates']) > 0:
-                    content = result['candidates'][0]['content']['parts'][0]['text']
-                    
-                    return ChatResponse(
-                        message=content,
-                        language=language,
-                        confidence=0.85,
-                        category="farming_advice"
-                    )
-                else:
-                    return self._get_mock_response(message, language)
-            else:
-                print(f"Gemini API error: {response.status_code} - {response.text}")
-                return self._get_mock_response(message, language)
+            return self._copy_response(chat_response)
                 
         except Exception as e:
             print(f"Error in Gemini chat: {str(e)}")
-            return self._get_mock_response(message, language)
+            return self._fallback_response(message, language)
+    
+    async def _fetch_chat_response(self, message: str, language: str, context: Optional[Dict]) -> ChatResponse:
+        """
+        Call generateContent and cache a successful answer
+        """
+        request_data = self._get_request_data(message, language, context)
+        
+        # Make API call
+        response = await http_pool.post(
+            'gemini',
+            f"{self.gemini_url}?key={self.api_key}",
+            json=request_data,
+            timeout=30
+        )
+        
+        if response.status_code == 200:
+            result = response.json()
+            if 'candidates' in result and len(result['candidates']) > 0:
+                content = result['candidates'][0]['content']['parts'][0]['text']
+                
+                chat_response = ChatResponse(
+                    message=content,
+                    language=language,
+                    confidence=0.85,
+                    category="farming_advice"
+                )
+                
+                if self.response_cache is not None:
+                    self.response_cache.store(message, language, context, chat_response)
+                
+                return chat_response
+            else:
+                return self._fallback_response(message, language)
+        else:
+            print(f"Gemini API error: {response.status_code} - {response.text}")
+            return self._fallback_response(message, language)
+    
+    async def stream_chat_response(self, message: str, language: str = "hi", context: Optional[Dict] = None) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Stream an answer as ("delta", text) events, ending with ("done", ChatResponse)
+        """
+        category = ADVICE_CATEGORIES.get((context or {}).get("advice_type"), "farming_advice")
+        
+        if not self.api_key:
+            print("Warning: Gemini API key not found, using mock response")
+            async for event in self._replay_response(self._fallback_response(message, language), category):
+                yield event
+            return
+        
+        if self.response_cache is not None:
+            cached = self.response_cache.lookup(message, language, context)
+            if cached is not None:
+                async for event in self._replay_response(self._copy_response(cached), category):
+                    yield event
+                return
+        
+        parts: List[str] = []
+        # Only an answer whose stream ran to the end is worth caching
+        complete = False
+        try:
+            async with http_pool.stream(
+                'gemini',
+                'POST',
+                f"{self.gemini_stream_url}?alt=sse&key={self.api_key}",
+                json=self._get_request_data(message, language, context),
+                timeout=30
+            ) as response:
+                if response.status_code != 200:
+                    body = await response.aread()
+                    raise RuntimeError(f"Gemini API error: {response.status_code} - {body.decode('utf-8', 'replace')}")
+                
+                async for line in response.aiter_lines():
+                    if not line.startswith('data:'):
+                        continue
+                    text = self._get_candidate_text(json.loads(line[5:]))
+                    if text:
+                        parts.append(text)
+                        yield "delta", text
+                complete = True
+                        
+        except Exception as e:
+            # Keep whatever already reached the client; fall back to the mock only if nothing did
+            print(f"Error in Gemini chat stream: {str(e)}")
+        
+        if not parts:
+            async for event in self._replay_response(self._fallback_response(message, language), category):
+                yield event
+            return
+        
+        content = "".join(parts)
+        chat_response = ChatResponse(
+            message=content,
+            language=language,
+            confidence=0.85,
+            category=category,
+            actionable_steps=self._extract_actionable_steps(content)
+        )
+        if complete and self.response_cache is not None:
+            self.response_cache.store(message, language, context, chat_response.model_copy())
+        yield "done", chat_response
+    
+    def get_coalescing_stats(self) -> Dict[str, Any]:
+        """
+        Fan-in statistics for coalesced chat requests
+        """
+        return self.flight.stats()
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """
+        Hit counters for the chat response cache
+        """
+        return self.response_cache.stats() if self.response_cache is not None else {}
     
     async def get_market_advice(self, crop_name: str, current_price: float, language: str = "hi") -> ChatResponse:
         """
@@ -110,6 +210,59 @@ class GeminiService:
         response.category = "scheme_info"
         return response
     
+    def _get_request_data(self, message: str, language: str, context: Optional[Dict] = None) -> Dict:
+        """
+        Build the generateContent request body
+        """
+        # Prepare system prompt
+        system_prompt = self._get_system_prompt(language, context)
+        
+        return {
+            "contents": [{
+                "parts": [{
+                    "text": f"{system_prompt}\n\nUser Question: {message}"
+                }]
+            }],
+            "generationConfig": {
+                "temperature": 0.7,
+                "topP": 0.8,
+                "topK": 40,
+                "maxOutputTokens": 500
+            }
+        }
+    
+    def _get_candidate_text(self, result: Dict) -> str:
+        """
+        Text of the first candidate in a (possibly partial) generateContent result
+        """
+        candidates = result.get('candidates') or []
+        if not candidates:
+            return ""
+        parts = candidates[0].get('content', {}).get('parts') or []
+        return "".join(part.get('text', '') for part in parts)
+    
+    def _extract_actionable_steps(self, text: str) -> Optional[List[str]]:
+        """
+        Bulleted or numbered lines of an answer
+        """
+        steps = [step.strip('*_ ') for step in ACTIONABLE_STEP_PATTERN.findall(text)]
+        return steps or None
+    
+    def _copy_response(self, response: ChatResponse) -> ChatResponse:
+        """
+        Per-caller copy of a shared response; callers adjust fields such as category
+        """
+        return response.model_copy(update={"id": str(uuid.uuid4()), "timestamp": datetime.utcnow()})
+    
+    async def _replay_response(self, response: ChatResponse, category: str) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Emit an already complete response through the streaming protocol
+        """
+        yield "delta", response.message
+        if response.category != category:
+            response = response.model_copy(update={"category": category})
+        yield "done", response
+    
     def _get_system_prompt(self, language: str, context: Optional[Dict] = None) -> str:
         """
         Generate system prompt based on language and context
@@ -135,6 +288,13 @@ class GeminiService:
         
         return base_prompt
     
+    def _fallback_response(self, message: str, language: str) -> ChatResponse:
+        """
+        Mock response served in place of an upstream result, counted as a fallback
+        """
+        MOCK_FALLBACKS.labels('gemini', 'chat').inc()
+        return self._get_mock_response(message, language)
+    
     def _get_mock_response(self, message: str, language: str) -> ChatResponse:
         """
         Generate mock response for development
@@ -0,0 +1,151 @@
+import os
+import time
+import httpx
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+from services.metrics import UPSTREAM_DURATION, UPSTREAM_IN_FLIGHT
+from services.resilience import RETRYABLE_STATUSES, UpstreamGuard
+
+# Default connection limit for each upstream. Every upstream gets its own
+# pool so a slow dependency cannot starve the others of connections.
+UPSTREAM_LIMITS = {
+    'gemini': 20,
+    'vision': 10,
+    'speech': 10,
+    'tts': 10,
+    'mandi': 5
+}
+
+# Upstreams whose slow requests get a hedged second copy, overridable via <UPSTREAM>_HEDGE.
+# Only cheap, idempotent reads: a hedge is a second billed call.
+HEDGED_UPSTREAMS = {'mandi'}
+
+class HttpClientPool:
+    """
+    Shared keep-alive HTTP clients for all outbound service calls
+    """
+    def __init__(self):
+        self.timeout = float(os.getenv('HTTP_TIMEOUT_SECONDS', '30'))
+        self.keepalive_expiry = float(os.getenv('HTTP_KEEPALIVE_SECONDS', '30'))
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._guards: Dict[str, UpstreamGuard] = {}
+
+    def client(self, upstream: str) -> httpx.AsyncClient:
+        """
+        Get the pooled client for an upstream, creating it on first use
+        """
+        client = self._clients.get(upstream)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                limits=self._get_limits(upstream),
+                timeout=httpx.Timeout(self.timeout, connect=5.0)
+            )
+            self._clients[upstream] = client
+        return client
+
+    def guard(self, upstream: str) -> UpstreamGuard:
+        """
+        Breaker, latency window and counters of an upstream, created on first use
+        """
+        guard = self._guards.get(upstream)
+        if guard is None:
+            default = 'true' if upstream in HEDGED_UPSTREAMS else 'false'
+            hedge = os.getenv(f'{upstream.upper()}_HEDGE', default).lower() == 'true'
+            guard = self._guards[upstream] = UpstreamGuard(upstream, hedge=hedge)
+        return guard
+
+    async def request(self, upstream: str, method: str, url: str, timeout: Optional[float] = None,
+                      hedge: Optional[bool] = None, adaptive: bool = True, **kwargs) -> httpx.Response:
+        """
+        Send a request through the upstream's guard; `timeout` caps the whole call, retries included
+
+        Raises UpstreamUnavailable while the upstream's breaker is open. Pass
+        adaptive=False for calls unlike the upstream's usual ones (such as bulk
+        pages), so they neither get nor shape the adaptive timeout.
+        """
+        client = self.client(upstream)
+        # A streamed body (JsonPayloadBody over a spooled upload) can be resent, but not twice at once
+        if kwargs.get('content') is not None and not isinstance(kwargs['content'], (bytes, str)):
+            hedge = False
+
+        def send(attempt_timeout: float):
+            return client.request(method, url, timeout=httpx.Timeout(attempt_timeout, connect=min(5.0, attempt_timeout)), **kwargs)
+
+        return await self.guard(upstream).call(send, timeout or self.timeout, hedge=hedge, adaptive=adaptive)
+
+    async def get(self, upstream: str, url: str, **kwargs) -> httpx.Response:
+        return await self.request(upstream, 'GET', url, **kwargs)
+
+    async def post(self, upstream: str, url: str, **kwargs) -> httpx.Response:
+        return await self.request(upstream, 'POST', url, **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, upstream: str, method: str, url: str, **kwargs) -> AsyncIterator[httpx.Response]:
+        """
+        Streamed request behind the upstream's breaker
+
+        Nothing is retried or hedged once part of a stream may have been consumed,
+        and the caller's timeout is kept: streamed calls take as long as the answer.
+        """
+        guard = self.guard(upstream)
+        guard.admit()
+        start = time.monotonic()
+        in_flight = UPSTREAM_IN_FLIGHT.labels(upstream)
+        in_flight.inc()
+        outcome = "cancelled"
+        try:
+            async with self.client(upstream).stream(method, url, **kwargs) as response:
+                failed = response.status_code in RETRYABLE_STATUSES
+                if failed:
+                    outcome = "error"
+                yield response
+                outcome = "error" if failed else "ok"
+        except httpx.TransportError:
+            outcome = "error"
+            raise
+        finally:
+            in_flight.dec()
+            # Once, by how the stream ended: a body that breaks off is a failure, not also a success.
+            # A caller that is cancelled or raises mid-stream says nothing about the upstream
+            if outcome != "cancelled":
+                guard.record(outcome == "ok")
+            # The whole stream, not just the time to its first bytes
+            UPSTREAM_DURATION.labels(upstream, outcome).observe(time.monotonic() - start)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Breaker state, latency percentiles, current timeout and failure counters per upstream
+        """
+        return {upstream: guard.get_stats() for upstream, guard in self._guards.items()}
+
+    async def startup(self):
+        """
+        Open one client per known upstream
+        """
+        for upstream in UPSTREAM_LIMITS:
+            self.client(upstream)
+            self.guard(upstream)
+
+    async def shutdown(self):
+        """
+        Close all pooled connections
+        """
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            await client.aclose()
+
+    def _get_limits(self, upstream: str) -> httpx.Limits:
+        """
+        Connection limits for an upstream, overridable via <UPSTREAM>_MAX_CONNECTIONS
+        """
+        default = UPSTREAM_LIMITS.get(upstream, 10)
+        max_connections = int(os.getenv(f'{upstream.upper()}_MAX_CONNECTIONS', default))
+        return httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=self.keepalive_expiry
+        )
+
+
+http_pool = HttpClientPool()
@@ -0,0 +1,135 @@
+import asyncio
+import io
+import multiprocessing
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional, Tuple
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it images are forwarded unchanged
+    Image = None
+    ImageOps = None
+
+DEFAULT_MAX_SIDE = 1024
+DEFAULT_QUALITY = 85
+MIN_QUALITY = 50
+LEAF_ANALYSIS_SIDE = 128
+
+def leaf_bounding_box(rgb: np.ndarray, margin: float = 0.08) -> Optional[Tuple[float, float, float, float]]:
+    """
+    Bounding box (fractions of width/height) of the green, leafy region of an RGB array
+
+    Uses the excess-green index on chromaticity coordinates. Returns None when the
+    image is almost all or almost no foliage, where cropping would not help.
+    """
+    pixels = rgb.astype(np.float32)
+    total = pixels.sum(axis=2) + 1e-6
+    r, g, b = (pixels[..., i] / total for i in range(3))
+    mask = (2 * g - r - b) > 0.1
+
+    coverage = mask.mean()
+    if coverage < 0.03 or coverage > 0.9:
+        return None
+
+    rows, cols = np.nonzero(mask)
+    height, width = mask.shape
+    # Percentiles rather than min/max so stray green specks do not widen the box
+    top, bottom = np.percentile(rows, [1, 99]) / height
+    left, right = np.percentile(cols, [1, 99]) / width
+    return (
+        max(0.0, left - margin), max(0.0, top - margin),
+        min(1.0, right + margin), min(1.0, bottom + margin)
+    )
+
+def preprocess_image(data: bytes, max_side: int = DEFAULT_MAX_SIDE, quality: int = DEFAULT_QUALITY,
+                     image_format: str = "JPEG", target_bytes: Optional[int] = None,
+                     crop_leaf: bool = True) -> bytes:
+    """
+    Orient, crop to the leaf, downscale and re-encode one image
+
+    Runs in a worker process, so it only takes and returns bytes.
+    """
+    image = Image.open(io.BytesIO(data))
+    # Let the JPEG decoder skip detail we would throw away (DCT scaling by 1/2..1/8)
+    image.draft('RGB', (max_side, max_side))
+    image = ImageOps.exif_transpose(image).convert('RGB')
+
+    if crop_leaf:
+        thumbnail = image.copy()
+        thumbnail.thumbnail((LEAF_ANALYSIS_SIDE, LEAF_ANALYSIS_SIDE))
+        box = leaf_bounding_box(np.asarray(thumbnail))
+        if box is not None:
+            width, height = image.size
+            image = image.crop((
+                int(box[0] * width), int(box[1] * height),
+                int(box[2] * width), int(box[3] * height)
+            ))
+
+    image.thumbnail((max_side, max_side), Image.Resampling.BILINEAR, reducing_gap=2.0)
+
+    # Step quality down until the encoding fits target_bytes (if set)
+    while True:
+        output = io.BytesIO()
+        image.save(output, format=image_format, quality=quality, optimize=image_format == "JPEG")
+        if target_bytes is None or output.tell() <= target_bytes or quality <= MIN_QUALITY:
+            return output.getvalue()
+        quality = max(MIN_QUALITY, quality - 10)
+
+def _warm_worker() -> bool:
+    return Image is not None
+
+class ImagePreprocessor:
+    """
+    Runs preprocess_image in a process pool so decoding and resizing never block the event loop
+    """
+    def __init__(self, workers: Optional[int] = None, max_side: Optional[int] = None,
+                 quality: Optional[int] = None, image_format: Optional[str] = None,
+                 target_bytes: Optional[int] = None):
+        self.workers = workers if workers is not None else int(os.getenv('IMAGE_PREPROCESS_WORKERS', str(os.cpu_count() or 1)))
+        self.max_side = max_side or int(os.getenv('IMAGE_MAX_SIDE', str(DEFAULT_MAX_SIDE)))
+        self.quality = quality or int(os.getenv('IMAGE_QUALITY', str(DEFAULT_QUALITY)))
+        self.image_format = (image_format or os.getenv('IMAGE_FORMAT', 'JPEG')).upper()
+        target = target_bytes if target_bytes is not None else int(os.getenv('IMAGE_TARGET_BYTES', '0'))
+        self.target_bytes = target or None
+        self.crop_leaf = os.getenv('IMAGE_CROP_LEAF', 'true').lower() == 'true'
+        # Not fork: by the time the pool starts, Motor and the HTTP pool have threads that may hold locks
+        self.start_method = os.getenv('IMAGE_POOL_START_METHOD', 'forkserver')
+        if self.start_method not in multiprocessing.get_all_start_methods():
+            self.start_method = 'spawn'
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def available(self) -> bool:
+        return Image is not None
+
+    async def startup(self):
+        """
+        Start the worker processes now rather than on the first upload
+        """
+        if not self.available or self.workers <= 0:
+            return
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context(self.start_method))
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._executor, _warm_worker) for _ in range(self.workers)))
+
+    async def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def process(self, data: bytes) -> bytes:
+        """
+        Preprocessed image bytes
+        """
+        return await self.run(preprocess_image, data, self.max_side, self.quality,
+                              self.image_format, self.target_bytes, self.crop_leaf)
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """
+        Run any picklable image function on the pool; with no pool (workers=0) it runs in a thread instead
+        """
+        if self._executor is None:
+            return await asyncio.to_thread(fn, *args)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
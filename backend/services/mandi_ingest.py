@@ -0,0 +1,111 @@
+import asyncio
+import os
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+from services.http_client import http_pool
+from services.mandi_store import MandiPriceStore
+
+class MandiIngestor:
+    """
+    Fetches new rows of the data.gov.in mandi resource and appends them to the local price store
+
+    The first run pages through the whole resource. Later runs only ask for the
+    arrival dates from the newest stored day onwards (that day included, for late
+    reports), unless the store is more than MANDI_INGEST_MAX_CATCHUP_DAYS behind.
+    A run either appends everything it was asked to fetch or nothing: a failed page
+    raises, so last_day never moves past rows that were not fetched.
+    """
+    def __init__(self, store: MandiPriceStore, api_key: Optional[str] = None, page_size: Optional[int] = None):
+        self.store = store
+        self.api_key = api_key or os.getenv('MANDI_API_KEY')
+        self.mandi_url = os.getenv('MANDI_API_URL', 'https://api.data.gov.in/resource/9ef84268-d588-465a-a308-a864a43d0070')
+        self.page_size = page_size or int(os.getenv('MANDI_INGEST_PAGE_SIZE', '1000'))
+        self.interval_hours = float(os.getenv('MANDI_INGEST_INTERVAL_HOURS', '6'))
+        self.max_catchup_days = int(os.getenv('MANDI_INGEST_MAX_CATCHUP_DAYS', '30'))
+
+    async def run_once(self) -> int:
+        """
+        Fetch the rows the store may be missing; returns the number of rows appended
+
+        Raises on an upstream error without touching the store, so the next run retries the same window.
+        """
+        if not self.api_key:
+            print("Warning: Mandi API key not found, skipping mandi ingestion")
+            return 0
+
+        last_day = self.store.last_day
+        # The resource's dates are Indian, which can be a day ahead of the server's
+        until = date.today() + timedelta(days=1)
+        if last_day is None or (until - last_day).days > self.max_catchup_days:
+            records = await self._fetch_pages({})
+        else:
+            records = []
+            day = last_day
+            while day <= until:
+                records += await self._fetch_pages({'filters[arrival_date]': day.strftime('%d/%m/%Y')})
+                day += timedelta(days=1)
+
+        if not records:
+            return 0
+        # Parsing, de-duplication and the re-sort are all NumPy/CPU work; keep them off the event loop
+        appended = await asyncio.to_thread(self.store.append_records, records)
+        if appended:
+            await asyncio.to_thread(self.store.save)
+        return appended
+
+    async def _fetch_pages(self, filters: Dict[str, str]) -> List[Dict]:
+        """
+        Every page of records matching `filters`, raising on the first failed page
+        """
+        records = []
+        offset = 0
+        while True:
+            params = {
+                'api-key': self.api_key,
+                'format': 'json',
+                'limit': str(self.page_size),
+                'offset': str(offset),
+                **filters
+            }
+            response = await http_pool.get('mandi', self.mandi_url, params=params, timeout=60, adaptive=False)
+            if response.status_code != 200:
+                raise RuntimeError(f"Mandi ingestion error at offset {offset}: {response.status_code} - {response.text}")
+
+            page = response.json().get('records', [])
+            records += page
+            if len(page) < self.page_size:
+                break
+            offset += self.page_size
+        return records
+
+    async def run_forever(self):
+        """
+        Re-run ingestion every MANDI_INGEST_INTERVAL_HOURS hours
+        """
+        while True:
+            try:
+                appended = await self.run_once()
+                print(f"Mandi ingestion appended {appended} rows ({self.store.size} total)")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error in mandi ingestion: {str(e)}")
+            await asyncio.sleep(self.interval_hours * 3600)
+
+
+async def _main():
+    from pathlib import Path
+    from dotenv import load_dotenv
+
+    load_dotenv(Path(__file__).parent.parent / '.env')
+    store = MandiPriceStore()
+    store.load()
+    try:
+        appended = await MandiIngestor(store).run_once()
+    finally:
+        await http_pool.shutdown()
+    print(f"Appended {appended} rows, store now holds {store.size} rows up to {store.last_day}")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -1,82 +1,228 @@
 import json
 import os
-import requests
-from typing import Dict, Any, List, Optional
+import numpy as np
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime, date, timedelta
 from models.market import MarketPrice, MarketAnalysis, MarketAdvice, PriceTrend
+from services.cache import MongoCacheTier, TieredCache
+from services.http_client import http_pool
+from services.market_index import MarketIndex
+from services.mandi_store import MandiPriceStore, from_day, parse_record, to_day
+from services.metrics import MOCK_FALLBACKS
+from services import price_analytics
+
+TREND_DIRECTIONS = {1: "up", -1: "down", 0: "stable"}
 
 class MandiService:
-    def __init__(self):
+    def __init__(self, db=None, store: Optional[MandiPriceStore] = None, market_index: Optional[MarketIndex] = None):
         self.api_key = os.getenv('MANDI_API_KEY')
-        self.mandi_url = 'https://api.data.gov.in/resource/9ef84268-d588-465a-a308-a864a43d0070'
+        self.store = store
+        self.market_index = market_index
+        self.mandi_url = os.getenv('MANDI_API_URL', 'https://api.data.gov.in/resource/9ef84268-d588-465a-a308-a864a43d0070')
+        
+        # Mandi prices change a few times a day, so serve from cache and revalidate in the background
+        cache_ttl = float(os.getenv('MANDI_CACHE_TTL_SECONDS', '1800'))
+        stale_ttl = float(os.getenv('MANDI_CACHE_STALE_SECONDS', '21600'))
+        self.price_cache = TieredCache(
+            'mandi_prices',
+            ttl=cache_ttl,
+            stale_ttl=stale_ttl,
+            max_entries=int(os.getenv('MANDI_CACHE_MAX_ENTRIES', '5000')),
+            shared_tier=MongoCacheTier(db.mandi_cache, cache_ttl + stale_ttl) if db is not None else None,
+            encode=lambda analysis: analysis.model_dump(mode='json'),
+            decode=lambda doc: MarketAnalysis(**doc)
+        )
         
     async def get_market_prices(self, crop_name: str, region: str, district: str = None, language: str = "hi") -> MarketAnalysis:
         """
         Fetch market prices for a specific crop and region
         """
         try:
+            # Answer from the locally ingested dataset when it covers this crop and state
+            if self.store is not None and self.store.has_commodity(crop_name, region):
+                return self._get_store_market_analysis(crop_name, region, district, language)
+            
             if not self.api_key:
                 print("Warning: Mandi API key not found, using mock data")
-                return self._get_mock_market_analysis(crop_name, region, language)
-            
-            # Prepare API parameters
-            params = {
-                'api-key': self.api_key,
-                'format': 'json',
-                'limit': '100',
-                'filters[state]': region,
-                'filters[commodity]': crop_name
-            }
+                return self._fallback_market_analysis(crop_name, region, language)
             
-            if district:
-                params['filters[district]'] = district
-            
-            # Make API call
-            response = requests.get(self.mandi_url, params=params, timeout=30)
-            
-            if response.status_code == 200:
-                result = response.json()
-                return self._process_mandi_data(result, crop_name, region, language)
-            else:
-                print(f"Mandi API error: {response.status_code} - {response.text}")
-                return self._get_mock_market_analysis(crop_name, region, language)
+            cache_key = "|".join([crop_name.lower(), region.lower(), (district or "").lower(), language])
+            return await self.price_cache.get_or_fetch(
+                cache_key,
+                lambda: self._fetch_market_prices(crop_name, region, district, language)
+            )
                 
         except Exception as e:
             print(f"Error fetching market prices: {str(e)}")
-            return self._get_mock_market_analysis(crop_name, region, language)
+            return self._fallback_market_analysis(crop_name, region, language)
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """
+        Hit/miss counters for the market price cache
+        """
+        return self.price_cache.stats()
+    
+    def get_coalescing_stats(self) -> Dict[str, Any]:
+        """
+        Fan-in statistics for coalesced market price fetches
+        """
+        return self.price_cache.flight.stats()
+    
+    async def _fetch_market_prices(self, crop_name: str, region: str, district: Optional[str], language: str) -> MarketAnalysis:
+        """
+        Fetch market prices from data.gov.in, raising on upstream errors so they are never cached
+        """
+        # Prepare API parameters
+        params = {
+            'api-key': self.api_key,
+            'format': 'json',
+            'limit': '100',
+            'filters[state]': region,
+            'filters[commodity]': crop_name
+        }
+        
+        if district:
+            params['filters[district]'] = district
+        
+        # Make API call
+        response = await http_pool.get('mandi', self.mandi_url, params=params, timeout=30)
+        
+        if response.status_code != 200:
+            raise RuntimeError(f"Mandi API error: {response.status_code} - {response.text}")
+        
+        return self._process_mandi_data(response.json(), crop_name, region, language)
     
     async def get_price_trends(self, crop_name: str, region: str, days: int = 7) -> List[PriceTrend]:
         """
         Get price trends for a crop over specified days
         """
         try:
-            # TODO: Implement actual price trend API call
-            # For now, return mock data
-            return self._get_mock_price_trends(crop_name, days)
+            if self.store is not None and self.store.has_commodity(crop_name, region):
+                trends = self._get_store_price_trends(crop_name, region, days)
+                if trends:
+                    return trends
+            
+            return self._fallback_price_trends(crop_name, days)
             
         except Exception as e:
             print(f"Error fetching price trends: {str(e)}")
-            return self._get_mock_price_trends(crop_name, days)
+            return self._fallback_price_trends(crop_name, days)
     
-    async def get_nearby_markets(self, latitude: float, longitude: float, radius: int = 50) -> List[Dict]:
+    async def get_nearby_markets(self, latitude: float, longitude: float, radius: int = 50, crop_name: Optional[str] = None, limit: int = 10) -> List[Dict]:
         """
-        Get nearby mandi locations
+        Get nearby mandi locations, nearest first, optionally only those that traded a crop recently
         """
         try:
-            # TODO: Implement actual location-based mandi API call
-            # For now, return mock data
-            return self._get_mock_nearby_markets(latitude, longitude)
+            if self.market_index is None or not self.market_index.size:
+                return self._fallback_nearby_markets(latitude, longitude)
+            
+            allowed = None
+            if crop_name and self.store is not None and self.store.size:
+                allowed = {
+                    (market.lower(), state.lower())
+                    for market, _, state in self.store.recent_markets(crop_name)
+                }
+            
+            return self.market_index.nearest(latitude, longitude, radius, limit, allowed)
             
         except Exception as e:
             print(f"Error fetching nearby markets: {str(e)}")
-            return self._get_mock_nearby_markets(latitude, longitude)
+            return self._fallback_nearby_markets(latitude, longitude)
     
     def _process_mandi_data(self, data: Dict, crop_name: str, region: str, language: str) -> MarketAnalysis:
         """
-        Process actual mandi API data
+        Process actual mandi API data, raising when it has no usable records so no mock is cached in their place
+        """
+        rows = [row for row in map(parse_record, data.get('records', [])) if row is not None]
+        if not rows:
+            raise RuntimeError(f"Mandi API returned no usable records for {crop_name} in {region}")
+        
+        latest_date = max(row['price_date'] for row in rows)
+        latest_rows = [row for row in rows if row['price_date'] == latest_date]
+        
+        # One trend point per arrival date, averaged across reporting markets
+        prices_by_date: Dict[date, List[float]] = {}
+        for row in rows:
+            prices_by_date.setdefault(row['price_date'], []).append(row['modal_price'] / 100)
+        price_trends = [
+            PriceTrend(date=trend_date, price=round(sum(prices) / len(prices), 2), volume=len(prices))
+            for trend_date, prices in sorted(prices_by_date.items())
+        ]
+        
+        return self._build_market_analysis(latest_rows, price_trends, crop_name, region, language)
+    
+    def _get_store_market_analysis(self, crop_name: str, region: str, district: Optional[str], language: str) -> MarketAnalysis:
+        """
+        Build market analysis from the local price store
+        """
+        rows = self.store.latest_prices(crop_name, region, district)
+        if not rows and district:
+            rows = self.store.latest_prices(crop_name, region)
+        
+        price_trends = self._get_store_price_trends(crop_name, region, 7)
+        analysis = self._build_market_analysis(rows, price_trends, crop_name, region, language)
+        # Base the advice on the longer history the store holds, not just the displayed week
+        analysis.advice = self.get_bulk_market_advice([(crop_name, region)], language)[0]
+        return analysis
+    
+    def _get_store_price_trends(self, crop_name: str, region: str, days: int) -> List[PriceTrend]:
+        """
+        Daily price trend from the local price store; volume is the number of reporting markets
+        """
+        trend_days, prices, counts = self.store.daily_series(crop_name, region, days)
+        return [
+            PriceTrend(date=from_day(day), price=round(float(price) / 100, 2), volume=int(count))
+            for day, price, count in zip(trend_days, prices, counts)
+        ]
+    
+    def _build_market_analysis(self, rows: List[Dict], price_trends: List[PriceTrend], crop_name: str, region: str, language: str) -> MarketAnalysis:
+        """
+        Build market analysis from same-day mandi rows (prices per quintal)
+        """
+        current_avg = round(sum(row['modal_price'] for row in rows) / len(rows) / 100, 2)
+        current_row = rows[0]
+        
+        current_price = MarketPrice(
+            crop_name=crop_name,
+            crop_name_hindi=self._get_crop_name_hindi(crop_name),
+            region=region,
+            district=current_row['district'],
+            market_name=current_row['market'],
+            min_price=round(min(row['min_price'] for row in rows) / 100, 2),
+            max_price=round(max(row['max_price'] for row in rows) / 100, 2),
+            avg_price=current_avg,
+            price_date=current_row['price_date']
+        )
+        
+        if not price_trends:
+            price_trends = [PriceTrend(date=current_row['price_date'], price=current_avg, volume=len(rows))]
+        
+        advice = self._generate_market_advice(price_trends, current_avg, language)
+        
+        nearby_markets = [
+            {
+                "name": row['market'],
+                "address": f"{row['district']}, {row['state']}",
+                "min_price": round(row['min_price'] / 100, 2),
+                "max_price": round(row['max_price'] / 100, 2),
+                "avg_price": round(row['modal_price'] / 100, 2)
+            }
+            for row in rows[:10]
+        ]
+        
+        return MarketAnalysis(
+            crop_name=crop_name,
+            current_price=current_price,
+            price_trends=price_trends,
+            advice=advice,
+            nearby_markets=nearby_markets
+        )
+    
+    def _fallback_market_analysis(self, crop_name: str, region: str, language: str) -> MarketAnalysis:
+        """
+        Mock market analysis served in place of an upstream result, counted as a fallback
         """
-        # TODO: Implement actual data processing
-        # For now, return mock data with some randomization
+        MOCK_FALLBACKS.labels('mandi', 'market_analysis').inc()
         return self._get_mock_market_analysis(crop_name, region, language)
     
     def _get_mock_market_analysis(self, crop_name: str, region: str, language: str) -> MarketAnalysis:
@@ -124,45 +270,71 @@ class MandiService:
             nearby_markets=nearby_markets
         )
     
+    def _fallback_price_trends(self, crop_name: str, days: int) -> List[PriceTrend]:
+        """
+        Mock price trends served in place of an upstream result, counted as a fallback
+        """
+        MOCK_FALLBACKS.labels('mandi', 'price_trends').inc()
+        return self._get_mock_price_trends(crop_name, days)
+    
     def _get_mock_price_trends(self, crop_name: str, days: int) -> List[PriceTrend]:
         """
         Generate mock price trends
         """
         base_price = self._get_crop_base_price(crop_name)
-        trends = []
-        
-        import random
-        for i in range(days, 0, -1):
-            trend_date = date.today() - timedelta(days=i)
-            variation = (random.random() - 0.5) * 0.3
-            price = round(base_price * (1 + variation), 2)
-            volume = random.randint(500, 2000)
-            
-            trends.append(PriceTrend(
-                date=trend_date,
-                price=price,
-                volume=volume
-            ))
+        rng = np.random.default_rng()
+        prices = np.round(base_price * (1 + (rng.random(days) - 0.5) * 0.3), 2).tolist()
+        volumes = rng.integers(500, 2001, days).tolist()
+        start_date = date.today() - timedelta(days=days)
         
-        return trends
+        return [
+            PriceTrend(date=start_date + timedelta(days=i), price=price, volume=volume)
+            for i, (price, volume) in enumerate(zip(prices, volumes))
+        ]
     
     def _generate_market_advice(self, price_trends: List[PriceTrend], current_price: float, language: str) -> MarketAdvice:
         """
         Generate market advice based on price trends
         """
-        # Simple trend analysis
-        if len(price_trends) >= 2:
-            recent_trend = price_trends[-1].price - price_trends[-2].price
-            if recent_trend > 0:
-                trend_direction = "up"
-            elif recent_trend < 0:
-                trend_direction = "down"
-            else:
-                trend_direction = "stable"
-        else:
-            trend_direction = "stable"
+        if len(price_trends) < 2:
+            return self._build_market_advice("stable", 0.5, language)
+        
+        # Lay the trend out on a daily grid so gaps between arrival dates count as missing days
+        days = np.array([to_day(trend.date) for trend in price_trends])
+        prices = np.full(days.max() - days.min() + 1, np.nan)
+        prices[days - days.min()] = [trend.price for trend in price_trends]
+        
+        summary = price_analytics.analyze(prices, np.arange(days.min(), days.max() + 1))
+        return self._build_market_advice(
+            TREND_DIRECTIONS[int(summary['direction'][0])],
+            float(summary['confidence'][0]),
+            language
+        )
+    
+    def get_bulk_market_advice(self, crops: List[Tuple[str, str]], language: str = "hi", days: int = 90) -> List[MarketAdvice]:
+        """
+        Market advice for many (crop_name, region) pairs in one vectorized pass over the price store
+        """
+        if self.store is None or not self.store.size:
+            return [self._build_market_advice("stable", 0.5, language) for _ in crops]
+        
+        end_day = to_day(self.store.last_day)
+        day_numbers = np.arange(end_day - days + 1, end_day + 1)
+        prices = np.full((len(crops), days), np.nan)
+        for row, (crop_name, region) in enumerate(crops):
+            series_days, series_prices, _ = self.store.daily_series(crop_name, region, days, end=self.store.last_day)
+            prices[row, series_days - day_numbers[0]] = series_prices / 100
         
-        # Generate advice based on trend
+        summary = price_analytics.analyze(prices, day_numbers)
+        return [
+            self._build_market_advice(TREND_DIRECTIONS[int(direction)], float(confidence), language)
+            for direction, confidence in zip(summary['direction'], summary['confidence'])
+        ]
+    
+    def _build_market_advice(self, trend_direction: str, confidence: float, language: str) -> MarketAdvice:
+        """
+        Localised advice text for a trend direction
+        """
         advice_data = {
             "hi": {
                 "up": {
@@ -206,11 +378,18 @@ class MandiService:
         return MarketAdvice(
             action=trend_advice["action"],
             reason=trend_advice["reason"],
-            confidence=0.75,
+            confidence=round(confidence, 2),
             expected_change=trend_direction,
             timeframe=trend_advice["timeframe"]
         )
     
+    def _fallback_nearby_markets(self, latitude: float, longitude: float) -> List[Dict]:
+        """
+        Mock nearby markets served in place of an upstream result, counted as a fallback
+        """
+        MOCK_FALLBACKS.labels('mandi', 'nearby_markets').inc()
+        return self._get_mock_nearby_markets(latitude, longitude)
+    
     def _get_mock_nearby_markets(self, latitude: float, longitude: float) -> List[Dict]:
         """
         Generate mock nearby markets
@@ -0,0 +1,294 @@
+import json
+import os
+import numpy as np
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+EPOCH = date(1970, 1, 1)
+
+# Categorical columns are stored as int32 codes into a per-column dictionary
+CATEGORY_COLUMNS = ['commodity', 'state', 'district', 'market', 'variety']
+PRICE_COLUMNS = ['min_price', 'max_price', 'modal_price']
+COLUMN_DTYPES = {
+    **{name: np.int32 for name in CATEGORY_COLUMNS},
+    'day': np.int32,
+    **{name: np.float32 for name in PRICE_COLUMNS}
+}
+
+DEFAULT_STORE_PATH = Path(__file__).parent.parent / 'data' / 'mandi'
+
+def to_day(value: date) -> int:
+    return (value - EPOCH).days
+
+def from_day(day: int) -> date:
+    return EPOCH + timedelta(days=int(day))
+
+@lru_cache(maxsize=4096)
+def _parse_date(value: str) -> date:
+    # A page holds a few distinct arrival dates across thousands of rows
+    return datetime.strptime(value, '%d/%m/%Y').date()
+
+def parse_record(record: Dict) -> Optional[Dict]:
+    """
+    Normalise one data.gov.in record, returning None for rows with missing dates or prices
+    """
+    try:
+        row = {name: (record.get(name) or '').strip() for name in CATEGORY_COLUMNS}
+        row['price_date'] = _parse_date(record['arrival_date'])
+        for name in PRICE_COLUMNS:
+            row[name] = float(record[name])
+        return row
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return None
+
+DEDUP_COLUMNS = ['day', 'market', 'commodity', 'variety']
+
+def _row_keys(arrays: Dict[str, np.ndarray], mask: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Structured array of the columns identifying a row, comparable and sortable as a whole
+    """
+    size = int(mask.sum()) if mask is not None else len(arrays['day'])
+    keys = np.empty(size, dtype=[(name, np.int32) for name in DEDUP_COLUMNS])
+    for name in DEDUP_COLUMNS:
+        keys[name] = arrays[name][mask] if mask is not None else arrays[name]
+    return keys
+
+class _Columns:
+    """
+    Immutable snapshot of the store: sorted column arrays plus a (commodity, state) slice index
+    """
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        order = np.lexsort((arrays['day'], arrays['district'], arrays['state'], arrays['commodity']))
+        self.arrays = {name: np.ascontiguousarray(arrays[name][order]) for name in COLUMN_DTYPES}
+        self.size = len(order)
+
+        commodity, state = self.arrays['commodity'], self.arrays['state']
+        if self.size:
+            changes = np.flatnonzero((commodity[1:] != commodity[:-1]) | (state[1:] != state[:-1])) + 1
+            starts = np.concatenate(([0], changes))
+            ends = np.concatenate((changes, [self.size]))
+            self.groups = {
+                (int(commodity[start]), int(state[start])): (int(start), int(end))
+                for start, end in zip(starts, ends)
+            }
+        else:
+            self.groups = {}
+
+    @classmethod
+    def empty(cls) -> "_Columns":
+        return cls({name: np.empty(0, dtype=dtype) for name, dtype in COLUMN_DTYPES.items()})
+
+class MandiPriceStore:
+    """
+    Local columnar store of data.gov.in mandi prices, one .npy file per column
+    """
+    def __init__(self, path: Optional[str] = None):
+        self.path = Path(path or os.getenv('MANDI_STORE_PATH', DEFAULT_STORE_PATH))
+        self.dictionaries: Dict[str, List[str]] = {name: [] for name in CATEGORY_COLUMNS}
+        self._codes: Dict[str, Dict[str, int]] = {name: {} for name in CATEGORY_COLUMNS}
+        self._columns = _Columns.empty()
+
+    @property
+    def size(self) -> int:
+        return self._columns.size
+
+    @property
+    def last_day(self) -> Optional[date]:
+        if not self.size:
+            return None
+        return from_day(self._columns.arrays['day'].max())
+
+    def load(self) -> bool:
+        """
+        Load the store from disk; returns False when nothing has been ingested yet
+        """
+        meta_path = self.path / 'meta.json'
+        if not meta_path.exists():
+            return False
+
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+
+        self.dictionaries = {name: meta['dictionaries'][name] for name in CATEGORY_COLUMNS}
+        self._codes = {
+            name: {value.lower(): code for code, value in enumerate(values)}
+            for name, values in self.dictionaries.items()
+        }
+        arrays = {name: np.load(self.path / f'{name}.npy') for name in COLUMN_DTYPES}
+        self._columns = _Columns(arrays)
+        return True
+
+    def save(self):
+        """
+        Write all columns and dictionaries, replacing files atomically
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        for name, array in self._columns.arrays.items():
+            tmp_path = self.path / f'{name}.tmp.npy'
+            np.save(tmp_path, array)
+            os.replace(tmp_path, self.path / f'{name}.npy')
+
+        meta = {
+            'rows': self.size,
+            'last_day': self.last_day.isoformat() if self.last_day else None,
+            'updated_at': datetime.utcnow().isoformat(),
+            'dictionaries': self.dictionaries
+        }
+        tmp_path = self.path / 'meta.tmp.json'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path / 'meta.json')
+
+    def append_records(self, records: Iterable[Dict]) -> int:
+        """
+        Append raw API records, skipping rows already present; returns the number of new rows
+
+        Re-sorts the whole store, so callers should append a run's records in one
+        call, off the event loop.
+        """
+        rows = {name: [] for name in COLUMN_DTYPES}
+        for record in records:
+            row = parse_record(record)
+            if row is None:
+                continue
+
+            for name in CATEGORY_COLUMNS:
+                rows[name].append(self._encode(name, row[name]))
+            rows['day'].append(to_day(row['price_date']))
+            for name in PRICE_COLUMNS:
+                rows[name].append(row[name])
+
+        if not rows['day']:
+            return 0
+
+        new = {name: np.asarray(values, dtype=COLUMN_DTYPES[name]) for name, values in rows.items()}
+        keep = self._new_row_mask(new)
+        if not keep.any():
+            return 0
+
+        current = self._columns.arrays
+        merged = {name: np.concatenate((current[name], new[name][keep])) for name in COLUMN_DTYPES}
+        # Swap in a fresh snapshot so concurrent readers never see a half-built index
+        self._columns = _Columns(merged)
+        return int(keep.sum())
+
+    def has_commodity(self, commodity: str, state: str) -> bool:
+        return self._group(commodity, state) is not None
+
+    def latest_prices(self, commodity: str, state: str, district: Optional[str] = None) -> List[Dict]:
+        """
+        Rows for the most recent arrival date of a commodity in a state (prices per quintal)
+        """
+        selection = self._select(commodity, state, district)
+        if selection is None or not len(selection):
+            return []
+
+        arrays = self._columns.arrays
+        days = arrays['day'][selection]
+        selection = selection[days == days.max()]
+        return [self._decode_row(index) for index in selection]
+
+    def daily_series(self, commodity: str, state: str, days: int, district: Optional[str] = None,
+                     end: Optional[date] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Mean modal price and number of reporting markets per day over the last `days` days
+        """
+        selection = self._select(commodity, state, district)
+        if selection is None or not len(selection):
+            empty = np.empty(0)
+            return empty.astype(np.int32), empty.astype(np.float32), empty.astype(np.int64)
+
+        arrays = self._columns.arrays
+        row_days = arrays['day'][selection]
+        last = to_day(end) if end else int(row_days.max())
+        in_window = (row_days > last - days) & (row_days <= last)
+        row_days = row_days[in_window]
+        prices = arrays['modal_price'][selection][in_window]
+
+        unique_days, inverse = np.unique(row_days, return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(unique_days))
+        totals = np.bincount(inverse, weights=prices, minlength=len(unique_days))
+        return unique_days, (totals / np.maximum(counts, 1)).astype(np.float32), counts
+
+    def recent_markets(self, commodity: str, since_days: int = 14) -> List[Tuple[str, str, str]]:
+        """
+        (market, district, state) triples that reported the commodity recently
+        """
+        code = self._lookup('commodity', commodity)
+        if code is None or not self.size:
+            return []
+
+        arrays = self._columns.arrays
+        cutoff = int(arrays['day'].max()) - since_days
+        mask = (arrays['commodity'] == code) & (arrays['day'] > cutoff)
+        triples = np.unique(np.stack((arrays['market'][mask], arrays['district'][mask], arrays['state'][mask]), axis=1), axis=0)
+        return [
+            (self.dictionaries['market'][m], self.dictionaries['district'][d], self.dictionaries['state'][s])
+            for m, d, s in triples
+        ]
+
+    def _select(self, commodity: str, state: str, district: Optional[str]) -> Optional[np.ndarray]:
+        group = self._group(commodity, state)
+        if group is None:
+            return None
+
+        start, end = group
+        selection = np.arange(start, end)
+        if district:
+            district_code = self._lookup('district', district)
+            if district_code is None:
+                return selection[:0]
+            selection = selection[self._columns.arrays['district'][start:end] == district_code]
+        return selection
+
+    def _group(self, commodity: str, state: str) -> Optional[Tuple[int, int]]:
+        commodity_code = self._lookup('commodity', commodity)
+        state_code = self._lookup('state', state)
+        if commodity_code is None or state_code is None:
+            return None
+        return self._columns.groups.get((commodity_code, state_code))
+
+    def _lookup(self, column: str, value: str) -> Optional[int]:
+        codes = self._codes[column]
+        key = value.strip().lower()
+        if key in codes:
+            return codes[key]
+        # Crop names arrive as "tomatoes" or "potato"; the dataset uses singular names
+        for suffix in ('es', 's'):
+            if key.endswith(suffix) and key[:-len(suffix)] in codes:
+                return codes[key[:-len(suffix)]]
+        return None
+
+    def _encode(self, column: str, value: str) -> int:
+        key = value.lower()
+        code = self._codes[column].get(key)
+        if code is None:
+            code = len(self.dictionaries[column])
+            self.dictionaries[column].append(value)
+            self._codes[column][key] = code
+        return code
+
+    def _new_row_mask(self, new: Dict[str, np.ndarray]) -> np.ndarray:
+        """
+        Mask of incoming rows not already stored for the same market, commodity, variety and day
+        """
+        current = self._columns.arrays
+        # Only rows on or after the earliest incoming day can collide
+        recent = current['day'] >= new['day'].min()
+        existing = _row_keys(current, recent)
+        keys = np.concatenate((existing, _row_keys(new)))
+        # Stable sort, so the first occurrence of each key is kept: a stored row, or the first incoming copy
+        _, first = np.unique(keys, return_index=True)
+        keep = np.zeros(len(new['day']), dtype=bool)
+        keep[first[first >= len(existing)] - len(existing)] = True
+        return keep
+
+    def _decode_row(self, index: int) -> Dict:
+        arrays = self._columns.arrays
+        row = {name: self.dictionaries[name][arrays[name][index]] for name in CATEGORY_COLUMNS}
+        row['price_date'] = from_day(arrays['day'][index])
+        for name in PRICE_COLUMNS:
+            row[name] = float(arrays[name][index])
+        return row
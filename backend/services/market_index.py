@@ -0,0 +1,119 @@
+import json
+import os
+import numpy as np
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.195
+
+DEFAULT_LOCATIONS_PATH = Path(__file__).parent.parent / 'data' / 'mandi_locations.json'
+
+def haversine_km(latitude: float, longitude: float, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """
+    Great-circle distance in km from one point to arrays of points
+    """
+    lat1, lon1 = np.radians(latitude), np.radians(longitude)
+    lat2, lon2 = np.radians(latitudes), np.radians(longitudes)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+class MarketIndex:
+    """
+    In-memory grid index over mandi locations for k-nearest queries within a radius
+    """
+    def __init__(self, path: Optional[str] = None, cell_degrees: Optional[float] = None):
+        self.path = Path(path or os.getenv('MANDI_LOCATIONS_PATH', DEFAULT_LOCATIONS_PATH))
+        self.cell_degrees = cell_degrees or float(os.getenv('MANDI_INDEX_CELL_DEGREES', '0.5'))
+        self.markets: List[Dict] = []
+        self._latitudes = np.empty(0)
+        self._longitudes = np.empty(0)
+        self._cells: Dict[Tuple[int, int], np.ndarray] = {}
+        self._by_name: Dict[Tuple[str, str], List[int]] = {}
+
+    @property
+    def size(self) -> int:
+        return len(self.markets)
+
+    def load(self) -> bool:
+        """
+        Load mandi locations from the JSON file; returns False when it does not exist
+        """
+        if not self.path.exists():
+            return False
+
+        with open(self.path, encoding='utf-8') as f:
+            self.build(json.load(f))
+        return True
+
+    def build(self, markets: Iterable[Dict]):
+        """
+        Index markets that carry latitude/longitude
+        """
+        self.markets = [market for market in markets if market.get('latitude') is not None and market.get('longitude') is not None]
+        self._latitudes = np.array([market['latitude'] for market in self.markets], dtype=np.float64)
+        self._longitudes = np.array([market['longitude'] for market in self.markets], dtype=np.float64)
+
+        cells: Dict[Tuple[int, int], List[int]] = {}
+        for i, cell in enumerate(zip(*self._cell_of(self._latitudes, self._longitudes))):
+            cells.setdefault(cell, []).append(i)
+        self._cells = {cell: np.array(ids, dtype=np.intp) for cell, ids in cells.items()}
+
+        # Dataset (market, state) names, used to keep only mandis that traded a crop recently
+        self._by_name = {}
+        for i, market in enumerate(self.markets):
+            key = ((market.get('market') or market['name']).lower(), (market.get('state') or '').lower())
+            self._by_name.setdefault(key, []).append(i)
+
+    def nearest(self, latitude: float, longitude: float, radius_km: float, k: int = 10,
+                allowed: Optional[Set[Tuple[str, str]]] = None) -> List[Dict]:
+        """
+        Up to k markets within radius_km, nearest first; `allowed` restricts to (market, state) names
+        """
+        candidates = self._candidates(latitude, longitude, radius_km)
+        if allowed is not None:
+            permitted = np.array(sorted({i for key in allowed for i in self._by_name.get(key, [])}), dtype=np.intp)
+            candidates = candidates[np.isin(candidates, permitted)]
+        if not len(candidates):
+            return []
+
+        distances = haversine_km(latitude, longitude, self._latitudes[candidates], self._longitudes[candidates])
+        within = distances <= radius_km
+        candidates, distances = candidates[within], distances[within]
+        if len(candidates) > k:
+            top = np.argpartition(distances, k)[:k]
+            candidates, distances = candidates[top], distances[top]
+        order = np.argsort(distances)
+
+        return [
+            {**self.markets[i], "distance": round(float(distance), 1)}
+            for i, distance in zip(candidates[order], distances[order])
+        ]
+
+    def _candidates(self, latitude: float, longitude: float, radius_km: float) -> np.ndarray:
+        """
+        Ids of markets in every grid cell overlapping the query's bounding box
+        """
+        lat_span = radius_km / KM_PER_DEGREE
+        lon_span = radius_km / (KM_PER_DEGREE * max(np.cos(np.radians(latitude)), 0.01))
+        (lat_low, lat_high), (lon_low, lon_high) = self._cell_of(
+            np.array([latitude - lat_span, latitude + lat_span]),
+            np.array([longitude - lon_span, longitude + lon_span])
+        )
+
+        if (lat_high - lat_low + 1) * (lon_high - lon_low + 1) > len(self._cells):
+            # Huge radius: scanning the occupied cells is cheaper than enumerating the box
+            ids = [ids for (cell_lat, cell_lon), ids in self._cells.items()
+                   if lat_low <= cell_lat <= lat_high and lon_low <= cell_lon <= lon_high]
+        else:
+            ids = [self._cells[(cell_lat, cell_lon)]
+                   for cell_lat in range(lat_low, lat_high + 1)
+                   for cell_lon in range(lon_low, lon_high + 1)
+                   if (cell_lat, cell_lon) in self._cells]
+        return np.concatenate(ids) if ids else np.empty(0, dtype=np.intp)
+
+    def _cell_of(self, latitudes: np.ndarray, longitudes: np.ndarray) -> Tuple[List[int], List[int]]:
+        return (
+            np.floor(latitudes / self.cell_degrees).astype(int).tolist(),
+            np.floor(longitudes / self.cell_degrees).astype(int).tolist()
+        )
@@ -0,0 +1,305 @@
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from pymongo import monitoring
+
+# Seconds; from a cache hit to a slow upstream answer
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Bytes; from a small JSON answer to a full-size upload
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# (labels, value) samples of one metric family, as produced by a collector
+Samples = List[Tuple[Dict[str, str], float]]
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + '}'
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Value:
+    """
+    One labelled counter or gauge, updated from the event loop only
+    """
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+class _LockedValue(_Value):
+    """
+    A value also updated from other threads (such as Motor's workers); the lock costs about as much as the update
+    """
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self.lock:
+            self.value -= amount
+
+class _HistogramValue:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+class _LockedHistogramValue(_HistogramValue):
+    def __init__(self, buckets: Sequence[float]):
+        super().__init__(buckets)
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+class _Metric:
+    type = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry: Optional["Registry"] = None,
+                 threadsafe: bool = False):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.threadsafe = threadsafe
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, *values: str):
+        """
+        The child for these label values; a dict lookup once it exists
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        return _LockedValue() if self.threadsafe else _Value()
+
+    def _labelled(self):
+        return [(dict(zip(self.labelnames, values)), child) for values, child in list(self._children.items())]
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        return [(self.name, labels, child.value) for labels, child in self._labelled()]
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS, registry: Optional["Registry"] = None, threadsafe: bool = False):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry, threadsafe)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _new_child(self):
+        return _LockedHistogramValue(self.buckets) if self.threadsafe else _HistogramValue(self.buckets)
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        samples = []
+        for labels, child in self._labelled():
+            # Scrapes run on the event loop; copying first keeps a locked child's buckets consistent with its sum
+            counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", {**labels, "le": _format_value(float(bound))}, cumulative))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+class Registry:
+    """
+    Metrics updated on the hot path, plus collectors that read existing stats() counters at scrape time
+    """
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, Samples]]]] = []
+
+    def register(self, metric: _Metric):
+        self._metrics.append(metric)
+
+    def add_collector(self, collector: Callable[[], Iterable[Tuple[str, str, str, Samples]]]):
+        """
+        collector() yields (name, type, documentation, samples) for values kept elsewhere
+        """
+        self._collectors.append(collector)
+
+    def expose(self) -> str:
+        """
+        Everything in the Prometheus text exposition format (0.0.4)
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for collector in self._collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                print(f"Error collecting metrics: {str(e)}")
+                continue
+            for name, metric_type, documentation, samples in families:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+def stats_families(prefix: str, label: str, stats: Dict[str, Dict[str, Any]], gauges: Iterable[str] = ()):
+    """
+    Families for existing stats() dicts, one per `label` value
+
+    Numeric keys become {prefix}_{key}_total counters, or {prefix}_{key} gauges
+    for the keys in `gauges`; anything else (names, flags, nested dicts) is skipped.
+    """
+    gauges = set(gauges)
+    families: Dict[str, Tuple[str, Samples]] = {}
+    for value_label, values in stats.items():
+        for key, value in values.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name, metric_type = (f"{prefix}_{key}", 'gauge') if key in gauges else (f"{prefix}_{key}_total", 'counter')
+            families.setdefault(name, (metric_type, []))[1].append(({label: value_label}, value))
+    for name, (metric_type, samples) in families.items():
+        yield name, metric_type, f"{prefix} {name[len(prefix) + 1:]} per {label}", samples
+
+REGISTRY = Registry()
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+HTTP_IN_FLIGHT = Gauge('http_requests_in_flight', 'HTTP requests being handled')
+HTTP_DURATION = Histogram('http_request_duration_seconds', 'Time to the end of the response body',
+                          ['method', 'route', 'status'])
+HTTP_REQUEST_BYTES = Histogram('http_request_bytes', 'Request body size', ['route'], buckets=SIZE_BUCKETS)
+HTTP_RESPONSE_BYTES = Histogram('http_response_bytes', 'Response body size', ['route'], buckets=SIZE_BUCKETS)
+
+UPSTREAM_IN_FLIGHT = Gauge('upstream_requests_in_flight', 'Requests waiting on an upstream', ['upstream'])
+UPSTREAM_DURATION = Histogram('upstream_request_duration_seconds', 'Upstream attempt latency (hedges included)',
+                              ['upstream', 'outcome'])
+UPSTREAM_RESPONSE_BYTES = Histogram('upstream_response_bytes', 'Upstream response body size', ['upstream'],
+                                    buckets=SIZE_BUCKETS)
+
+MOCK_FALLBACKS = Counter('mock_fallbacks_total', 'Mock answers served instead of real ones', ['service', 'kind'])
+
+# Updated from Motor's worker threads
+MONGO_DURATION = Histogram('mongo_command_duration_seconds', 'MongoDB command round trips',
+                           ['command', 'collection'], threadsafe=True)
+MONGO_FAILURES = Counter('mongo_command_failures_total', 'MongoDB commands that failed', ['command', 'collection'],
+                         threadsafe=True)
+
+class HTTPMetricsMiddleware:
+    """
+    ASGI middleware recording in-flight requests, latency and body sizes per route template
+
+    The route is read after routing, so unmatched paths share one label and cannot
+    blow up the number of series. Websockets pass through untouched.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+        received = 0
+        sent = 0
+
+        async def counting_receive():
+            nonlocal received
+            message = await receive()
+            received += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            nonlocal status, sent
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_DURATION.labels(scope["method"], route, str(status)).observe(time.perf_counter() - start)
+            HTTP_REQUEST_BYTES.labels(route).observe(received)
+            HTTP_RESPONSE_BYTES.labels(route).observe(sent)
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """
+    Times every MongoDB command by name and collection; pass to the client as an event listener
+
+    Motor runs commands on its worker threads, so this is called off the event loop.
+    """
+    def __init__(self):
+        self._collections: Dict[int, str] = {}
+
+    def started(self, event):
+        target = event.command.get('collection') if event.command_name == 'getMore' else event.command.get(event.command_name)
+        self._collections[event.request_id] = target if isinstance(target, str) else ''
+
+    def succeeded(self, event):
+        collection = self._collections.pop(event.request_id, '')
+        MONGO_DURATION.labels(event.command_name, collection).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        collection = self._collections.pop(event.request_id, '')
+        MONGO_DURATION.labels(event.command_name, collection).observe(event.duration_micros / 1e6)
+        MONGO_FAILURES.labels(event.command_name, collection).inc()
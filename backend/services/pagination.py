@@ -0,0 +1,65 @@
+import base64
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional
+from bson import json_util
+from services.fast_json import dumps
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+def encode_cursor(values: List[Any]) -> str:
+    """
+    Opaque cursor for the sort-key values of the last item of a page (types such as datetime survive)
+    """
+    return base64.urlsafe_b64encode(json_util.dumps(values).encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """
+    Sort-key values from a cursor; ValueError if it was not made by encode_cursor for `size` keys
+    """
+    try:
+        values = json_util.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
+
+def keyset_filter(sort_fields: List[str], values: List[Any]) -> Dict[str, Any]:
+    """
+    Documents strictly after `values` in ascending (sort_fields) order
+    """
+    clauses = []
+    for position, field in enumerate(sort_fields):
+        clause = {earlier: values[index] for index, earlier in enumerate(sort_fields[:position])}
+        clause[field] = {"$gt": values[position]}
+        clauses.append(clause)
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+def projection(fields: Optional[str], allowed: Iterable[str], always: Iterable[str]) -> Dict[str, int]:
+    """
+    Mongo projection for a comma-separated field list; all allowed fields when none are given
+    """
+    allowed = list(allowed)
+    requested = [field.strip() for field in fields.split(',') if field.strip()] if fields else allowed
+    unknown = sorted(set(requested) - set(allowed))
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    spec = {"_id": 0}
+    spec.update({field: 1 for field in list(always) + requested})
+    return spec
+
+async def ndjson_page(cursor, sort_fields: List[str], limit: int) -> AsyncIterator[bytes]:
+    """
+    One JSON document per line as Mongo returns them, then a {"next_cursor": ...} line
+
+    Only one document is held at a time. next_cursor is null once a page comes back short.
+    """
+    count = 0
+    last = None
+    async for doc in cursor:
+        count += 1
+        last = doc
+        yield dumps(doc) + b"\n"
+
+    next_cursor = encode_cursor([last.get(field) for field in sort_fields]) if last is not None and count >= limit else None
+    yield dumps({"next_cursor": next_cursor}) + b"\n"
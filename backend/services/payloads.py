@@ -0,0 +1,153 @@
+import base64
+import hashlib
+import json
+import os
+import tempfile
+from typing import AsyncIterator, BinaryIO, Dict, Iterator, Optional, Tuple, Union
+
+# Multiple of 3 so independently encoded base64 chunks concatenate into valid base64
+CHUNK_SIZE = 3 * 16 * 1024
+PAYLOAD_PLACEHOLDER = "__BASE64_PAYLOAD__"
+
+class PayloadTooLarge(ValueError):
+    pass
+
+class Base64Payload:
+    """
+    Base64 text of a binary upload, produced chunk by chunk instead of as one large string
+
+    The source is either raw bytes/a seekable file (encoded on the fly) or text that
+    is already base64, such as the body of a data URL.
+    """
+    def __init__(self, source: Union[bytes, memoryview, BinaryIO], size: int, encoded: bool = False):
+        self.source = source
+        self.size = size
+        self.encoded = encoded
+        self._digest: Optional[str] = None
+
+    @classmethod
+    def from_data_url(cls, value: str) -> "Base64Payload":
+        """
+        Wrap a data URL or bare base64 string, skipping the "data:...;base64," prefix without slicing the string
+        """
+        start = value.find(',', 0, 256) + 1 if value.startswith('data:') else 0
+        view = memoryview(value.encode('ascii', 'ignore'))[start:]
+        return cls(view, len(view), encoded=True)
+
+    @classmethod
+    def from_bytes(cls, data: Union[bytes, bytearray, memoryview]) -> "Base64Payload":
+        view = memoryview(data)
+        return cls(view, len(view))
+
+    @classmethod
+    def from_file(cls, file: BinaryIO, size: Optional[int] = None) -> "Base64Payload":
+        if size is None:
+            file.seek(0, os.SEEK_END)
+            size = file.tell()
+        file.seek(0)
+        return cls(file, size)
+
+    @property
+    def length(self) -> int:
+        """
+        Length of the base64 text
+        """
+        return self.size if self.encoded else 4 * ((self.size + 2) // 3)
+
+    def raw_chunks(self) -> Iterator[Union[bytes, memoryview]]:
+        """
+        The source bytes as stored (base64 text for encoded sources)
+        """
+        if isinstance(self.source, memoryview):
+            for offset in range(0, self.size, CHUNK_SIZE):
+                yield self.source[offset:offset + CHUNK_SIZE]
+        else:
+            self.source.seek(0)
+            while True:
+                chunk = self.source.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+
+    def chunks(self) -> Iterator[Union[bytes, memoryview]]:
+        """
+        The base64 text in chunks
+        """
+        for chunk in self.raw_chunks():
+            yield chunk if self.encoded else base64.b64encode(chunk)
+
+    def read(self) -> bytes:
+        """
+        The decoded binary content (for local processing such as image decoding)
+        """
+        data = b"".join(self.raw_chunks())
+        return base64.b64decode(data) if self.encoded else data
+
+    def detach(self) -> "Base64Payload":
+        """
+        This payload with a file source read into memory, for work that can outlive the request that owns the file
+        """
+        if isinstance(self.source, memoryview):
+            return self
+        view = memoryview(b"".join(self.raw_chunks()))
+        detached = Base64Payload(view, len(view), self.encoded)
+        detached._digest = self._digest
+        return detached
+
+    def digest(self) -> str:
+        """
+        SHA-1 of the payload, used to key coalescing and caches
+        """
+        if self._digest is None:
+            digest = hashlib.sha1()
+            for chunk in self.raw_chunks():
+                digest.update(chunk)
+            self._digest = digest.hexdigest()
+        return self._digest
+
+class JsonPayloadBody:
+    """
+    JSON request body whose large string fields are streamed from Base64Payloads
+
+    Each PAYLOAD_PLACEHOLDER in the template is filled, in order, by one payload.
+    Iterable any number of times, so the request can be retried.
+    """
+    def __init__(self, template: Dict, *payloads: Base64Payload):
+        parts = json.dumps(template).split(f'"{PAYLOAD_PLACEHOLDER}"')
+        if len(parts) != len(payloads) + 1:
+            raise ValueError(f"Template has {len(parts) - 1} placeholders for {len(payloads)} payloads")
+        self.parts = [part.encode('utf-8') for part in parts]
+        self.payloads = payloads
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        # Each payload adds its opening and closing quote
+        length = sum(len(part) for part in self.parts) + sum(payload.length + 2 for payload in self.payloads)
+        return {'Content-Type': 'application/json', 'Content-Length': str(length)}
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        for part, payload in zip(self.parts, self.payloads):
+            yield part + b'"'
+            for chunk in payload.chunks():
+                yield chunk
+            yield b'"'
+        yield self.parts[-1]
+
+async def spool_request_body(stream: AsyncIterator[bytes], max_bytes: int,
+                             memory_bytes: int = 1024 * 1024) -> Tuple[BinaryIO, int]:
+    """
+    Copy a streamed request body into a temp file that stays in memory up to memory_bytes
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=memory_bytes)
+    size = 0
+    try:
+        async for chunk in stream:
+            size += len(chunk)
+            if size > max_bytes:
+                raise PayloadTooLarge(f"Upload exceeds {max_bytes} bytes")
+            spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool, size
@@ -0,0 +1,258 @@
+import io
+import itertools
+import json
+import os
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from models.crop_analysis import CropAnalysisResult
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it the cache is never consulted
+    Image = None
+    ImageOps = None
+
+DEFAULT_CACHE_PATH = Path(__file__).parent.parent / 'data' / 'image_cache'
+
+# Regenerated for every response, so not part of the cached analysis
+PER_REQUEST_FIELDS = {'id', 'user_id', 'image_url', 'created_at'}
+
+_DCT_SIZE = 32
+_DCT_MATRIX = np.sqrt(2 / _DCT_SIZE) * np.cos(
+    np.pi * np.arange(_DCT_SIZE)[:, None] * (2 * np.arange(_DCT_SIZE)[None, :] + 1) / (2 * _DCT_SIZE)
+)
+_DCT_MATRIX[0] /= np.sqrt(2)
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.astype(np.uint8)).tobytes(), 'big')
+
+def phash(gray: "Image.Image") -> int:
+    """
+    64-bit DCT perceptual hash: low-frequency coefficients above their median
+    """
+    pixels = np.asarray(gray.resize((_DCT_SIZE, _DCT_SIZE), Image.Resampling.BOX), dtype=np.float64)
+    low = (_DCT_MATRIX @ pixels @ _DCT_MATRIX.T)[:8, :8].ravel()
+    # Median without the DC term, which only encodes overall brightness
+    return _bits_to_int(low > np.median(low[1:]))
+
+def dhash(gray: "Image.Image") -> int:
+    """
+    64-bit difference hash: whether each pixel is brighter than its right neighbour
+    """
+    pixels = np.asarray(gray.resize((9, 8), Image.Resampling.BOX), dtype=np.int16)
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+def image_hashes(data: bytes) -> Tuple[int, int]:
+    """
+    (pHash, dHash) of an encoded image, after EXIF orientation
+    """
+    image = Image.open(io.BytesIO(data))
+    image.draft('L', (256, 256))
+    gray = ImageOps.exif_transpose(image).convert('L')
+    return phash(gray), dhash(gray)
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+class MultiIndexHash:
+    """
+    Multi-index hashing over 64-bit hashes for Hamming-radius queries
+
+    Each hash is split into `parts` disjoint 64/parts-bit substrings with an exact-match
+    table per substring. Any hash within `radius` differs from the query by at most
+    radius // parts bits in at least one substring (pigeonhole), so probing every
+    table with the query substring and its neighbours within that sub-radius finds
+    all candidates; only those are compared in full.
+    """
+    def __init__(self, radius: int, parts: int = 4, bits: int = 64):
+        self.radius = radius
+        self.width = bits // parts
+        self._shifts = [self.width * part for part in range(parts)]
+        self._mask = (1 << self.width) - 1
+        sub_radius = radius // parts
+        self._flips = [sum(1 << bit for bit in bits_set)
+                       for count in range(sub_radius + 1)
+                       for bits_set in itertools.combinations(range(self.width), count)]
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in self._shifts]
+        self.hashes: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def add(self, value: int) -> int:
+        """
+        Insert a hash and return its id
+        """
+        entry = len(self.hashes)
+        self.hashes.append(value)
+        for table, shift in zip(self._tables, self._shifts):
+            table.setdefault((value >> shift) & self._mask, []).append(entry)
+        return entry
+
+    def search(self, value: int) -> List[Tuple[int, int]]:
+        """
+        (distance, id) of every hash within the radius, nearest first
+        """
+        candidates = set()
+        for table, shift in zip(self._tables, self._shifts):
+            key = (value >> shift) & self._mask
+            for flip in self._flips:
+                bucket = table.get(key ^ flip)
+                if bucket:
+                    candidates.update(bucket)
+        matches = [(hamming(value, self.hashes[entry]), entry) for entry in candidates]
+        return sorted(match for match in matches if match[0] <= self.radius)
+
+    @classmethod
+    def from_hashes(cls, hashes: List[int], radius: int) -> "MultiIndexHash":
+        index = cls(radius)
+        for value in hashes:
+            index.add(value)
+        return index
+
+class PerceptualImageCache:
+    """
+    Crop analyses keyed by perceptual hash, so near-duplicate photos reuse an earlier diagnosis
+
+    Each image entry holds one stored result per language. A lookup matches when the
+    pHash is within `threshold` bits (found via multi-index hashing) and the dHash agrees
+    within `dhash_threshold` bits. Results are stored without their per-request fields
+    and deduplicated, since many photos share the same diagnosis.
+    """
+    def __init__(self, path: Optional[str] = None, threshold: Optional[int] = None,
+                 dhash_threshold: Optional[int] = None, max_entries: Optional[int] = None):
+        self.path = Path(path or os.getenv('IMAGE_CACHE_PATH', DEFAULT_CACHE_PATH))
+        self.threshold = threshold if threshold is not None else int(os.getenv('IMAGE_CACHE_HAMMING', '6'))
+        self.dhash_threshold = dhash_threshold if dhash_threshold is not None else int(os.getenv('IMAGE_CACHE_DHASH_HAMMING', '10'))
+        self.max_entries = max_entries or int(os.getenv('IMAGE_CACHE_MAX_ENTRIES', '50000'))
+        self.index = MultiIndexHash(self.threshold)
+        self._dhashes: List[int] = []
+        # language -> id into _payloads, per image entry
+        self._entries: List[Dict[str, int]] = []
+        # Distinct serialised analyses, parsed only on a hit
+        self._payloads: List[str] = []
+        self._payload_ids: Dict[str, int] = {}
+        self.dirty = False
+        self._counters = {"hits": 0, "language_misses": 0, "misses": 0, "stores": 0}
+
+    @property
+    def available(self) -> bool:
+        return Image is not None
+
+    @property
+    def size(self) -> int:
+        return len(self.index)
+
+    def lookup(self, hashes: Tuple[int, int], language: str) -> Optional[CropAnalysisResult]:
+        """
+        Stored analysis in `language` for the nearest near-duplicate image, if any
+        """
+        entry = self._match(hashes)
+        if entry is None:
+            self._counters["misses"] += 1
+            return None
+
+        payload_id = self._entries[entry].get(language)
+        if payload_id is None:
+            self._counters["language_misses"] += 1
+            return None
+
+        self._counters["hits"] += 1
+        return CropAnalysisResult.model_validate_json(self._payloads[payload_id])
+
+    def store(self, hashes: Tuple[int, int], language: str, result: CropAnalysisResult):
+        """
+        Remember a result, adding a language variant to an existing near-duplicate entry when there is one
+        """
+        entry = self._match(hashes)
+        if entry is None:
+            entry = self.index.add(hashes[0])
+            self._dhashes.append(hashes[1])
+            self._entries.append({})
+        self._entries[entry][language] = self._payload_id(result.model_dump_json(exclude=PER_REQUEST_FIELDS))
+        self._counters["stores"] += 1
+        self.dirty = True
+
+        if self.size > self.max_entries:
+            self._evict_oldest(self.size - int(self.max_entries * 0.9))
+
+    def stats(self) -> Dict:
+        counters = dict(self._counters)
+        total = counters["hits"] + counters["language_misses"] + counters["misses"]
+        counters["entries"] = self.size
+        counters["distinct_results"] = len(self._payloads)
+        counters["hit_ratio"] = round(counters["hits"] / total, 4) if total else 0.0
+        return counters
+
+    def load(self) -> bool:
+        """
+        Rebuild the index from disk; returns False when nothing has been saved yet
+        """
+        index_path = self.path / 'index.npz'
+        if not index_path.exists():
+            return False
+
+        with np.load(index_path) as saved:
+            hashes, dhashes = saved['phash'].tolist(), saved['dhash'].tolist()
+            results = json.loads(saved['results'].tobytes())
+
+        self.index = MultiIndexHash.from_hashes(hashes, self.threshold)
+        self._dhashes = dhashes
+        self._entries = results['entries']
+        self._payloads = results['payloads']
+        self._payload_ids = {payload: i for i, payload in enumerate(self._payloads)}
+        self.dirty = False
+        return True
+
+    def snapshot(self) -> Tuple[Dict[str, np.ndarray], Dict]:
+        """
+        Copy of the index for save(), taken on the event loop so saving can run in a thread
+        """
+        arrays = {
+            "phash": np.array(self.index.hashes, dtype=np.uint64),
+            "dhash": np.array(self._dhashes, dtype=np.uint64)
+        }
+        results = {"entries": [dict(entry) for entry in self._entries], "payloads": list(self._payloads)}
+        self.dirty = False
+        return arrays, results
+
+    def save(self, snapshot: Optional[Tuple[Dict[str, np.ndarray], Dict]] = None):
+        """
+        Write hashes and results to one file, replaced atomically
+        """
+        arrays, results = snapshot or self.snapshot()
+        encoded = np.frombuffer(json.dumps(results, ensure_ascii=False).encode('utf-8'), dtype=np.uint8)
+        self.path.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path / 'index.tmp.npz'
+        np.savez(tmp_path, results=encoded, **arrays)
+        os.replace(tmp_path, self.path / 'index.npz')
+
+    def _match(self, hashes: Tuple[int, int]) -> Optional[int]:
+        for _, entry in self.index.search(hashes[0]):
+            if hamming(hashes[1], self._dhashes[entry]) <= self.dhash_threshold:
+                return entry
+        return None
+
+    def _payload_id(self, payload: str) -> int:
+        payload_id = self._payload_ids.get(payload)
+        if payload_id is None:
+            payload_id = len(self._payloads)
+            self._payloads.append(payload)
+            self._payload_ids[payload] = payload_id
+        return payload_id
+
+    def _evict_oldest(self, count: int):
+        """
+        Drop the oldest entries, re-indexing the rest so ids stay positional
+        """
+        self.index = MultiIndexHash.from_hashes(self.index.hashes[count:], self.threshold)
+        self._dhashes = self._dhashes[count:]
+        self._entries = self._entries[count:]
+
+        # Compact away analyses no remaining entry refers to
+        used = sorted({payload_id for entry in self._entries for payload_id in entry.values()})
+        remap = {old: new for new, old in enumerate(used)}
+        self._payloads = [self._payloads[old] for old in used]
+        self._payload_ids = {payload: i for i, payload in enumerate(self._payloads)}
+        self._entries = [{language: remap[payload_id] for language, payload_id in entry.items()} for entry in self._entries]
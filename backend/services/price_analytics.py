@@ -0,0 +1,144 @@
+import warnings
+import numpy as np
+from typing import Dict, Optional, Sequence
+
+# Trend calls weaker than this many noise-standard-deviations are reported as "stable"
+STABLE_THRESHOLD = 0.5
+MIN_VOLATILITY = 1e-3
+
+def forward_fill(prices: np.ndarray) -> np.ndarray:
+    """
+    Carry the last observed price forward over missing (NaN) days, per series
+    """
+    prices = np.atleast_2d(np.asarray(prices, dtype=np.float64))
+    valid = ~np.isnan(prices)
+    index = np.where(valid, np.arange(prices.shape[1]), 0)
+    np.maximum.accumulate(index, axis=1, out=index)
+    return prices[np.arange(prices.shape[0])[:, None], index]
+
+def moving_average(prices: np.ndarray, window: int) -> np.ndarray:
+    """
+    Trailing moving average over the observed values in each window
+    """
+    prices = np.atleast_2d(prices)
+    value_totals = np.cumsum(np.nan_to_num(prices), axis=1)
+    count_totals = np.cumsum(~np.isnan(prices), axis=1).astype(np.float64)
+
+    sums, observed = value_totals.copy(), count_totals.copy()
+    sums[:, window:] = value_totals[:, window:] - value_totals[:, :-window]
+    observed[:, window:] = count_totals[:, window:] - count_totals[:, :-window]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(observed > 0, sums / observed, np.nan)
+
+def trailing_mean(prices: np.ndarray, window: int) -> np.ndarray:
+    """
+    Mean of the observed values in the last `window` days (the latest moving-average value)
+    """
+    recent = np.atleast_2d(prices)[:, -window:]
+    observed = (~np.isnan(recent)).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(observed > 0, np.nansum(recent, axis=1) / observed, np.nan)
+
+def volatility(prices: np.ndarray, window: int, filled: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Standard deviation of daily log returns over the last `window` days
+    """
+    filled = forward_fill(prices) if filled is None else filled
+    with np.errstate(invalid='ignore', divide='ignore'):
+        returns = np.diff(np.log(filled[:, -window - 1:]), axis=1)
+    if not returns.shape[1]:
+        return np.full(filled.shape[0], np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanstd(returns, axis=1)
+
+def momentum(prices: np.ndarray, window: int, filled: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Relative change between the latest price and the price `window` days earlier
+    """
+    filled = forward_fill(prices) if filled is None else filled
+    window = min(window, filled.shape[1] - 1)
+    if window < 1:
+        return np.zeros(filled.shape[0])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return filled[:, -1] / filled[:, -1 - window] - 1
+
+def percentile_bands(prices: np.ndarray, window: int, quantiles: Sequence[float] = (10, 50, 90)) -> np.ndarray:
+    """
+    Price percentiles over the last `window` days, shaped (len(quantiles), n_series)
+    """
+    # np.nanpercentile loops per row; sorting once (NaNs sort last) and interpolating is far faster
+    ordered = np.sort(np.atleast_2d(prices)[:, -window:], axis=1)
+    observed = (~np.isnan(ordered)).sum(axis=1)
+    positions = np.asarray(quantiles, dtype=np.float64)[:, None] / 100 * np.maximum(observed - 1, 0)
+    lower = np.floor(positions).astype(np.intp)
+    upper = np.minimum(lower + 1, np.maximum(observed - 1, 0))
+    fraction = positions - lower
+    low_values = np.take_along_axis(ordered, lower.T, axis=1).T
+    high_values = np.take_along_axis(ordered, upper.T, axis=1).T
+    bands = low_values + (high_values - low_values) * fraction
+    return np.where(observed > 0, bands, np.nan)
+
+def seasonal_baseline(prices: np.ndarray, days: np.ndarray, period: int = 365, tolerance: int = 7) -> np.ndarray:
+    """
+    Mean price around the same calendar date in previous years (NaN without enough history)
+    """
+    prices = np.atleast_2d(prices)
+    days = np.asarray(days)
+    lag = days[-1] - days
+    # Days within `tolerance` of one or more whole periods before the latest day
+    phase = np.abs(((lag + tolerance) % period) - tolerance)
+    mask = (lag >= period - tolerance) & (phase <= tolerance)
+    if not mask.any():
+        return np.full(prices.shape[0], np.nan)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanmean(prices[:, mask], axis=1)
+
+def analyze(prices: np.ndarray, days: Optional[np.ndarray] = None, short_window: int = 7,
+            long_window: int = 30) -> Dict[str, np.ndarray]:
+    """
+    Trend statistics, direction (-1/0/1) and confidence for every series in one vectorized pass
+
+    `prices` is (n_series, n_days) with NaN for days without trades; `days` are the
+    matching day numbers, needed only for the seasonal baseline.
+    """
+    prices = np.atleast_2d(np.asarray(prices, dtype=np.float64))
+    n_days = prices.shape[1]
+    short_window = max(1, min(short_window, n_days - 1))
+    long_window = max(short_window, min(long_window, n_days))
+
+    filled = forward_fill(prices)
+    ma_short = trailing_mean(prices, short_window)
+    ma_long = trailing_mean(prices, long_window)
+    change = momentum(prices, short_window, filled)
+    vol = np.maximum(np.nan_to_num(volatility(prices, long_window, filled)), MIN_VOLATILITY)
+    p10, p50, p90 = percentile_bands(prices, long_window)
+    baseline = seasonal_baseline(prices, days) if days is not None else np.full(prices.shape[0], np.nan)
+
+    # Momentum and MA crossover, both scaled by the noise expected over the short horizon
+    noise = vol * np.sqrt(short_window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        crossover = (ma_short - ma_long) / ma_long
+        score = np.nan_to_num(0.5 * change / noise + 0.5 * crossover / noise)
+
+    direction = np.where(score > STABLE_THRESHOLD, 1, np.where(score < -STABLE_THRESHOLD, -1, 0))
+    decisiveness = np.where(direction != 0, np.tanh(np.abs(score)), 1 - np.tanh(np.abs(score)))
+    coverage = (~np.isnan(prices[:, -long_window:])).mean(axis=1)
+    confidence = 0.5 + 0.45 * decisiveness * coverage
+
+    return {
+        'last': filled[:, -1],
+        'ma_short': ma_short,
+        'ma_long': ma_long,
+        'momentum': change,
+        'volatility': vol,
+        'p10': p10,
+        'p50': p50,
+        'p90': p90,
+        'seasonal_baseline': baseline,
+        'score': score,
+        'direction': direction,
+        'confidence': confidence
+    }
@@ -0,0 +1,257 @@
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+import httpx
+from services.metrics import UPSTREAM_DURATION, UPSTREAM_IN_FLIGHT, UPSTREAM_RESPONSE_BYTES
+
+# Statuses that mean the upstream is struggling rather than that the request was wrong
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+class UpstreamUnavailable(RuntimeError):
+    """
+    Raised instead of calling an upstream whose circuit breaker is open
+    """
+
+class LatencyWindow:
+    """
+    Latencies of the most recent calls to one upstream
+    """
+    def __init__(self, size: int):
+        self.samples = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures, failing calls fast while open
+
+    After `reset_seconds` one call goes through as a probe (half open). Its success
+    closes the breaker and its failure opens it for another period; a probe that is
+    cancelled before reporting back is simply followed by another after that period.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, threshold: int, reset_seconds: float):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            self.state = self.HALF_OPEN
+            self.opened_at = time.monotonic()
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.state = self.CLOSED
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.threshold):
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.opens += 1
+
+class UpstreamGuard:
+    """
+    Adaptive timeouts, a circuit breaker, jittered retries and optional hedging for one upstream
+
+    Once UPSTREAM_MIN_SAMPLES calls have completed, each attempt times out at
+    UPSTREAM_TIMEOUT_MULTIPLIER x the recent p99 latency (never below
+    UPSTREAM_MIN_TIMEOUT_SECONDS), instead of always waiting the caller's full
+    timeout. Timeouts, transport errors and 429/5xx answers count as failures;
+    enough in a row open the breaker, and callers then get UpstreamUnavailable
+    at once and fall back to their mocks. A hedged call sends a second copy of a
+    request still unanswered at the recent p95 latency, and takes whichever
+    answers first.
+    """
+    def __init__(self, name: str, hedge: bool = False):
+        self.name = name
+        self.hedge = hedge
+        self.latencies = LatencyWindow(int(os.getenv('UPSTREAM_LATENCY_WINDOW', '200')))
+        self.min_samples = int(os.getenv('UPSTREAM_MIN_SAMPLES', '20'))
+        self.timeout_multiplier = float(os.getenv('UPSTREAM_TIMEOUT_MULTIPLIER', '2'))
+        self.min_timeout = float(os.getenv('UPSTREAM_MIN_TIMEOUT_SECONDS', '2'))
+        self.hedge_percentile = float(os.getenv('UPSTREAM_HEDGE_PERCENTILE', '95'))
+        self.max_retries = int(os.getenv('UPSTREAM_MAX_RETRIES', '1'))
+        self.backoff_base = float(os.getenv('UPSTREAM_BACKOFF_SECONDS', '0.2'))
+        self.backoff_cap = float(os.getenv('UPSTREAM_BACKOFF_CAP_SECONDS', '2'))
+        self.breaker = CircuitBreaker(
+            int(os.getenv('UPSTREAM_BREAKER_FAILURES', '5')),
+            float(os.getenv('UPSTREAM_BREAKER_RESET_SECONDS', '30'))
+        )
+        self.requests = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.short_circuited = 0
+
+    def timeout(self, ceiling: float) -> float:
+        """
+        Per-attempt timeout from recent latencies; the caller's timeout until there are enough of them
+        """
+        if len(self.latencies) < self.min_samples:
+            return ceiling
+        adaptive = self.latencies.percentile(99) * self.timeout_multiplier
+        return min(ceiling, max(self.min_timeout, adaptive))
+
+    def admit(self) -> bool:
+        """
+        Count a call in, raising UpstreamUnavailable while the breaker is open; True for a half-open probe
+        """
+        if not self.breaker.allow():
+            self.short_circuited += 1
+            raise UpstreamUnavailable(f"{self.name} circuit breaker is open")
+        self.requests += 1
+        return self.breaker.state == CircuitBreaker.HALF_OPEN
+
+    def record(self, ok: bool):
+        if ok:
+            self.breaker.record_success()
+        else:
+            self.failures += 1
+            self.breaker.record_failure()
+
+    async def call(self, send: Callable[[float], Awaitable[httpx.Response]], ceiling: float,
+                   hedge: Optional[bool] = None, adaptive: bool = True) -> httpx.Response:
+        """
+        send(timeout) through the breaker, retrying failures with jittered backoff
+
+        `ceiling` (the caller's timeout) bounds the whole call, retries included. A
+        half-open probe gets the full ceiling and no retries or hedge, so an upstream
+        that has become slower for good can still close the breaker again.
+        """
+        probe = self.admit()
+        hedge = (self.hedge if hedge is None else hedge) and adaptive and not probe
+        deadline = time.monotonic() + ceiling
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            timeout = min(self.timeout(ceiling), remaining) if adaptive and not probe else remaining
+            error = None
+            response = None
+            try:
+                response = await self._attempt(send, timeout, hedge, adaptive)
+            except (httpx.TransportError, asyncio.TimeoutError) as e:
+                error = e
+
+            if error is None and response.status_code not in RETRYABLE_STATUSES:
+                self.record(True)
+                return response
+            self.record(False)
+
+            # Full jitter, so callers that failed together do not retry together
+            backoff = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+            out_of_time = deadline - time.monotonic() - backoff < self.min_timeout
+            if probe or attempt >= self.max_retries or self.breaker.state != CircuitBreaker.CLOSED or out_of_time:
+                if error is not None:
+                    raise error
+                return response
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(backoff)
+
+    def get_stats(self) -> Dict[str, Any]:
+        p50, p95, p99 = (self.latencies.percentile(q) for q in (50, 95, 99))
+        return {
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "opens": self.breaker.opens,
+            "requests": self.requests,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "short_circuited": self.short_circuited,
+            "samples": len(self.latencies),
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "p99_ms": round(p99 * 1000, 1) if p99 is not None else None,
+            # The per-attempt timeout a call with a 30 second timeout would get now
+            "timeout_seconds": round(self.timeout(30.0), 3)
+        }
+
+    async def _attempt(self, send, timeout: float, hedge: bool, adaptive: bool) -> httpx.Response:
+        hedge_delay = self.latencies.percentile(self.hedge_percentile) if len(self.latencies) >= self.min_samples else None
+        if not hedge or hedge_delay is None or hedge_delay >= timeout:
+            return await self._timed(send, timeout, adaptive)
+
+        first = asyncio.ensure_future(self._timed(send, timeout, adaptive))
+        tasks = [first]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            if done:
+                return first.result()
+
+            self.hedges += 1
+            second = asyncio.ensure_future(self._timed(send, timeout - hedge_delay, adaptive))
+            tasks.append(second)
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                answered = [task for task in done if task.exception() is None]
+                for task in done:
+                    error = task.exception() or error
+                if answered:
+                    if second in answered and first not in answered:
+                        self.hedge_wins += 1
+                    return answered[0].result()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _timed(self, send, timeout: float, adaptive: bool) -> httpx.Response:
+        start = time.monotonic()
+        in_flight = UPSTREAM_IN_FLIGHT.labels(self.name)
+        in_flight.inc()
+        # Stays "cancelled" for the losing copy of a hedged request
+        outcome = "cancelled"
+        try:
+            response = await asyncio.wait_for(send(timeout), timeout)
+            outcome = "error" if response.status_code in RETRYABLE_STATUSES else "ok"
+        except (asyncio.TimeoutError, httpx.TimeoutException):
+            outcome = "timeout"
+            self.timeouts += 1
+            # A call that timed out took at least this long, which lets timeouts grow back after a slowdown
+            if adaptive:
+                self.latencies.add(timeout)
+            raise
+        except httpx.TransportError:
+            outcome = "error"
+            raise
+        finally:
+            in_flight.dec()
+            UPSTREAM_DURATION.labels(self.name, outcome).observe(time.monotonic() - start)
+
+        UPSTREAM_RESPONSE_BYTES.labels(self.name).observe(len(response.content))
+        if adaptive and outcome == "ok":
+            self.latencies.add(time.monotonic() - start)
+        return response
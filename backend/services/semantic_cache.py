@@ -0,0 +1,203 @@
+import hashlib
+import heapq
+import json
+import os
+import re
+import time
+import unicodedata
+import zlib
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+from services.cache import LRUCache
+
+_WHITESPACE = re.compile(r'\s+')
+
+# Crop names (English and Hindi) mapped to one name per crop; questions about different crops never share an answer
+CROP_TERMS = {
+    'tomato': 'tomato', 'tomatoes': 'tomato', 'टमाटर': 'tomato',
+    'potato': 'potato', 'potatoes': 'potato', 'आलू': 'potato',
+    'onion': 'onion', 'onions': 'onion', 'प्याज': 'onion',
+    'wheat': 'wheat', 'गेहूं': 'wheat', 'गेहूँ': 'wheat',
+    'rice': 'rice', 'paddy': 'rice', 'चावल': 'rice', 'धान': 'rice',
+    'cotton': 'cotton', 'कपास': 'cotton',
+    'sugarcane': 'sugarcane', 'गन्ना': 'sugarcane',
+    'maize': 'maize', 'corn': 'maize', 'मक्का': 'maize',
+    'barley': 'barley', 'जौ': 'barley',
+    'mustard': 'mustard', 'सरसों': 'mustard',
+    'groundnut': 'groundnut', 'peanut': 'groundnut', 'peanuts': 'groundnut', 'मूंगफली': 'groundnut',
+    'soybean': 'soybean', 'soybeans': 'soybean', 'soya': 'soybean', 'सोयाबीन': 'soybean',
+    'brinjal': 'brinjal', 'eggplant': 'brinjal', 'बैंगन': 'brinjal',
+    'chilli': 'chilli', 'chillies': 'chilli', 'chili': 'chilli', 'मिर्च': 'chilli',
+    'okra': 'okra', 'bhindi': 'okra', 'भिंडी': 'okra',
+    'cabbage': 'cabbage', 'पत्तागोभी': 'cabbage',
+    'cauliflower': 'cauliflower', 'फूलगोभी': 'cauliflower',
+    'gram': 'gram', 'chickpea': 'gram', 'chickpeas': 'gram', 'चना': 'gram',
+    'banana': 'banana', 'bananas': 'banana', 'केला': 'banana',
+    'mango': 'mango', 'mangoes': 'mango', 'आम': 'mango'
+}
+# "don't" normalises to "don t", hence the lone "t"
+NEGATION_TERMS = {'not', 'no', 'never', 'without', 'nothing', 't', 'नहीं', 'न', 'मत', 'बिना'}
+
+def normalize_message(message: str) -> str:
+    """
+    Case-fold, drop punctuation and collapse whitespace, keeping letters, digits and combining marks
+    """
+    text = unicodedata.normalize('NFKC', message).casefold()
+    kept = ''.join(ch if unicodedata.category(ch)[0] in ('L', 'M', 'N') else ' ' for ch in text)
+    return _WHITESPACE.sub(' ', kept).strip()
+
+def context_partition(language: str, context: Optional[Dict]) -> str:
+    """
+    Cache partition for a language and context; numbers are rounded so ₹15.2 and ₹15.4 share answers
+    """
+    fields = {}
+    for key, value in sorted((context or {}).items()):
+        fields[key] = round(value) if isinstance(value, float) else value
+    return f"{language}|{json.dumps(fields, ensure_ascii=False, sort_keys=True, default=str)}"
+
+def entity_partition(normalized: str) -> str:
+    """
+    Crops named in a normalised message and whether it is negated; only messages that agree on both can match by similarity
+    """
+    words = normalized.split(' ')
+    crops = sorted({CROP_TERMS[word] for word in words if word in CROP_TERMS})
+    negated = any(word in NEGATION_TERMS for word in words)
+    return f"{'+'.join(crops)}|{'not' if negated else ''}"
+
+def shingles(text: str, size: int = 3) -> Set[str]:
+    """
+    Character n-grams of the normalised text (robust to spelling and word-order noise in short queries)
+    """
+    padded = f" {text} "
+    if len(padded) <= size:
+        return {padded}
+    return {padded[i:i + size] for i in range(len(padded) - size + 1)}
+
+class MinHasher:
+    """
+    MinHash signatures over string sets using 32-bit universal hashing
+    """
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self._a = rng.integers(1, 2 ** 32, num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2 ** 32, num_perm, dtype=np.uint64)
+
+    def signature(self, items: Set[str]) -> np.ndarray:
+        values = np.fromiter((zlib.crc32(item.encode('utf-8')) for item in items), dtype=np.uint64, count=len(items))
+        hashed = (self._a[:, None] * values[None, :] + self._b[:, None]) & np.uint64(0xFFFFFFFF)
+        return hashed.min(axis=1)
+
+class SemanticResponseCache:
+    """
+    Two-tier answer cache: exact match on the normalised message, then MinHash LSH similarity
+
+    Similar matches are only looked for among messages naming the same crops with
+    the same negation (see entity_partition), since trigram overlap cannot tell
+    "potato" from "tomato" or "turning yellow" from "not turning yellow".
+    """
+    def __init__(self, ttl: Optional[float] = None, max_entries: Optional[int] = None,
+                 threshold: Optional[float] = None, num_perm: int = 64, bands: int = 16,
+                 max_candidates: int = 16):
+        self.ttl = ttl if ttl is not None else float(os.getenv('CHAT_CACHE_TTL_SECONDS', '86400'))
+        self.max_entries = max_entries or int(os.getenv('CHAT_CACHE_MAX_ENTRIES', '10000'))
+        self.threshold = threshold if threshold is not None else float(os.getenv('CHAT_CACHE_SIMILARITY', '0.9'))
+        self.bands = bands
+        self.max_candidates = max_candidates
+        self.rows = num_perm // bands
+        self.hasher = MinHasher(num_perm)
+
+        self.exact = LRUCache(self.max_entries)
+        self._entries: "OrderedDict[str, Tuple[str, Set[str], np.ndarray, Any, float]]" = OrderedDict()
+        self._buckets: Dict[Tuple[str, int, bytes], Set[str]] = {}
+        self._counters = {"exact_hits": 0, "similar_hits": 0, "misses": 0, "stores": 0}
+
+    def lookup(self, message: str, language: str, context: Optional[Dict] = None) -> Optional[Any]:
+        """
+        Cached value for an identical or sufficiently similar message in the same partition
+        """
+        partition = context_partition(language, context)
+        normalized = normalize_message(message)
+        key = self._key(partition, normalized)
+
+        entry = self.exact.get(key)
+        if entry is not None and time.time() - entry[1] < self.ttl:
+            self._counters["exact_hits"] += 1
+            return entry[0]
+
+        match = self._find_similar(f"{partition}|{entity_partition(normalized)}", normalized)
+        if match is not None:
+            self._counters["similar_hits"] += 1
+            return match
+
+        self._counters["misses"] += 1
+        return None
+
+    def store(self, message: str, language: str, context: Optional[Dict], value: Any):
+        partition = context_partition(language, context)
+        normalized = normalize_message(message)
+        key = self._key(partition, normalized)
+        now = time.time()
+
+        self.exact.set(key, value, now)
+        self._remove(key)
+        items = shingles(normalized)
+        signature = self.hasher.signature(items)
+        partition = f"{partition}|{entity_partition(normalized)}"
+        self._entries[key] = (partition, items, signature, value, now)
+        for band in self._bands(signature):
+            self._buckets.setdefault((partition, *band), set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+        self._counters["stores"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        counters = dict(self._counters)
+        hits = counters["exact_hits"] + counters["similar_hits"]
+        total = hits + counters["misses"]
+        counters["entries"] = len(self._entries)
+        counters["hit_ratio"] = round(hits / total, 4) if total else 0.0
+        return counters
+
+    def _find_similar(self, partition: str, normalized: str) -> Optional[Any]:
+        items = shingles(normalized)
+        signature = self.hasher.signature(items)
+        collisions: Dict[str, int] = {}
+        for band in self._bands(signature):
+            for key in self._buckets.get((partition, *band), ()):
+                collisions[key] = collisions.get(key, 0) + 1
+        # Entries sharing the most bands are the likeliest matches; bound the work per lookup
+        candidates = heapq.nlargest(self.max_candidates, collisions, key=collisions.get)
+
+        best_value, best_score = None, self.threshold
+        now = time.time()
+        for key in candidates:
+            _, stored_items, _, value, stored_at = self._entries[key]
+            if now - stored_at >= self.ttl:
+                continue
+            # Exact Jaccard on the (small) shingle sets; LSH only narrows the candidates
+            score = len(items & stored_items) / len(items | stored_items)
+            if score >= best_score:
+                best_value, best_score = value, score
+                self._entries.move_to_end(key)
+        return best_value
+
+    def _bands(self, signature: np.ndarray) -> List[Tuple[int, bytes]]:
+        return [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        partition, _, signature, _, _ = entry
+        for band in self._bands(signature):
+            bucket = self._buckets.get((partition, *band))
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[(partition, *band)]
+
+    @staticmethod
+    def _key(partition: str, normalized: str) -> str:
+        return hashlib.sha1(f"{partition}\n{normalized}".encode('utf-8')).hexdigest()
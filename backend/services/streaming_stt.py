@@ -0,0 +1,187 @@
+import asyncio
+import os
+from typing import Any, AsyncIterator, Dict, List, Optional
+from models.chat import StreamingTranscript, VoiceResponse
+from services.audio_preprocess import AudioPreprocessor
+from services.voice_service import VoiceService
+
+class ChunkedRecognizer:
+    """
+    Streaming recognition over the Speech-to-Text REST API
+
+    Google's streamingRecognize is only offered over gRPC, so recognition runs on
+    pieces of the recording while the client is still sending it. When the audio
+    preprocessor can decode the recording (WAV, or webm/ogg with ffmpeg installed),
+    each chunk is decoded as it arrives, and every `interval` seconds the speech
+    that has been followed by a pause is recognised once and dropped from the
+    decoder, so only the utterance still in progress is looked at again and sent
+    for the interim transcript. When the recording ends only that last utterance is
+    left to recognise, so the final transcript arrives about one short recognize
+    call after the end of speech, whatever the length of the recording.
+
+    Recordings that cannot be decoded here are sent as they are: the recording so
+    far is re-recognised for up to STT_STREAM_MAX_INTERIM interim transcripts, and
+    the whole recording once more for the final one. Only the interim results arrive
+    sooner in that case.
+    """
+    def __init__(self, voice_service: VoiceService, interval: Optional[float] = None,
+                 preprocessor: Optional[AudioPreprocessor] = None, max_interim: Optional[int] = None):
+        self.voice_service = voice_service
+        self.preprocessor = preprocessor if preprocessor is not None else voice_service.audio_preprocessor
+        self.interval = interval or float(os.getenv('STT_STREAM_INTERVAL_SECONDS', '1.0'))
+        self.max_interim = max_interim if max_interim is not None else int(os.getenv('STT_STREAM_MAX_INTERIM', '3'))
+
+    async def stream(self, audio: AsyncIterator[bytes], language: str, encoding: str = "WEBM_OPUS",
+                     sample_rate: int = 48000) -> AsyncIterator[StreamingTranscript]:
+        """
+        Interim transcripts while `audio` (in `encoding` at `sample_rate`) is received, then the final one
+        """
+        buffer = bytearray()
+        ended = asyncio.Event()
+        # Recognitions of settled speech, in recording order
+        settled: List[asyncio.Future] = []
+        decoder = self.preprocessor.open_stream(encoding, sample_rate) if self.preprocessor is not None else None
+        whole_interims = 0
+
+        def give_up():
+            nonlocal decoder
+            self.preprocessor.undecodable_stream(len(buffer))
+            decoder.close()
+            decoder = None
+
+        async def receive():
+            try:
+                async for chunk in audio:
+                    buffer.extend(chunk)
+                    if decoder is not None and not await decoder.feed(chunk):
+                        give_up()
+            finally:
+                ended.set()
+
+        async def interim_transcript() -> Optional[str]:
+            nonlocal whole_interims
+            if decoder is not None:
+                prepared = await self.preprocessor.settle(decoder)
+                if prepared is not None:
+                    settled.extend(self._recognize_chunks(prepared, language))
+                    tail = None
+                    if prepared["tail"]:
+                        tail = await self._recognize(prepared["tail"], language, prepared["encoding"], prepared["sample_rate"])
+                    done = [task.result() for task in settled if task.done()]
+                    return self._join(done + [tail]) or None
+            whole_interims += 1
+            result = await self._recognize(bytes(buffer), language, encoding, sample_rate)
+            return result.transcript if result else None
+
+        receiver = asyncio.ensure_future(receive())
+        end_waiter = asyncio.ensure_future(ended.wait())
+        interim: Optional[asyncio.Future] = None
+        recognized_bytes = 0
+        last_transcript = None
+        try:
+            while True:
+                waiters = {end_waiter, interim} if interim else {end_waiter}
+                done, _ = await asyncio.wait(waiters, timeout=None if interim else self.interval,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if end_waiter in done:
+                    break
+
+                if interim in done:
+                    transcript, interim = interim.result(), None
+                    if transcript and transcript != last_transcript:
+                        last_transcript = transcript
+                        yield StreamingTranscript(transcript=transcript, language=language)
+                elif len(buffer) > recognized_bytes and (decoder is not None or whole_interims < self.max_interim):
+                    recognized_bytes = len(buffer)
+                    interim = asyncio.ensure_future(interim_transcript())
+
+            # Surface errors from the audio source
+            await receiver
+            if interim:
+                interim.cancel()
+                interim = None
+
+            result = None
+            if decoder is not None and buffer and not await decoder.finish():
+                give_up()
+            if buffer:
+                prepared = await self.preprocessor.settle(decoder, final=True) if decoder is not None else None
+                if prepared is not None:
+                    settled.extend(self._recognize_chunks(prepared, language))
+                    results = [item for item in await asyncio.gather(*settled) if item is not None]
+                    result = VoiceResponse(
+                        transcript=self._join(results),
+                        confidence=sum(item.confidence or 0.0 for item in results) / len(results) if results else 0.0,
+                        language=language
+                    )
+                else:
+                    result = await self._recognize(bytes(buffer), language, encoding, sample_rate)
+            if result is None:
+                result = VoiceResponse(transcript=last_transcript or "", confidence=None, language=language)
+            yield self._event(result, language, is_final=True)
+        finally:
+            for task in [receiver, end_waiter, interim] + settled:
+                if task:
+                    task.cancel()
+            if decoder is not None:
+                decoder.close()
+
+    def _recognize_chunks(self, prepared: Dict[str, Any], language: str) -> List[asyncio.Future]:
+        return [
+            asyncio.ensure_future(self._recognize(chunk, language, prepared["encoding"], prepared["sample_rate"]))
+            for chunk in prepared["segments"]
+        ]
+
+    async def _recognize(self, audio: bytes, language: str, encoding: str, sample_rate: int) -> Optional[VoiceResponse]:
+        try:
+            return await self.voice_service.recognize_audio(audio, language, encoding, sample_rate)
+        except Exception as e:
+            print(f"Error in streaming transcription: {str(e)}")
+            return None
+
+    @staticmethod
+    def _join(results: List[Optional[VoiceResponse]]) -> str:
+        return " ".join(result.transcript for result in results if result is not None and result.transcript)
+
+    def _event(self, result: VoiceResponse, language: str, is_final: bool) -> StreamingTranscript:
+        return StreamingTranscript(
+            transcript=result.transcript,
+            is_final=is_final,
+            confidence=result.confidence,
+            language=language
+        )
+
+class LocalRecognizer:
+    """
+    Stand-in recognizer for development and tests, no network involved
+
+    Reveals `transcript` (the mock transcription for the language by default) one
+    word per `bytes_per_word` bytes of audio received, then sends it whole as the
+    final result.
+    """
+    def __init__(self, transcript: Optional[str] = None, bytes_per_word: Optional[int] = None):
+        self.transcript = transcript
+        self.bytes_per_word = bytes_per_word or int(os.getenv('STT_LOCAL_BYTES_PER_WORD', '8000'))
+
+    async def stream(self, audio: AsyncIterator[bytes], language: str, encoding: str = "WEBM_OPUS",
+                     sample_rate: int = 48000) -> AsyncIterator[StreamingTranscript]:
+        words = (self.transcript or VoiceService()._get_mock_transcription(language).transcript).split()
+        received = 0
+        revealed = 0
+        async for chunk in audio:
+            received += len(chunk)
+            count = min(len(words), received // self.bytes_per_word)
+            if count > revealed:
+                revealed = count
+                yield StreamingTranscript(transcript=" ".join(words[:count]), confidence=0.5, language=language)
+
+        yield StreamingTranscript(transcript=" ".join(words), is_final=True, confidence=0.85, language=language)
+
+def create_recognizer(voice_service: VoiceService):
+    """
+    Recognizer named by STT_STREAMING_RECOGNIZER ("chunked" or "local"); local without an API key
+    """
+    kind = os.getenv('STT_STREAMING_RECOGNIZER', 'chunked').lower()
+    if kind == 'local' or not voice_service.vertex_api_key:
+        return LocalRecognizer()
+    return ChunkedRecognizer(voice_service)
@@ -0,0 +1,130 @@
+import asyncio
+import os
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, Optional, Tuple
+from services.task_service import TaskService
+
+CHECKPOINT_ID = "task_calendar"
+
+def parse_window(value: str) -> Tuple[time, time]:
+    """
+    "HH:MM-HH:MM" as (start, end); the window may wrap past midnight
+    """
+    start, end = value.split('-')
+    return time.fromisoformat(start.strip()), time.fromisoformat(end.strip())
+
+class TaskCalendarPrecomputer:
+    """
+    Generates the next TASK_PRECOMPUTE_WEEKS weeks of tasks for every user's primary_crops ahead of time
+
+    A pass walks the users in id order, a page at a time, and hands each page's
+    plantings to TaskService.generate_season_tasks (bulk upserts with bounded
+    concurrency). After each page the last user id is checkpointed in Mongo, so a
+    pass cut short by a restart or by the end of the off-peak window resumes where it
+    stopped. One pass runs per local day.
+    """
+    def __init__(self, db, task_service: Optional[TaskService] = None, weeks: Optional[int] = None,
+                 page_size: Optional[int] = None, concurrency: Optional[int] = None):
+        self.db = db
+        self.task_service = task_service or TaskService(db)
+        self.weeks = weeks or int(os.getenv('TASK_PRECOMPUTE_WEEKS', '4'))
+        self.page_size = page_size or int(os.getenv('TASK_PRECOMPUTE_PAGE_SIZE', '200'))
+        self.concurrency = concurrency or int(os.getenv('TASK_PRECOMPUTE_CONCURRENCY', '2'))
+        # Off-peak hours in local time (IST by default)
+        self.window = parse_window(os.getenv('TASK_PRECOMPUTE_WINDOW', '01:00-05:00'))
+        self.utc_offset = timedelta(hours=float(os.getenv('TASK_PRECOMPUTE_UTC_OFFSET_HOURS', '5.5')))
+        self.check_interval = float(os.getenv('TASK_PRECOMPUTE_CHECK_MINUTES', '15')) * 60
+
+    def local_now(self) -> datetime:
+        return datetime.utcnow() + self.utc_offset
+
+    def in_window(self, now: Optional[datetime] = None) -> bool:
+        current = (now or self.local_now()).time()
+        start, end = self.window
+        if start <= end:
+            return start <= current < end
+        return current >= start or current < end
+
+    async def run_once(self, today: Optional[date] = None, respect_window: bool = True) -> Dict[str, Any]:
+        """
+        Run (or resume) today's pass; returns its checkpoint
+        """
+        today = today or self.local_now().date()
+        checkpoint = await self.db.precompute_checkpoints.find_one({"_id": CHECKPOINT_ID})
+        if not checkpoint or checkpoint.get("pass_date") != today.isoformat():
+            checkpoint = {
+                "_id": CHECKPOINT_ID,
+                "pass_date": today.isoformat(),
+                "last_user_id": None,
+                "users": 0,
+                "operations": 0,
+                "created": 0,
+                "completed": False
+            }
+        if checkpoint["completed"]:
+            return checkpoint
+
+        end_date = today + timedelta(weeks=self.weeks) - timedelta(days=1)
+        while not respect_window or self.in_window():
+            query: Dict[str, Any] = {"primary_crops.0": {"$exists": True}}
+            if checkpoint["last_user_id"] is not None:
+                query["id"] = {"$gt": checkpoint["last_user_id"]}
+            users = await self.db.users.find(
+                query, {"_id": 0, "id": 1, "primary_crops": 1, "location": 1, "language": 1}
+            ).sort("id", 1).limit(self.page_size).to_list(self.page_size)
+
+            if users:
+                plantings = [
+                    (user["id"], crop, user.get("location") or "", user.get("language") or "hi")
+                    for user in users for crop in user["primary_crops"]
+                ]
+                counts = await self.task_service.generate_season_tasks(
+                    plantings, today, end_date, concurrency=self.concurrency
+                )
+                checkpoint["last_user_id"] = users[-1]["id"]
+                checkpoint["users"] += len(users)
+                checkpoint["operations"] += counts["operations"]
+                checkpoint["created"] += counts["created"]
+            checkpoint["completed"] = len(users) < self.page_size
+            checkpoint["updated_at"] = datetime.utcnow()
+            await self.db.precompute_checkpoints.replace_one({"_id": CHECKPOINT_ID}, checkpoint, upsert=True)
+            if checkpoint["completed"]:
+                break
+
+        return checkpoint
+
+    async def run_forever(self):
+        """
+        Check every TASK_PRECOMPUTE_CHECK_MINUTES minutes and work through the pass while inside the window
+        """
+        while True:
+            try:
+                if self.in_window():
+                    checkpoint = await self.run_once()
+                    state = "complete" if checkpoint["completed"] else f"paused after user {checkpoint['last_user_id']}"
+                    print(f"Task calendar precompute for {checkpoint['pass_date']} {state}: "
+                          f"{checkpoint['users']} users, {checkpoint['created']} tasks created")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error in task calendar precompute: {str(e)}")
+            await asyncio.sleep(self.check_interval)
+
+
+async def _main():
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent.parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    try:
+        checkpoint = await TaskCalendarPrecomputer(client[os.environ['DB_NAME']]).run_once(respect_window=False)
+    finally:
+        client.close()
+    print(f"Pass {checkpoint['pass_date']}: {checkpoint['users']} users, {checkpoint['operations']} upserts, "
+          f"{checkpoint['created']} tasks created")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -1,8 +1,22 @@
+import asyncio
 import json
 import os
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterable, List, Optional, Tuple
 from datetime import datetime, date, timedelta
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 from models.task import Task, TaskCreate, TaskUpdate
+from services.pagination import DEFAULT_PAGE_SIZE, decode_cursor, keyset_filter, projection
+
+DUPLICATE_KEY_ERROR = 11000
+# Keyset order of task pages; id breaks ties within a day
+TASK_PAGE_SORT = ["due_date", "id"]
+
+def generation_key(user_id: str, crop_type: str, due_date: date, title: str) -> str:
+    """
+    Identity of a generated task, so generating the same day twice never duplicates it
+    """
+    return f"{user_id}|{crop_type.lower()}|{due_date.isoformat()}|{title}"
 
 class TaskService:
     def __init__(self, db):
@@ -14,7 +28,7 @@ class TaskService:
         """
         try:
             task = Task(**task_data.dict())
-            task_dict = task.dict()
+            task_dict = self._task_document(task)
             
             # Insert into database
             result = await self.db.tasks.insert_one(task_dict)
@@ -49,6 +63,89 @@ class TaskService:
             print(f"Error fetching tasks: {str(e)}")
             return []
     
+    async def get_task_documents(self, user_id: str, date_filter: Optional[date] = None) -> List[Dict[str, Any]]:
+        """
+        get_tasks as stored documents (Task fields only), for responses that are encoded without building models
+        """
+        try:
+            query = {"user_id": user_id}
+            
+            if date_filter:
+                query["due_date"] = date_filter.isoformat()
+            
+            return await self.db.tasks.find(query, projection(None, Task.model_fields, [])).to_list(None)
+            
+        except Exception as e:
+            print(f"Error fetching tasks: {str(e)}")
+            return []
+    
+    async def get_task_calendar(self, user_id: str, start_date: date, end_date: date) -> List[Task]:
+        """
+        A user's tasks from start_date to end_date (inclusive) in due order, as one indexed read
+        """
+        try:
+            cursor = self.db.tasks.find({
+                "user_id": user_id,
+                "due_date": {"$gte": start_date.isoformat(), "$lte": end_date.isoformat()}
+            }).sort([("due_date", 1), ("due_time", 1)])
+            tasks = []
+            
+            async for task_doc in cursor:
+                task_doc['id'] = str(task_doc.pop('_id'))
+                tasks.append(Task(**task_doc))
+            
+            return tasks
+            
+        except Exception as e:
+            print(f"Error fetching task calendar: {str(e)}")
+            return []
+    
+    def find_task_page(self, user_id: str, start_date: Optional[date] = None, end_date: Optional[date] = None,
+                       fields: Optional[str] = None, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE):
+        """
+        Mongo cursor over one keyset page of a user's tasks in (due_date, id) order
+        
+        Only the requested fields (comma-separated Task fields) are read, plus the
+        sort keys; raises ValueError for an invalid cursor or unknown field.
+        """
+        query: Dict[str, Any] = {"user_id": user_id}
+        date_range = {}
+        if start_date:
+            date_range["$gte"] = start_date.isoformat()
+        if end_date:
+            date_range["$lte"] = end_date.isoformat()
+        if date_range:
+            query["due_date"] = date_range
+        if cursor:
+            query = {"$and": [query, keyset_filter(TASK_PAGE_SORT, decode_cursor(cursor, len(TASK_PAGE_SORT)))]}
+        
+        return self.db.tasks.find(
+            query, projection(fields, Task.model_fields, TASK_PAGE_SORT)
+        ).sort([(field, 1) for field in TASK_PAGE_SORT]).limit(limit)
+    
+    async def get_pending_tasks(self, user_id: str, due_by: Optional[date] = None) -> List[Task]:
+        """
+        Incomplete tasks for a user in due order, optionally only those due by a date
+        """
+        try:
+            query = {"user_id": user_id, "completed": False}
+            
+            if due_by:
+                query["due_date"] = {"$lte": due_by.isoformat()}
+            
+            cursor = self.db.tasks.find(query).sort([("due_date", 1), ("due_time", 1)])
+            tasks = []
+            
+            async for task_doc in cursor:
+                task_doc['id'] = str(task_doc.pop('_id'))
+                tasks.append(Task(**task_doc))
+            
+            return tasks
+            
+        except Exception as e:
+            print(f"Error fetching pending tasks: {str(e)}")
+            return []
+    
     async def update_task(self, task_id: str, task_data: TaskUpdate) -> Optional[Task]:
         """
         Update a task
@@ -98,40 +195,134 @@ class TaskService:
     async def generate_crop_tasks(self, user_id: str, crop_type: str, region: str, target_date: date, language: str = "hi") -> List[Task]:
         """
         Generate crop-specific tasks for a given date
+        
+        All of the day's tasks are upserted in one ordered bulk_write keyed on
+        generation_key, so concurrent requests cannot create duplicates. New tasks are
+        returned as built; only ones generated earlier are read back, to keep their
+        stored state (e.g. completed).
         """
         try:
-            # Get existing tasks for the date
-            existing_tasks = await self.get_tasks(user_id, target_date)
-            
-            # Generate new tasks if none exist
-            if not existing_tasks:
-                task_templates = self._get_task_templates(crop_type, region, language)
-                
-                for template in task_templates:
-                    task_data = TaskCreate(
-                        user_id=user_id,
-                        title=template["title"],
-                        title_hindi=template["title_hindi"],
-                        description=template.get("description", ""),
-                        description_hindi=template.get("description_hindi", ""),
-                        category=template["category"],
-                        priority=template["priority"],
-                        crop_type=crop_type,
-                        due_date=target_date,
-                        due_time=template.get("due_time", "08:00")
-                    )
-                    
-                    await self.create_task(task_data)
-                
-                # Fetch the newly created tasks
-                existing_tasks = await self.get_tasks(user_id, target_date)
-            
-            return existing_tasks
+            tasks = self._build_crop_tasks(user_id, crop_type, region, target_date, language)
+            upserted = await self._bulk_upsert(self._upsert_operations(tasks), ordered=True)
+            if len(upserted) == len(tasks):
+                return tasks
+            
+            keys = [self._generation_key(task) for index, task in enumerate(tasks) if index not in upserted]
+            stored = {
+                task_doc.pop('generation_key'): Task(**task_doc)
+                async for task_doc in self.db.tasks.find({"generation_key": {"$in": keys}}, {"_id": 0})
+            }
+            return [stored.get(self._generation_key(task), task) for task in tasks]
             
         except Exception as e:
             print(f"Error generating crop tasks: {str(e)}")
             return []
     
+    async def generate_season_tasks(self, plantings: Iterable[Tuple[str, str, str, str]], start_date: date, end_date: date,
+                                    batch_size: Optional[int] = None, concurrency: Optional[int] = None) -> Dict[str, int]:
+        """
+        Generate every day's tasks from start_date to end_date (inclusive) for many
+        (user_id, crop_type, region, language) plantings
+        
+        Operations are built lazily and sent as unordered bulk_writes of batch_size,
+        up to concurrency at a time. Days generated before are left untouched.
+        """
+        batch_size = batch_size or int(os.getenv('TASK_BULK_BATCH_SIZE', '1000'))
+        semaphore = asyncio.Semaphore(concurrency or int(os.getenv('TASK_BULK_CONCURRENCY', '4')))
+        counts = {"operations": 0, "created": 0, "batches": 0}
+        writes = []
+        
+        async def write(operations: List[UpdateOne]):
+            try:
+                upserted = await self._bulk_upsert(operations, ordered=False)
+                counts["created"] += len(upserted)
+            finally:
+                semaphore.release()
+        
+        days = [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+        operations: List[UpdateOne] = []
+        for user_id, crop_type, region, language in plantings:
+            for day in days:
+                operations += self._upsert_operations(self._build_crop_tasks(user_id, crop_type, region, day, language))
+                if len(operations) >= batch_size:
+                    await semaphore.acquire()
+                    writes.append(asyncio.create_task(write(operations)))
+                    counts["operations"] += len(operations)
+                    counts["batches"] += 1
+                    operations = []
+        
+        if operations:
+            await semaphore.acquire()
+            writes.append(asyncio.create_task(write(operations)))
+            counts["operations"] += len(operations)
+            counts["batches"] += 1
+        
+        await asyncio.gather(*writes)
+        return counts
+    
+    def _build_crop_tasks(self, user_id: str, crop_type: str, region: str, target_date: date, language: str) -> List[Task]:
+        """
+        The day's tasks for a crop, built in memory from the templates
+        """
+        return [
+            Task(
+                user_id=user_id,
+                title=template["title"],
+                title_hindi=template["title_hindi"],
+                description=template.get("description", ""),
+                description_hindi=template.get("description_hindi", ""),
+                category=template["category"],
+                priority=template["priority"],
+                crop_type=crop_type,
+                due_date=target_date,
+                due_time=template.get("due_time", "08:00")
+            )
+            for template in self._get_task_templates(crop_type, region, language)
+        ]
+    
+    def _task_document(self, task: Task) -> Dict[str, Any]:
+        """
+        Mongo document for a task; due_date is stored as an ISO date string, which is how it is queried
+        """
+        task_doc = task.dict()
+        task_doc['due_date'] = task.due_date.isoformat()
+        return task_doc
+    
+    def _generation_key(self, task: Task) -> str:
+        return generation_key(task.user_id, task.crop_type, task.due_date, task.title)
+    
+    def _upsert_operations(self, tasks: List[Task]) -> List[UpdateOne]:
+        """
+        Insert-once upserts keyed on generation_key, which is kept on the stored document only
+        """
+        operations = []
+        for task in tasks:
+            key = self._generation_key(task)
+            task_doc = self._task_document(task)
+            task_doc['generation_key'] = key
+            operations.append(UpdateOne({"generation_key": key}, {"$setOnInsert": task_doc}, upsert=True))
+        return operations
+    
+    async def _bulk_upsert(self, operations: List[UpdateOne], ordered: bool) -> Dict[int, Any]:
+        """
+        Run the upserts in one bulk_write and return {operation index: _id} for the documents it inserted
+        
+        When a concurrent generator inserts the same key between our match and insert,
+        the upsert fails with a duplicate key error; retrying once turns it into a match.
+        """
+        upserted: Dict[int, Any] = {}
+        for attempt in range(2):
+            try:
+                result = await self.db.tasks.bulk_write(operations, ordered=ordered)
+                upserted.update(result.upserted_ids)
+                return upserted
+            except BulkWriteError as e:
+                upserted.update({item['index']: item['_id'] for item in e.details.get('upserted', [])})
+                errors = e.details.get('writeErrors', [])
+                if attempt or any(error.get('code') != DUPLICATE_KEY_ERROR for error in errors):
+                    raise
+        return upserted
+    
     def _get_task_templates(self, crop_type: str, region: str, language: str) -> List[Dict]:
         """
         Get task templates based on crop type and region
@@ -0,0 +1,126 @@
+import asyncio
+import base64
+import hashlib
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+from services.cache import LRUCache
+
+DEFAULT_CACHE_PATH = Path(__file__).parent.parent / 'data' / 'tts_cache'
+
+def audio_key(text: str, language: str, voice_name: str) -> str:
+    """
+    Content address of a synthesis request
+    """
+    return hashlib.sha256(f"{voice_name}\x00{language}\x00{text}".encode('utf-8')).hexdigest()
+
+class TTSAudioCache:
+    """
+    Synthesised speech keyed by (text, language, voice_name)
+
+    A small in-memory LRU of base64 audio sits in front of a size-bounded LRU of MP3
+    files on disk (one file per key, sharded by the first two hex digits). Disk
+    recency is the file mtime, so the LRU order survives restarts.
+    """
+    def __init__(self, path: Optional[str] = None, max_bytes: Optional[int] = None,
+                 hot_entries: Optional[int] = None):
+        self.path = Path(path or os.getenv('TTS_CACHE_PATH', DEFAULT_CACHE_PATH))
+        self.max_bytes = max_bytes or int(float(os.getenv('TTS_CACHE_MAX_MB', '512')) * 1024 * 1024)
+        self.hot = LRUCache(hot_entries or int(os.getenv('TTS_CACHE_HOT_ENTRIES', '256')))
+        # key -> file size, least recently used first
+        self._files: "OrderedDict[str, int]" = OrderedDict()
+        self._bytes = 0
+        self._counters = {"hot_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def load(self):
+        """
+        Index the files already on disk, oldest first
+        """
+        files = []
+        if self.path.exists():
+            for file in self.path.glob('*/*.mp3'):
+                stat = file.stat()
+                files.append((stat.st_mtime, file.stem, stat.st_size))
+        files.sort()
+        self._files = OrderedDict((key, size) for _, key, size in files)
+        self._bytes = sum(self._files.values())
+        self._evict()
+
+    async def get(self, text: str, language: str, voice_name: str) -> Optional[str]:
+        """
+        Base64 MP3 for the request, if cached
+        """
+        key = audio_key(text, language, voice_name)
+        entry = self.hot.get(key)
+        if entry is not None:
+            self._counters["hot_hits"] += 1
+            return entry[0]
+
+        if key not in self._files:
+            self._counters["misses"] += 1
+            return None
+
+        try:
+            audio = await asyncio.to_thread(self._read, key)
+        except FileNotFoundError:
+            self._forget(key)
+            self._counters["misses"] += 1
+            return None
+
+        self._files.move_to_end(key)
+        self._counters["disk_hits"] += 1
+        audio_base64 = base64.b64encode(audio).decode('ascii')
+        self.hot.set(key, audio_base64)
+        return audio_base64
+
+    async def put(self, text: str, language: str, voice_name: str, audio_base64: str):
+        key = audio_key(text, language, voice_name)
+        audio = base64.b64decode(audio_base64)
+        self.hot.set(key, audio_base64)
+        await asyncio.to_thread(self._write, key, audio)
+
+        self._forget(key)
+        self._files[key] = len(audio)
+        self._bytes += len(audio)
+        self._counters["stores"] += 1
+        self._evict()
+
+    def stats(self) -> Dict:
+        counters = dict(self._counters)
+        hits = counters["hot_hits"] + counters["disk_hits"]
+        total = hits + counters["misses"]
+        counters["files"] = len(self._files)
+        counters["bytes"] = self._bytes
+        counters["hit_ratio"] = round(hits / total, 4) if total else 0.0
+        return counters
+
+    def _file(self, key: str) -> Path:
+        return self.path / key[:2] / f"{key}.mp3"
+
+    def _read(self, key: str) -> bytes:
+        file = self._file(key)
+        audio = file.read_bytes()
+        # Touch so the LRU order is kept across restarts
+        os.utime(file)
+        return audio
+
+    def _write(self, key: str, audio: bytes):
+        file = self._file(key)
+        file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = file.with_suffix('.tmp')
+        tmp_file.write_bytes(audio)
+        os.replace(tmp_file, file)
+
+    def _forget(self, key: str):
+        size = self._files.pop(key, None)
+        if size is not None:
+            self._bytes -= size
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._files:
+            key, size = self._files.popitem(last=False)
+            self._bytes -= size
+            self.hot.pop(key)
+            self._file(key).unlink(missing_ok=True)
+            self._counters["evictions"] += 1
@@ -0,0 +1,85 @@
+import asyncio
+import os
+from typing import List, Optional, Tuple
+from services.http_client import http_pool
+from services.mandi_service import MandiService, TREND_DIRECTIONS
+from services.task_service import TaskService
+from services.tts_cache import TTSAudioCache
+from services.vision_service import VisionService
+from services.voice_service import VoiceService
+
+TEMPLATE_CROPS = ['tomato', 'wheat', 'rice']
+# Voices of the languages the static strings are written in
+HINDI, ENGLISH = 'hi-IN', 'en-IN'
+
+def static_texts() -> List[Tuple[str, str]]:
+    """
+    Every fixed string the app speaks (market advice, task templates and treatment texts)
+    as (text, language) pairs, each in the one voice of the language it is written in
+    """
+    texts = []
+
+    mandi_service = MandiService()
+    for language, voice in (('hi', HINDI), ('en', ENGLISH)):
+        for direction in TREND_DIRECTIONS.values():
+            advice = mandi_service._build_market_advice(direction, 0.5, language)
+            texts += [(advice.reason, voice), (advice.timeframe, voice)]
+
+    task_service = TaskService(db=None)
+    for crop in TEMPLATE_CROPS:
+        for template in task_service._get_task_templates(crop, "", "hi"):
+            texts += [(template['title'], ENGLISH), (template['title_hindi'], HINDI),
+                      (template['description'], ENGLISH), (template['description_hindi'], HINDI)]
+
+    vision_service = VisionService()
+    for language in ('hi', 'en'):
+        for treatment in vision_service._get_mock_analysis(language).treatments:
+            texts += [(treatment.title, ENGLISH), (treatment.title_hindi, HINDI),
+                      (treatment.description, ENGLISH), (treatment.description_hindi, HINDI)]
+
+    return list(dict.fromkeys((text, voice) for text, voice in texts if text))
+
+class TTSPrewarmer:
+    """
+    Synthesises every static string, in the voice of its own language, into the TTS cache
+    """
+    def __init__(self, voice_service: VoiceService, concurrency: Optional[int] = None):
+        self.voice_service = voice_service
+        self.concurrency = concurrency or int(os.getenv('TTS_PREWARM_CONCURRENCY', '4'))
+
+    async def run(self) -> int:
+        """
+        Synthesise whatever is not cached yet; returns the number of (text, language) pairs now cached
+        """
+        if not self.voice_service.vertex_api_key:
+            print("Warning: Vertex API key not found, skipping TTS pre-warm")
+            return 0
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def warm(text: str, language: str) -> bool:
+            async with semaphore:
+                response = await self.voice_service.synthesize_speech(text, language)
+                return bool(response.audio_base64)
+
+        jobs = [warm(text, language) for text, language in static_texts()]
+        return sum(await asyncio.gather(*jobs))
+
+
+async def _main():
+    from pathlib import Path
+    from dotenv import load_dotenv
+
+    load_dotenv(Path(__file__).parent.parent / '.env')
+    cache = TTSAudioCache()
+    cache.load()
+    try:
+        cached = await TTSPrewarmer(VoiceService(tts_cache=cache)).run()
+    finally:
+        await http_pool.shutdown()
+    stats = cache.stats()
+    print(f"{cached} phrases cached; {stats['stores']} newly synthesised, {stats['files']} files, {stats['bytes'] / 1024 / 1024:.1f} MiB")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -1,65 +1,209 @@
+import asyncio
 import base64
 import json
 import os
-import requests
-from typing import Dict, Any
+import uuid
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple, Union
 from models.crop_analysis import CropAnalysisResult, DiseaseAnalysis, Treatment
+from services.batching import MicroBatcher
+from services.coalescing import SingleFlight, coalesce_key
+from services.crop_classifier import CropDiseaseClassifier
+from services.http_client import http_pool
+from services.image_preprocess import ImagePreprocessor
+from services.metrics import MOCK_FALLBACKS
+from services.perceptual_cache import PerceptualImageCache, image_hashes
+from services.payloads import PAYLOAD_PLACEHOLDER, Base64Payload, JsonPayloadBody
 
 class VisionService:
-    def __init__(self):
+    def __init__(self, preprocessor: Optional[ImagePreprocessor] = None,
+                 image_cache: Optional[PerceptualImageCache] = None,
+                 classifier: Optional[CropDiseaseClassifier] = None):
         self.api_key = os.getenv('GOOGLE_VISION_API_KEY')
-        self.vision_url = 'https://vision.googleapis.com/v1/images:annotate'
+        self.vision_url = os.getenv('GOOGLE_VISION_API_URL', 'https://vision.googleapis.com/v1/images:annotate')
+        self.flight = SingleFlight('vision')
+        self.preprocessor = preprocessor
+        self.image_cache = image_cache
+        self.classifier = classifier
+        # Concurrent analyses share one annotate call (the API takes up to 16 images per request)
+        self.annotate_batcher = MicroBatcher(
+            'vision_annotate',
+            self._annotate_batch,
+            max_batch_size=min(int(os.getenv('VISION_BATCH_SIZE', '16')), 16),
+            max_wait=float(os.getenv('VISION_BATCH_WINDOW_MS', '20')) / 1000,
+            max_concurrency=int(os.getenv('VISION_MAX_CONNECTIONS', '10')),
+            eager=os.getenv('VISION_BATCH_EAGER', 'false').lower() == 'true'
+        )
         
     async def analyze_crop_image(self, image_base64: str, language: str = "hi") -> CropAnalysisResult:
         """
         Analyze crop image for disease detection using Google Vision API
         """
+        return await self.analyze_crop_payload(Base64Payload.from_data_url(image_base64), language)
+    
+    async def analyze_crop_payload(self, payload: Base64Payload, language: str = "hi") -> CropAnalysisResult:
+        """
+        Analyze an uploaded image (raw bytes, spooled file or base64 text) without materialising it as a string
+        """
         try:
-            if not self.api_key:
+            if not self.api_key and not self._use_classifier:
                 print("Warning: Google Vision API key not found, using mock data")
-                return self._get_mock_analysis(language)
-            
-            # Prepare the request
-            clean_base64 = image_base64.replace('data:image/jpeg;base64,', '').replace('data:image/png;base64,', '')
-            
-            request_data = {
-                "requests": [
-                    {
-                        "image": {
-                            "content": clean_base64
-                        },
-                        "features": [
-                            {
-                                "type": "LABEL_DETECTION",
-                                "maxResults": 10
-                            },
-                            {
-                                "type": "OBJECT_LOCALIZATION",
-                                "maxResults": 10
-                            }
-                        ]
-                    }
-                ]
-            }
+                return self._fallback_analysis(language)
             
-            # Make API call
-            response = requests.post(
-                f"{self.vision_url}?key={self.api_key}",
-                headers={'Content-Type': 'application/json'},
-                json=request_data,
-                timeout=30
+            # Re-uploads of the same photo arriving together share one annotate call. It reads
+            # its own copy of a spooled upload, since the request that spooled it may end first
+            analysis = await self.flight.do(
+                coalesce_key(payload.digest(), language),
+                lambda: self._analyze_image(payload.detach(), language)
             )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return self._process_vision_result(result, language)
-            else:
-                print(f"Vision API error: {response.status_code} - {response.text}")
-                return self._get_mock_analysis(language)
+            return analysis.model_copy(update={"id": str(uuid.uuid4()), "created_at": datetime.utcnow()})
                 
         except Exception as e:
             print(f"Error in vision analysis: {str(e)}")
-            return self._get_mock_analysis(language)
+            return self._fallback_analysis(language)
+    
+    async def _analyze_image(self, payload: Base64Payload, language: str) -> CropAnalysisResult:
+        """
+        Reuse the diagnosis of a near-duplicate photo if there is one, otherwise classify locally
+        and only call the Vision API when the local model is not confident
+        """
+        use_cache = self.image_cache is not None and self.image_cache.available
+        use_preprocessor = self.preprocessor is not None and self.preprocessor.available
+        data = payload.read() if use_cache or use_preprocessor or self._use_classifier else None
+        
+        hashes = await self._image_hashes(data) if use_cache else None
+        if hashes is not None:
+            cached = self.image_cache.lookup(hashes, language)
+            if cached is not None:
+                return cached
+        
+        if use_preprocessor:
+            payload = await self._preprocess(payload, data)
+        
+        local = await self._classify_locally(payload.read() if use_preprocessor else data) if self._use_classifier else None
+        if local is not None and self.classifier.is_confident(local):
+            analysis = local
+        elif not self.api_key:
+            # A local label below CROP_LOCAL_MIN_CONFIDENCE is not a diagnosis
+            return self._fallback_analysis(language)
+        else:
+            analysis = await self._annotate_image(payload, language)
+            if analysis is None:
+                return self._fallback_analysis(language)
+        
+        if hashes is not None:
+            self.image_cache.store(hashes, language, analysis)
+        return analysis
+    
+    async def _annotate_image(self, payload: Base64Payload, language: str) -> Optional[CropAnalysisResult]:
+        """
+        Annotate one image via the batcher; None when the API call fails for this image
+        """
+        try:
+            response = await self.annotate_batcher.submit(payload)
+        except Exception as e:
+            print(f"Vision API error: {str(e)}")
+            return None
+        return self._process_vision_result({"responses": [response]}, language)
+    
+    async def _annotate_batch(self, payloads: List[Base64Payload]) -> List[Union[Dict, Exception]]:
+        """
+        Call the Vision annotate endpoint once for a batch of images; per-image errors stay per image
+        """
+        request_data = {
+            "requests": [
+                {
+                    "image": {
+                        "content": PAYLOAD_PLACEHOLDER
+                    },
+                    "features": [
+                        {
+                            "type": "LABEL_DETECTION",
+                            "maxResults": 10
+                        },
+                        {
+                            "type": "OBJECT_LOCALIZATION",
+                            "maxResults": 10
+                        }
+                    ]
+                }
+                for _ in payloads
+            ]
+        }
+        # The images are streamed into the body in chunks rather than embedded via json.dumps
+        body = JsonPayloadBody(request_data, *payloads)
+        
+        # Make API call
+        response = await http_pool.post(
+            'vision',
+            f"{self.vision_url}?key={self.api_key}",
+            content=body,
+            headers=body.headers,
+            timeout=30
+        )
+        
+        if response.status_code != 200:
+            raise RuntimeError(f"{response.status_code} - {response.text}")
+        
+        responses = response.json().get('responses', [])
+        return [
+            RuntimeError(f"{result['error'].get('code')} - {result['error'].get('message')}") if 'error' in result else result
+            for result in responses
+        ]
+    
+    async def _preprocess(self, payload: Base64Payload, data: bytes) -> Base64Payload:
+        """
+        Downscaled, leaf-cropped re-encode of the image; the original is sent if preprocessing fails
+        """
+        try:
+            return Base64Payload.from_bytes(await self.preprocessor.process(data))
+        except Exception as e:
+            print(f"Image preprocessing failed, sending original: {str(e)}")
+            return payload
+    
+    async def _classify_locally(self, data: bytes) -> Optional[CropAnalysisResult]:
+        try:
+            return await self.classifier.classify(data)
+        except Exception as e:
+            print(f"Local crop classification failed: {str(e)}")
+            return None
+    
+    @property
+    def _use_classifier(self) -> bool:
+        return self.classifier is not None and self.classifier.available
+    
+    async def _image_hashes(self, data: bytes) -> Optional[Tuple[int, int]]:
+        """
+        Perceptual hashes for the cache, computed on the preprocessing pool when there is one
+        """
+        try:
+            if self.preprocessor is not None:
+                return await self.preprocessor.run(image_hashes, data)
+            return await asyncio.to_thread(image_hashes, data)
+        except Exception as e:
+            print(f"Image hashing failed, skipping duplicate check: {str(e)}")
+            return None
+    
+    def get_image_cache_stats(self) -> Dict[str, Any]:
+        """
+        Hit ratio of the near-duplicate image cache
+        """
+        return self.image_cache.stats() if self.image_cache is not None else {}
+    
+    def get_coalescing_stats(self) -> Dict[str, Any]:
+        """
+        Fan-in statistics for coalesced image analyses
+        """
+        return self.flight.stats()
+    
+    def get_batching_stats(self) -> List[Dict[str, Any]]:
+        """
+        Batch sizes and queue waits of the annotate calls and the local classifier
+        """
+        stats = [self.annotate_batcher.stats()]
+        if self.classifier is not None:
+            stats.append(self.classifier.get_stats())
+        return stats
     
     def _process_vision_result(self, result: Dict, language: str) -> CropAnalysisResult:
         """
@@ -78,6 +222,13 @@ class VisionService:
         
         return self._get_mock_analysis(language, confidence)
     
+    def _fallback_analysis(self, language: str) -> CropAnalysisResult:
+        """
+        Mock analysis served in place of an upstream result, counted as a fallback
+        """
+        MOCK_FALLBACKS.labels('vision', 'analysis').inc()
+        return self._get_mock_analysis(language)
+    
     def _get_mock_analysis(self, language: str = "hi", confidence: float = 0.85) -> CropAnalysisResult:
         """
         Generate mock crop analysis for development
@@ -0,0 +1,188 @@
+import asyncio
+import os
+import re
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+import numpy as np
+from models.chat import ChatResponse, VoiceAnswerAudio, VoicePipelineResult
+from services.gemini_service import GeminiService
+from services.payloads import Base64Payload
+from services.voice_service import VoiceService
+
+# A sentence ends at . ! ? or the Devanagari danda followed by whitespace, or at a line break
+SENTENCE_END = re.compile(r'(?<=[.!?।॥])\s+|\n+')
+# Markdown the model likes to use, which TTS would read out
+SPOKEN_MARKUP = re.compile(r'[*#_`>]+')
+STAGES = ("stt", "llm_first_token", "first_sentence", "llm", "tts_first", "time_to_first_audio", "total")
+
+class SentenceSplitter:
+    """
+    Cuts streamed text into sentences as soon as each one is complete
+
+    Sentences shorter than `min_chars` (list numbers, "Yes.") are held back and
+    spoken together with the next one.
+    """
+    def __init__(self, min_chars: int = 24):
+        self.min_chars = min_chars
+        self._buffer = ""
+        self._pending = ""
+
+    def feed(self, text: str) -> List[str]:
+        self._buffer += text
+        pieces = SENTENCE_END.split(self._buffer)
+        # The last piece may still be growing
+        self._buffer = pieces.pop()
+
+        sentences = []
+        for piece in pieces:
+            piece = piece.strip()
+            if not piece:
+                continue
+            self._pending = f"{self._pending} {piece}" if self._pending else piece
+            if len(self._pending) >= self.min_chars:
+                sentences.append(self._pending)
+                self._pending = ""
+        return sentences
+
+    def flush(self) -> List[str]:
+        rest = f"{self._pending} {self._buffer}".strip()
+        self._buffer = self._pending = ""
+        return [rest] if rest else []
+
+def speakable(sentence: str) -> Optional[str]:
+    """
+    Sentence without markdown, or None if nothing in it can be spoken
+    """
+    text = SPOKEN_MARKUP.sub('', sentence).strip()
+    return text if any(char.isalnum() for char in text) else None
+
+class VoicePipeline:
+    """
+    Voice query end to end: transcribe, stream the answer, speak it sentence by sentence
+
+    Each complete sentence of the answer is sent to TTS while Gemini is still
+    generating the rest (up to `tts_concurrency` at a time), and its audio is
+    emitted in sentence order as soon as it is ready. Stage latencies are kept for
+    the last `window` runs.
+    """
+    def __init__(self, voice_service: VoiceService, gemini_service: GeminiService,
+                 tts_concurrency: Optional[int] = None, window: int = 1000):
+        self.voice_service = voice_service
+        self.gemini_service = gemini_service
+        self.tts_concurrency = tts_concurrency or int(os.getenv('VOICE_PIPELINE_TTS_CONCURRENCY', '3'))
+        self.runs = 0
+        self._timings: Dict[str, Deque[float]] = {stage: deque(maxlen=window) for stage in STAGES}
+
+    async def run(self, payload: Base64Payload, language: str = "hi-IN",
+                  context: Optional[Dict] = None) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Emits ("transcript", VoiceResponse), ("delta", text) and ("audio", VoiceAnswerAudio)
+        events as they happen, ending with ("done", VoicePipelineResult)
+        """
+        start = time.perf_counter()
+        timings: Dict[str, float] = {}
+
+        def mark(stage: str, since: float):
+            timings[stage] = round((time.perf_counter() - since) * 1000, 1)
+
+        transcript = await self.voice_service.transcribe_payload(payload, language)
+        mark("stt", start)
+        yield "transcript", transcript
+
+        events: asyncio.Queue = asyncio.Queue()
+        # Speech tasks in sentence order, then None
+        sentences: asyncio.Queue = asyncio.Queue()
+        speech_tasks: List[asyncio.Future] = []
+        semaphore = asyncio.Semaphore(self.tts_concurrency)
+
+        async def speak(index: int, text: str) -> VoiceAnswerAudio:
+            async with semaphore:
+                started = time.perf_counter()
+                speech = await self.voice_service.synthesize_speech(text, language)
+                if index == 0:
+                    mark("tts_first", started)
+                return VoiceAnswerAudio(index=index, text=text, audio_base64=speech.audio_base64, language=language)
+
+        def schedule(texts: List[str], since: float):
+            for text in filter(None, map(speakable, texts)):
+                if not speech_tasks:
+                    mark("first_sentence", since)
+                speech_tasks.append(asyncio.ensure_future(speak(len(speech_tasks), text)))
+                sentences.put_nowait(speech_tasks[-1])
+
+        async def generate() -> ChatResponse:
+            started = time.perf_counter()
+            splitter = SentenceSplitter()
+            response = ChatResponse(message="", language=language.split('-')[0])
+            try:
+                if not transcript.transcript.strip():
+                    return response
+                async for event, data in self.gemini_service.stream_chat_response(
+                        transcript.transcript, language.split('-')[0], context):
+                    if event == "delta":
+                        if "llm_first_token" not in timings:
+                            mark("llm_first_token", started)
+                        await events.put(("delta", data))
+                        schedule(splitter.feed(data), started)
+                    else:
+                        response = data
+                schedule(splitter.flush(), started)
+                mark("llm", started)
+                return response
+            finally:
+                sentences.put_nowait(None)
+
+        async def play():
+            while True:
+                task = await sentences.get()
+                if task is None:
+                    return
+                audio = await task
+                if audio.index == 0:
+                    mark("time_to_first_audio", start)
+                await events.put(("audio", audio))
+
+        generator = asyncio.ensure_future(generate())
+        player = asyncio.ensure_future(play())
+        running = {generator, player}
+
+        def stage_done(task: asyncio.Future):
+            running.discard(task)
+            if not running:
+                events.put_nowait(None)
+
+        generator.add_done_callback(stage_done)
+        player.add_done_callback(stage_done)
+        try:
+            while True:
+                event = await events.get()
+                if event is None:
+                    break
+                yield event
+
+            response = generator.result()
+            player.result()
+            mark("total", start)
+            self._record(timings)
+            yield "done", VoicePipelineResult(transcript=transcript, response=response, timings=timings)
+        finally:
+            # The client may have gone away mid-answer
+            for task in (generator, player, *speech_tasks):
+                task.cancel()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        p50/p95 of each stage's latency in milliseconds over the recent runs
+        """
+        stats: Dict[str, Any] = {"runs": self.runs}
+        for stage, values in self._timings.items():
+            if values:
+                p50, p95 = np.percentile(np.fromiter(values, dtype=np.float64), [50, 95])
+                stats[stage] = {"count": len(values), "p50_ms": round(float(p50), 1), "p95_ms": round(float(p95), 1)}
+        return stats
+
+    def _record(self, timings: Dict[str, float]):
+        self.runs += 1
+        for stage, value in timings.items():
+            self._timings[stage].append(value)
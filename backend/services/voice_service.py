@@ -1,136 +1,246 @@
+import asyncio
 import base64
 import json
 import os
-import requests
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from models.chat import VoiceResponse, TTSResponse
+from services.audio_preprocess import AudioPreprocessor
+from services.coalescing import SingleFlight, coalesce_key
+from services.http_client import http_pool
+from services.metrics import MOCK_FALLBACKS
+from services.payloads import PAYLOAD_PLACEHOLDER, Base64Payload, JsonPayloadBody
+from services.tts_cache import TTSAudioCache
+
+VOICE_MAP = {
+    'hi-IN': 'hi-IN-Wavenet-A',
+    'en-IN': 'en-IN-Wavenet-A',
+    'kn-IN': 'kn-IN-Wavenet-A',
+    'ta-IN': 'ta-IN-Wavenet-A',
+    'te-IN': 'te-IN-Wavenet-A',
+    'mr-IN': 'mr-IN-Wavenet-A',
+    'bn-IN': 'bn-IN-Wavenet-A',
+    'gu-IN': 'gu-IN-Wavenet-A'
+}
 
 class VoiceService:
-    def __init__(self):
+    def __init__(self, tts_cache: Optional[TTSAudioCache] = None, audio_preprocessor: Optional[AudioPreprocessor] = None):
         self.vertex_api_key = os.getenv('VERTEX_API_KEY')
-        self.stt_url = 'https://speech.googleapis.com/v1/speech:recognize'
-        self.tts_url = 'https://texttospeech.googleapis.com/v1/text:synthesize'
+        self.stt_url = os.getenv('SPEECH_API_URL', 'https://speech.googleapis.com/v1/speech:recognize')
+        self.tts_url = os.getenv('TTS_API_URL', 'https://texttospeech.googleapis.com/v1/text:synthesize')
+        self.flight = SingleFlight('voice')
+        self.tts_cache = tts_cache
+        self.audio_preprocessor = audio_preprocessor
         
     async def transcribe_audio(self, audio_base64: str, language: str = "hi-IN") -> VoiceResponse:
         """
         Convert audio to text using Vertex AI Speech-to-Text
         """
+        return await self.transcribe_payload(Base64Payload.from_data_url(audio_base64), language)
+    
+    async def transcribe_payload(self, payload: Base64Payload, language: str = "hi-IN") -> VoiceResponse:
+        """
+        Transcribe an uploaded recording (raw bytes, spooled file or base64 text) without copying it into a string
+        """
         try:
             if not self.vertex_api_key:
                 print("Warning: Vertex API key not found, using mock transcription")
-                return self._get_mock_transcription(language)
-            
-            # Prepare the request
-            clean_base64 = audio_base64.replace('data:audio/webm;base64,', '').replace('data:audio/wav;base64,', '')
+                return self._fallback_transcription(language)
             
-            request_data = {
-                "config": {
-                    "encoding": "WEBM_OPUS",
-                    "sampleRateHertz": 48000,
-                    "languageCode": language,
-                    "enableAutomaticPunctuation": True,
-                    "model": "latest_long"
-                },
-                "audio": {
-                    "content": clean_base64
-                }
-            }
-            
-            # Make API call
-            response = requests.post(
-                f"{self.stt_url}?key={self.vertex_api_key}",
-                headers={'Content-Type': 'application/json'},
-                json=request_data,
-                timeout=30
+            # The shared call reads its own copy of a spooled upload, since the request that spooled it may end first
+            result = await self.flight.do(
+                coalesce_key('stt', payload.digest(), language),
+                lambda: self._transcribe(payload.detach(), language)
             )
-            
-            if response.status_code == 200:
-                result = response.json()
-                if 'results' in result and len(result['results']) > 0:
-                    transcript = result['results'][0]['alternatives'][0]['transcript']
-                    confidence = result['results'][0]['alternatives'][0].get('confidence', 0.8)
-                    
-                    return VoiceResponse(
-                        transcript=transcript,
-                        confidence=confidence,
-                        language=language
-                    )
-                else:
-                    return self._get_mock_transcription(language)
-            else:
-                print(f"STT API error: {response.status_code} - {response.text}")
-                return self._get_mock_transcription(language)
+            return result or self._fallback_transcription(language)
                 
         except Exception as e:
             print(f"Error in speech transcription: {str(e)}")
-            return self._get_mock_transcription(language)
+            return self._fallback_transcription(language)
+    
+    async def _transcribe(self, payload: Base64Payload, language: str) -> Optional[VoiceResponse]:
+        """
+        Recognise the speech in a recording, trimmed and split by the audio preprocessor when it can decode it
+        """
+        prepared = None
+        if self.audio_preprocessor is not None:
+            prepared = await self.audio_preprocessor.prepare(payload.read())
+        if prepared is None:
+            return await self._recognize(payload, language)
+        
+        if not prepared["segments"]:
+            # Nothing but silence; no need to ask the API
+            return VoiceResponse(transcript="", confidence=0.0, language=language)
+        
+        results = await asyncio.gather(*(
+            self._recognize(Base64Payload.from_bytes(segment), language, prepared["encoding"], prepared["sample_rate"])
+            for segment in prepared["segments"]
+        ))
+        results = [result for result in results if result is not None]
+        if not results:
+            return None
+        
+        return VoiceResponse(
+            transcript=" ".join(result.transcript for result in results),
+            confidence=sum(result.confidence or 0.0 for result in results) / len(results),
+            language=language
+        )
+    
+    async def recognize_audio(self, audio: bytes, language: str, encoding: str, sample_rate: int) -> Optional[VoiceResponse]:
+        """
+        Recognise one piece of audio in a known encoding, such as part of a streamed recording; None when nothing was recognised
+        """
+        return await self._recognize(Base64Payload.from_bytes(audio), language, encoding, sample_rate)
+    
+    async def _recognize(self, payload: Base64Payload, language: str, encoding: str = "WEBM_OPUS",
+                         sample_rate: int = 48000) -> Optional[VoiceResponse]:
+        """
+        Call the Speech-to-Text recognize endpoint; None when nothing was recognised
+        """
+        request_data = {
+            "config": {
+                "encoding": encoding,
+                "sampleRateHertz": sample_rate,
+                "languageCode": language,
+                "enableAutomaticPunctuation": True,
+                "model": "latest_long"
+            },
+            "audio": {
+                "content": PAYLOAD_PLACEHOLDER
+            }
+        }
+        body = JsonPayloadBody(request_data, payload)
+        
+        # Make API call
+        response = await http_pool.post(
+            'speech',
+            f"{self.stt_url}?key={self.vertex_api_key}",
+            content=body,
+            headers=body.headers,
+            timeout=30
+        )
+        
+        if response.status_code == 200:
+            result = response.json()
+            if 'results' in result and len(result['results']) > 0:
+                # One result per consecutive stretch of speech
+                alternatives = [item['alternatives'][0] for item in result['results'] if item.get('alternatives')]
+                transcript = " ".join(alternative['transcript'].strip() for alternative in alternatives)
+                confidence = alternatives[0].get('confidence', 0.8) if alternatives else 0.8
+                
+                return VoiceResponse(
+                    transcript=transcript,
+                    confidence=confidence,
+                    language=language
+                )
+            else:
+                return None
+        else:
+            print(f"STT API error: {response.status_code} - {response.text}")
+            return None
     
     async def synthesize_speech(self, text: str, language: str = "hi-IN", voice_name: str = None) -> TTSResponse:
         """
         Convert text to speech using Vertex AI Text-to-Speech
         """
         try:
-            if not self.vertex_api_key:
-                print("Warning: Vertex API key not found, using mock TTS")
-                return self._get_mock_tts(text, language)
-            
             # Get appropriate voice name
             if not voice_name:
                 voice_name = self._get_voice_name(language)
             
-            request_data = {
-                "input": {"text": text},
-                "voice": {
-                    "languageCode": language,
-                    "name": voice_name,
-                    "ssmlGender": "NEUTRAL"
-                },
-                "audioConfig": {
-                    "audioEncoding": "MP3",
-                    "pitch": 0,
-                    "speakingRate": 1.0
-                }
-            }
+            # Cached audio is served even without an API key
+            if self.tts_cache is not None:
+                cached = await self.tts_cache.get(text, language, voice_name)
+                if cached is not None:
+                    return TTSResponse(audio_base64=cached, language=language)
             
-            # Make API call
-            response = requests.post(
-                f"{self.tts_url}?key={self.vertex_api_key}",
-                headers={'Content-Type': 'application/json'},
-                json=request_data,
-                timeout=30
-            )
+            if not self.vertex_api_key:
+                print("Warning: Vertex API key not found, using mock TTS")
+                return self._fallback_tts(text, language)
             
-            if response.status_code == 200:
-                result = response.json()
-                audio_content = result.get('audioContent', '')
-                
-                return TTSResponse(
-                    audio_base64=audio_content,
-                    language=language
-                )
-            else:
-                print(f"TTS API error: {response.status_code} - {response.text}")
-                return self._get_mock_tts(text, language)
+            return await self.flight.do(
+                coalesce_key('tts', text, language, voice_name),
+                lambda: self._synthesize_and_cache(text, language, voice_name)
+            )
                 
         except Exception as e:
             print(f"Error in speech synthesis: {str(e)}")
-            return self._get_mock_tts(text, language)
+            return self._fallback_tts(text, language)
+    
+    async def _synthesize_and_cache(self, text: str, language: str, voice_name: str) -> TTSResponse:
+        response = await self._synthesize(text, language, voice_name)
+        # Mock fallbacks carry no audio and are never cached
+        if self.tts_cache is not None and response.audio_base64:
+            await self.tts_cache.put(text, language, voice_name, response.audio_base64)
+        return response
+    
+    async def _synthesize(self, text: str, language: str, voice_name: str) -> TTSResponse:
+        """
+        Call the Text-to-Speech synthesize endpoint
+        """
+        request_data = {
+            "input": {"text": text},
+            "voice": {
+                "languageCode": language,
+                "name": voice_name,
+                "ssmlGender": "NEUTRAL"
+            },
+            "audioConfig": {
+                "audioEncoding": "MP3",
+                "pitch": 0,
+                "speakingRate": 1.0
+            }
+        }
+        
+        # Make API call
+        response = await http_pool.post(
+            'tts',
+            f"{self.tts_url}?key={self.vertex_api_key}",
+            json=request_data,
+            timeout=30
+        )
+        
+        if response.status_code == 200:
+            result = response.json()
+            audio_content = result.get('audioContent', '')
+            
+            return TTSResponse(
+                audio_base64=audio_content,
+                language=language
+            )
+        else:
+            print(f"TTS API error: {response.status_code} - {response.text}")
+            return self._fallback_tts(text, language)
+    
+    def get_coalescing_stats(self) -> Dict[str, Any]:
+        """
+        Fan-in statistics for coalesced speech requests
+        """
+        return self.flight.stats()
+    
+    def get_tts_cache_stats(self) -> Dict[str, Any]:
+        """
+        Hit ratio and disk usage of the synthesised speech cache
+        """
+        return self.tts_cache.stats() if self.tts_cache is not None else {}
+    
+    def get_preprocess_stats(self) -> Dict[str, Any]:
+        """
+        Trimming savings of the audio preprocessor, and how many recordings it could not decode
+        """
+        return self.audio_preprocessor.get_stats() if self.audio_preprocessor is not None else {}
     
     def _get_voice_name(self, language_code: str) -> str:
         """
         Get appropriate voice name for language
         """
-        voice_map = {
-            'hi-IN': 'hi-IN-Wavenet-A',
-            'en-IN': 'en-IN-Wavenet-A',
-            'kn-IN': 'kn-IN-Wavenet-A',
-            'ta-IN': 'ta-IN-Wavenet-A',
-            'te-IN': 'te-IN-Wavenet-A',
-            'mr-IN': 'mr-IN-Wavenet-A',
-            'bn-IN': 'bn-IN-Wavenet-A',
-            'gu-IN': 'gu-IN-Wavenet-A'
-        }
-        return voice_map.get(language_code, 'hi-IN-Wavenet-A')
+        return VOICE_MAP.get(language_code, 'hi-IN-Wavenet-A')
+    
+    def _fallback_transcription(self, language: str) -> VoiceResponse:
+        """
+        Mock transcription served in place of an upstream result, counted as a fallback
+        """
+        MOCK_FALLBACKS.labels('voice', 'transcription').inc()
+        return self._get_mock_transcription(language)
     
     def _get_mock_transcription(self, language: str) -> VoiceResponse:
         """
@@ -153,6 +263,13 @@ class VoiceService:
             language=language
         )
     
+    def _fallback_tts(self, text: str, language: str) -> TTSResponse:
+        """
+        Mock tts served in place of an upstream result, counted as a fallback
+        """
+        MOCK_FALLBACKS.labels('voice', 'tts').inc()
+        return self._get_mock_tts(text, language)
+    
     def _get_mock_tts(self, text: str, language: str) -> TTSResponse:
         """
         Generate mock TTS response for development
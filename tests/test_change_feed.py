@@ -0,0 +1,119 @@
+import asyncio
+import json
+from services.change_feed import ChangeFeed, LocalChangeSource
+
+def task(key, user_id, task_id, title="Water tomatoes"):
+    return {"_id": key, "user_id": user_id, "id": task_id, "title": title, "generation_key": f"{user_id}|{task_id}"}
+
+def price(commodity, state, modal_price=2000):
+    return {"_id": f"{commodity}-{state}", "commodity": commodity, "state": state, "modal_price": modal_price}
+
+def received(subscription):
+    events = []
+    while not subscription.queue.empty():
+        event = subscription.queue.get_nowait()
+        events.append((event.name, json.loads(event.data)))
+    return events
+
+async def follow(feed, steps):
+    """
+    Run `steps` (a coroutine taking the task and price sources) while the feed follows both
+    """
+    tasks, prices = LocalChangeSource(), LocalChangeSource()
+    followers = [asyncio.create_task(feed.follow(tasks, "task")), asyncio.create_task(feed.follow(prices, "price"))]
+    try:
+        await steps(tasks, prices)
+    finally:
+        for follower in followers:
+            follower.cancel()
+        await asyncio.gather(*followers, return_exceptions=True)
+
+async def drained(*sources):
+    while any(not source._queue.empty() for source in sources):
+        await asyncio.sleep(0)
+    # One more turn for the follower to dispatch the change it just took
+    await asyncio.sleep(0)
+
+def test_task_changes_reach_only_the_owners_connections():
+    feed = ChangeFeed()
+    phone, laptop, other = feed.subscribe("u1"), feed.subscribe("u1"), feed.subscribe("u2")
+
+    async def steps(tasks, prices):
+        tasks.publish("insert", task(1, "u1", "t1"))
+        await drained(tasks)
+
+    asyncio.run(follow(feed, steps))
+    expected = [("task", {"operation": "insert", "task": {"user_id": "u1", "id": "t1", "title": "Water tomatoes"}})]
+    assert received(phone) == expected
+    assert received(laptop) == expected
+    assert received(other) == []
+    assert feed.get_stats()["deliveries"] == 2
+
+def test_price_changes_follow_commodity_and_state():
+    feed = ChangeFeed()
+    anywhere = feed.subscribe("u1", ["Tomato"])
+    punjab = feed.subscribe("u2", ["tomato", "wheat"], "Punjab")
+    onion = feed.subscribe("u3", ["onion"])
+
+    async def steps(tasks, prices):
+        prices.publish("update", price("tomato", "Maharashtra"))
+        prices.publish("update", price("wheat", "punjab"))
+        await drained(prices)
+
+    asyncio.run(follow(feed, steps))
+    assert [event["price"]["commodity"] for _, event in received(anywhere)] == ["tomato"]
+    assert [event["price"]["commodity"] for _, event in received(punjab)] == ["wheat"]
+    assert received(onion) == []
+
+def test_unsubscribe_removes_the_connection_and_its_tracked_tasks():
+    feed = ChangeFeed()
+    first, second = feed.subscribe("u1", ["tomato"]), feed.subscribe("u1", ["tomato"])
+    feed.track_tasks("u1", [task(1, "u1", "t1")])
+
+    feed.unsubscribe(first)
+    assert feed.get_stats()["subscribers"] == 1
+    assert feed.get_stats()["tracked_tasks"] == 1
+
+    feed.unsubscribe(second)
+    stats = feed.get_stats()
+    assert (stats["subscribers"], stats["users"], stats["commodities"], stats["tracked_tasks"]) == (0, 0, 0, 0)
+    assert feed.dispatch("task", {"operationType": "update", "documentKey": {"_id": 1}, "fullDocument": task(1, "u1", "t1")}) == 0
+    # A late seed for a user who already disconnected is ignored
+    feed.track_tasks("u1", [task(2, "u1", "t2")])
+    assert feed.get_stats()["tracked_tasks"] == 0
+
+def test_deletes_without_pre_images_are_routed_by_document_key():
+    feed = ChangeFeed()
+    owner, other = feed.subscribe("u1"), feed.subscribe("u2")
+    # Stored before the client connected, as the server seeds it on subscribe
+    feed.track_tasks("u1", [task(1, "u1", "t1")])
+
+    async def steps(tasks, prices):
+        tasks.publish("insert", task(2, "u1", "t2"))
+        tasks.publish("delete", task(1, "u1", "t1"))
+        tasks.publish("delete", task(2, "u1", "t2"))
+        # Nobody connected owns this one
+        tasks.publish("delete", task(3, "u3", "t3"))
+        await drained(tasks)
+
+    asyncio.run(follow(feed, steps))
+    assert [(name, event["operation"], event.get("id")) for name, event in received(owner)] == [
+        ("task", "insert", None), ("task", "delete", "t1"), ("task", "delete", "t2")
+    ]
+    assert received(other) == []
+    assert feed.get_stats()["tracked_tasks"] == 0
+
+def test_deletes_with_pre_images_use_the_deleted_document():
+    feed = ChangeFeed()
+    owner = feed.subscribe("u1")
+    tasks = LocalChangeSource(pre_images=True)
+
+    async def steps():
+        follower = asyncio.create_task(feed.follow(tasks, "task"))
+        tasks.publish("delete", task(1, "u1", "t1"))
+        await drained(tasks)
+        follower.cancel()
+        await asyncio.gather(follower, return_exceptions=True)
+
+    asyncio.run(steps())
+    assert received(owner) == [("task", {"operation": "delete", "id": "t1"})]
@@ -0,0 +1,53 @@
+import asyncio
+import pytest
+from benchmarks.stub_upstream import StubUpstream
+from services.gemini_service import GeminiService
+from services.http_client import http_pool
+
+CHUNKS = ["Water the tomatoes ", "in the evening.\n", "- Mulch the beds"]
+EVENTS = [{"candidates": [{"content": {"parts": [{"text": text}]}}]} for text in CHUNKS]
+QUESTION = "When should I water my tomatoes?"
+
+@pytest.fixture
+def gemini_env(monkeypatch):
+    monkeypatch.setenv('GEMINI_API_KEY', 'test')
+    monkeypatch.setenv('CHAT_CACHE_ENABLED', 'true')
+
+async def _stream_twice(abort_after=None):
+    """
+    Ask the same question twice against a local SSE stub; returns both event lists and the upstream call count
+    """
+    upstream = StubUpstream({}, delay=0, stream_events=EVENTS, event_delay=0, abort_after=abort_after)
+    await upstream.start()
+    try:
+        service = GeminiService()
+        service.gemini_stream_url = f"{upstream.url}/v1beta/models/gemini-pro:streamGenerateContent"
+        first = [event async for event in service.stream_chat_response(QUESTION, "en")]
+        second = [event async for event in service.stream_chat_response(QUESTION, "en")]
+        return first, second, upstream.request_count
+    finally:
+        await http_pool.shutdown()
+        await upstream.stop()
+
+def test_stream_sends_deltas_then_done_and_caches_the_answer(gemini_env):
+    first, second, calls = asyncio.run(_stream_twice())
+
+    assert [kind for kind, _ in first] == ["delta"] * len(CHUNKS) + ["done"]
+    assert [text for _, text in first[:-1]] == CHUNKS
+    done = first[-1][1]
+    assert done.message == "".join(CHUNKS)
+    assert done.actionable_steps == ["Mulch the beds"]
+
+    # The repeat is replayed from the cache without another upstream call
+    assert calls == 1
+    assert [kind for kind, _ in second] == ["delta", "done"]
+    assert second[-1][1].message == done.message
+
+def test_aborted_stream_keeps_what_was_sent_but_is_not_cached(gemini_env):
+    first, second, calls = asyncio.run(_stream_twice(abort_after=2))
+
+    assert [kind for kind, _ in first] == ["delta", "delta", "done"]
+    assert first[-1][1].message == "".join(CHUNKS[:2])
+    # Nothing was cached, so the repeat goes upstream again
+    assert calls == 2
+    assert [kind for kind, _ in second] == ["delta", "delta", "done"]
@@ -0,0 +1,41 @@
+import asyncio
+import os
+import uuid
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import PyMongoError
+from services.db_indexes import HOT_QUERIES, ensure_indexes, verify_query_plans
+
+MONGO_URL = os.getenv('TEST_MONGO_URL', os.getenv('MONGO_URL', 'mongodb://localhost:27017'))
+
+async def _plan_report():
+    client = AsyncIOMotorClient(MONGO_URL, serverSelectionTimeoutMS=2000)
+    db = client[f"plan_check_{uuid.uuid4().hex[:8]}"]
+    try:
+        await client.admin.command('ping')
+    except PyMongoError as e:
+        client.close()
+        pytest.skip(f"No MongoDB at {MONGO_URL}: {e}")
+    try:
+        await ensure_indexes(db)
+        return await verify_query_plans(db)
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+
+@pytest.fixture(scope="module")
+def plan_report():
+    return {(entry["collection"], entry["query"]): entry for entry in asyncio.run(_plan_report())}
+
+@pytest.mark.parametrize(
+    "collection, description, expected, must_cover",
+    [(query[0], query[1], query[6], query[7]) for query in HOT_QUERIES],
+    ids=[query[1] for query in HOT_QUERIES]
+)
+def test_hot_query_uses_index(plan_report, collection, description, expected, must_cover):
+    entry = plan_report[(collection, description)]
+    plan = " <- ".join(entry["stages"])
+    assert "COLLSCAN" not in entry["stages"], f"collection scan: {plan}"
+    assert expected in entry["indexes"], f"expected {expected}, plan used {entry['indexes'] or 'no index'}: {plan}"
+    if must_cover:
+        assert entry["covered"], f"not covered by {expected}: {plan}"
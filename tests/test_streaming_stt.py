@@ -0,0 +1,105 @@
+import asyncio
+import io
+import wave
+import numpy as np
+import pytest
+from models.chat import VoiceResponse
+from services.audio_preprocess import AudioPreprocessor
+from services.streaming_stt import ChunkedRecognizer, LocalRecognizer
+
+RATE = 48000
+WORDS = {1: "one", 2: "two", 3: "three"}
+
+def utterances_wav(levels, speech=0.8, pause=0.8):
+    """
+    One 220 Hz tone of `speech` seconds per level (amplitude level / 5), each followed by a pause, as 16-bit stereo WAV
+    """
+    rng = np.random.default_rng(0)
+    pieces = []
+    for level in levels:
+        t = np.arange(int(speech * RATE)) / RATE
+        pieces.append(level / 5 * np.sin(2 * np.pi * 220 * t))
+        pieces.append(np.zeros(int(pause * RATE)))
+    samples = np.concatenate(pieces) + rng.normal(0, 0.002, sum(len(piece) for piece in pieces))
+    output = io.BytesIO()
+    with wave.open(output, 'wb') as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(RATE)
+        pcm = (np.clip(samples, -1, 1) * 32767).astype('<i2')
+        wav.writeframes(np.repeat(pcm, 2).tobytes())
+    return output.getvalue()
+
+class ToneVoiceService:
+    """
+    Recognizes each tone burst in a LINEAR16 chunk as the word for its amplitude
+    """
+    def __init__(self):
+        self.calls = []
+
+    async def recognize_audio(self, audio, language, encoding, sample_rate):
+        assert encoding == "LINEAR16"
+        samples = np.frombuffer(audio, dtype='<i2').astype(np.float32) / 32768
+        self.calls.append(len(samples) / sample_rate)
+        frame = sample_rate // 50
+        peaks = np.abs(samples[:len(samples) // frame * frame]).reshape(-1, frame).max(axis=1)
+        words, previous = [], 0.0
+        for peak in np.append(peaks, 0.0):
+            if peak < 0.05 <= previous:
+                words.append(WORDS[int(round(burst * 5))])
+            burst = max(burst, peak) if previous >= 0.05 else peak
+            previous = peak
+        return VoiceResponse(transcript=" ".join(words), confidence=0.9, language=language)
+
+async def chunks(audio, size=9600):
+    for start in range(0, len(audio), size):
+        await asyncio.sleep(0.01)
+        yield audio[start:start + size]
+
+@pytest.fixture
+def preprocessor(monkeypatch):
+    monkeypatch.setenv('AUDIO_UPLOAD_ENCODING', 'LINEAR16')
+    return AudioPreprocessor()
+
+async def _collect(recognizer, audio, encoding="LINEAR16"):
+    return [event async for event in recognizer.stream(chunks(audio), "en-IN", encoding, RATE)]
+
+def test_local_recognizer_reveals_words_then_sends_the_final_transcript():
+    recognizer = LocalRecognizer(transcript="my wheat leaves are yellow", bytes_per_word=9600)
+    events = asyncio.run(_collect(recognizer, bytes(9600 * 3)))
+
+    assert [(event.transcript, event.is_final) for event in events] == [
+        ("my", False), ("my wheat", False), ("my wheat leaves", False), ("my wheat leaves are yellow", True)
+    ]
+
+def test_chunked_recognizer_sends_interims_then_the_whole_final_transcript(preprocessor):
+    voice_service = ToneVoiceService()
+    recognizer = ChunkedRecognizer(voice_service, interval=0.05, preprocessor=preprocessor)
+    events = asyncio.run(_collect(recognizer, utterances_wav([1, 2, 3])))
+
+    interims, final = events[:-1], events[-1]
+    assert final.is_final and final.transcript == "one two three"
+    assert interims and not any(event.is_final for event in interims)
+    for event in interims:
+        assert "one two three".startswith(event.transcript)
+    # Each utterance is recognised once when it settles; everything else is a short in-progress tail
+    assert max(voice_service.calls) < 1.5
+
+def test_chunked_recognizer_only_revisits_unsettled_audio(preprocessor):
+    windows = []
+    settle = preprocessor.settle
+
+    async def spy(decoder, final=False):
+        windows.append(len(decoder.window()["samples"]) / 16000)
+        return await settle(decoder, final)
+
+    preprocessor.settle = spy
+    levels = [1, 2, 3] * 6
+    recognizer = ChunkedRecognizer(ToneVoiceService(), interval=0.05, preprocessor=preprocessor)
+    events = asyncio.run(_collect(recognizer, utterances_wav(levels)))
+
+    assert events[-1].transcript == " ".join(WORDS[level] for level in levels)
+    # A 29 s recording, but never more than about one utterance and its pause is settled at a time
+    assert len(windows) > 10
+    assert max(windows) < 3
+    assert preprocessor.get_stats()["undecodable_streams"] == 0